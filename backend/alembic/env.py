@@ -11,7 +11,7 @@ from alembic import context
 
 from app.core.config import settings
 from app.core.database import Base
-from app.models import File, AuditLog  # Import all models
+from app.models import File, AuditLog, Blob, Bundle, InlineObject  # Import all models
 
 # Alembic Config object
 config = context.config
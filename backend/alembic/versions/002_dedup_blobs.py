@@ -0,0 +1,59 @@
+"""Deduplicated blob storage
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-19 10:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision: str = '002'
+down_revision: Union[str, None] = '001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create blobs table and link files to shared blobs"""
+
+    op.create_table(
+        'blobs',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('content_hash', sa.String(64), nullable=False, unique=True),
+        sa.Column('storage_key', sa.String(255), nullable=False, unique=True),
+        sa.Column('encryption_metadata', postgresql.JSON(), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_blobs_content_hash', 'blobs', ['content_hash'])
+
+    # Deduplicated files share their blob's storage key
+    op.drop_constraint('files_storage_key_key', 'files', type_='unique')
+    op.create_index('ix_files_storage_key', 'files', ['storage_key'])
+
+    op.add_column('files', sa.Column('blob_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_index('ix_files_blob_id', 'files', ['blob_id'])
+    op.create_foreign_key(
+        'fk_files_blob_id',
+        'files',
+        'blobs',
+        ['blob_id'],
+        ['id'],
+        ondelete='SET NULL'
+    )
+
+
+def downgrade() -> None:
+    """Drop blobs table"""
+    op.drop_constraint('fk_files_blob_id', 'files', type_='foreignkey')
+    op.drop_index('ix_files_blob_id', 'files')
+    op.drop_column('files', 'blob_id')
+    op.drop_index('ix_files_storage_key', 'files')
+    op.create_unique_constraint('files_storage_key_key', 'files', ['storage_key'])
+    op.drop_table('blobs')
@@ -0,0 +1,54 @@
+"""Bundle shares
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-19 14:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers
+revision: str = '003'
+down_revision: Union[str, None] = '002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create bundles table and link files to their bundle"""
+
+    op.create_table(
+        'bundles',
+        sa.Column('id', postgresql.UUID(as_uuid=True), primary_key=True),
+        sa.Column('token_hash', sa.String(64), nullable=False, unique=True),
+        sa.Column('file_count', sa.Integer(), nullable=False),
+        sa.Column('ip_hash', sa.String(64), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.Column('downloaded_at', sa.DateTime(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+    op.create_index('ix_bundles_token_hash', 'bundles', ['token_hash'])
+    op.create_index('ix_bundles_ip_hash', 'bundles', ['ip_hash'])
+    op.create_index('ix_bundles_expires_at', 'bundles', ['expires_at'])
+
+    op.add_column('files', sa.Column('bundle_id', postgresql.UUID(as_uuid=True), nullable=True))
+    op.create_index('ix_files_bundle_id', 'files', ['bundle_id'])
+    op.create_foreign_key(
+        'fk_files_bundle_id',
+        'files',
+        'bundles',
+        ['bundle_id'],
+        ['id'],
+        ondelete='CASCADE'
+    )
+
+
+def downgrade() -> None:
+    """Drop bundles table"""
+    op.drop_constraint('fk_files_bundle_id', 'files', type_='foreignkey')
+    op.drop_index('ix_files_bundle_id', 'files')
+    op.drop_column('files', 'bundle_id')
+    op.drop_table('bundles')
@@ -0,0 +1,35 @@
+"""Inline storage of small ciphertexts
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-19 18:00:00
+
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers
+revision: str = '004'
+down_revision: Union[str, None] = '003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create inline_objects table"""
+
+    op.create_table(
+        'inline_objects',
+        sa.Column('storage_key', sa.String(255), primary_key=True),
+        sa.Column('data', sa.LargeBinary(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    )
+
+    # Ciphertext doesn't compress: store out of line without trying to
+    op.execute('ALTER TABLE inline_objects ALTER COLUMN data SET STORAGE EXTERNAL')
+
+
+def downgrade() -> None:
+    """Drop inline_objects table"""
+    op.drop_table('inline_objects')
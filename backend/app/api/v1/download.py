@@ -2,22 +2,35 @@
 File Download Endpoint
 Handles secure one-time file download with atomic deletion
 """
+import itertools
 import os
+from contextlib import ExitStack
 from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional
 
 from fastapi import APIRouter, HTTPException, Depends, Request
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-import io
+from starlette.background import BackgroundTask
 
+from app.core.admission import admission_controller, release_after
 from app.core.config import settings
 from app.core.database import get_db
+from app.core.timing import get_stage_timer
 from app.models.file import File as FileModel
 from app.models.audit_log import AuditLog
+from app.models.bundle import Bundle
 from app.schemas.file import FileInfoResponse
 from app.services.token_service import TokenService
+from app.services.cache import info_cache
+from app.services.token_filter import token_filter
+from app.services.dedup import dedup_service
+from app.services.compression import compression_service
 from app.services.encryption import encryption_service
 from app.services.storage import storage_service
+from app.services.inline_storage import inline_storage
+from app.services.prefetch import Prefetched, prefetch_cache
+from app.services.zip_stream import COMPRESSION_METHODS, stream_zip
 
 router = APIRouter()
 
@@ -39,6 +52,12 @@ async def get_file_info(
     """
     Get file metadata without downloading
 
+    Available files and unknown tokens are served from a short-TTL cache;
+    only cache misses reach the database and record an info_view event.
+    A lookup that reaches the database also starts prefetching the file's
+    leading ciphertext segments (PREFETCH_ENABLED) for the download that
+    usually follows.
+
     Args:
         token: Download token
         request: FastAPI request object
@@ -54,10 +73,22 @@ async def get_file_info(
     # Hash token to find file
     token_hash = token_service.hash_token(token)
 
+    # Reject definitely-unknown tokens without touching cache or database
+    if not token_filter.might_contain(token_hash):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    # Serve repeated lookups from cache
+    cache_hit, cached_info = info_cache.get(token_hash)
+    if cache_hit:
+        if cached_info is None:
+            raise HTTPException(status_code=404, detail="File not found")
+        return cached_info
+
     # Query file from database
     file_record = db.query(FileModel).filter(FileModel.token_hash == token_hash).first()
 
     if not file_record:
+        info_cache.set_missing(token_hash)
         raise HTTPException(status_code=404, detail="File not found")
 
     # Check if file is available
@@ -84,7 +115,7 @@ async def get_file_info(
     db.add(audit_log)
     db.commit()
 
-    return FileInfoResponse(
+    file_info = FileInfoResponse(
         filename=file_record.filename,
         file_size=file_record.file_size,
         mime_type=file_record.mime_type,
@@ -93,6 +124,187 @@ async def get_file_info(
         is_available=file_record.is_available,
         antivirus_status=file_record.antivirus_status,
     )
+    info_cache.set(token_hash, file_info)
+    prefetch_cache.schedule(file_record.storage_key, file_record.encryption_metadata)
+
+    return file_info
+
+
+def _member_names(records: List[FileModel]) -> List[str]:
+    """Unique, path-free archive names for bundle members"""
+    names: List[str] = []
+    seen = set()
+    for record in records:
+        base = os.path.basename(record.filename.replace("\\", "/")) or "file"
+        stem, ext = os.path.splitext(base)
+        name, n = base, 1
+        while name in seen:
+            name = f"{stem} ({n}){ext}"
+            n += 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+
+def _local_decrypt_stream(local_file: BinaryIO, metadata: Dict[str, str]) -> Iterator[bytes]:
+    """Decrypt a file read straight from local disk, closing it when done"""
+    with local_file:
+        yield from encryption_service.decrypt_fileobj(local_file, metadata)
+
+
+def _prefetched_stream(
+    storage_key: str, prefetched: Prefetched, metadata: Dict[str, str]
+) -> Iterator[bytes]:
+    """Decrypt a prefetched ciphertext prefix, then the rest of the object as it arrives"""
+    chunks = [prefetched.data]
+    if not prefetched.complete:
+        chunks = itertools.chain(
+            chunks, storage_service.download_stream(storage_key, offset=len(prefetched.data))
+        )
+    yield from encryption_service.decrypt_stream(chunks, metadata)
+
+
+def _delete_objects(storage_keys: List[str]) -> BackgroundTask:
+    """
+    Response background task deleting claimed objects
+
+    Starlette runs it once the body is sent, or the client has gone, even
+    if the body never started streaming: a generator's finally would not
+    run then, leaving the one-time ciphertext in storage.
+    """
+    def delete() -> None:
+        for storage_key in storage_keys:
+            storage_service.delete_file(storage_key)
+
+    return BackgroundTask(delete)
+
+
+def _plaintext_stream(record: FileModel, ciphertext: Optional[bytes] = None) -> Iterator[bytes]:
+    """Fetch (unless given, e.g. inline), decrypt and decompress a stored file chunk by chunk"""
+    metadata = record.encryption_metadata
+    local_file = None if ciphertext is not None else storage_service.open_local(record.storage_key)
+    if ciphertext is not None:
+        plaintext = encryption_service.decrypt_stream([ciphertext], metadata)
+    elif local_file is not None:
+        plaintext = _local_decrypt_stream(local_file, metadata)
+    else:
+        chunks = storage_service.download_stream(record.storage_key)
+        plaintext = encryption_service.decrypt_stream(chunks, metadata)
+    yield from compression_service.decompress_stream(plaintext, metadata.get("compression", "none"))
+
+
+@router.get("/bundle/{token}")
+async def download_bundle(
+    token: str,
+    request: Request,
+    compression: str = "store",
+    db: Session = Depends(get_db),
+):
+    """
+    Download every file of a bundle as one ZIP archive (one-time use)
+
+    The bundle and all its files are claimed in one transaction before
+    streaming. The archive is built on the fly from the streaming
+    decryption of each member, so memory use does not grow with file size.
+
+    Args:
+        token: Bundle download token
+        request: FastAPI request object
+        compression: ZIP member compression, "store" or "deflate"
+        db: Database session
+
+    Returns:
+        StreamingResponse with the ZIP archive
+
+    Raises:
+        HTTPException: 400 for unknown compression, 404 if not found,
+            410 if expired/downloaded
+    """
+
+    if compression not in COMPRESSION_METHODS:
+        raise HTTPException(status_code=400, detail="Compression must be store or deflate")
+
+    token_hash = token_service.hash_token(token)
+
+    query = db.query(Bundle).filter(Bundle.token_hash == token_hash)
+    if not _is_test_mode():
+        query = query.with_for_update()
+    bundle = query.first()
+
+    if not bundle:
+        raise HTTPException(status_code=404, detail="Bundle not found")
+
+    if not bundle.is_available:
+        if bundle.downloaded_at is not None:
+            detail = "Bundle has already been downloaded (one-time use)"
+        else:
+            detail = "Bundle has expired"
+        raise HTTPException(status_code=410, detail=detail)
+
+    query = (
+        db.query(FileModel)
+        .filter(FileModel.bundle_id == bundle.id)
+        .order_by(FileModel.uploaded_at, FileModel.filename)
+    )
+    if not _is_test_mode():
+        query = query.with_for_update()
+    records = query.all()
+
+    # Claim the bundle and all its files in one transaction
+    # (inline objects are read, and deleted when unshared, in it too)
+    now = datetime.utcnow()
+    bundle.downloaded_at = now
+    storage_keys_to_delete = []
+    ciphertexts: Dict[str, bytes] = {}
+    for record in records:
+        record.downloaded_at = now
+        storage_key = dedup_service.release(db, record)
+        if inline_storage.is_inline(record.encryption_metadata):
+            ciphertexts[record.storage_key] = inline_storage.take(
+                db, record.storage_key, delete=storage_key is not None
+            )
+        elif storage_key:
+            storage_keys_to_delete.append(storage_key)
+
+    ip_hash = token_service.hash_ip(request.client.host)
+    db.add(AuditLog(
+        event_type="bundle_download",
+        ip_hash=ip_hash,
+        event_metadata={
+            "bundle_id": str(bundle.id),
+            "file_count": len(records),
+            "total_size": sum(record.file_size for record in records),
+            "compression": compression,
+        },
+    ))
+    db.commit()
+
+    members = [
+        (
+            name,
+            record.file_size,
+            record.uploaded_at,
+            _plaintext_stream(record, ciphertexts.get(record.storage_key)),
+        )
+        for name, record in zip(_member_names(records), records)
+    ]
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="bundle-{str(bundle.id)[:8]}.zip"',
+        # Security headers
+        "X-Content-Type-Options": "nosniff",
+        "X-Frame-Options": "DENY",
+        "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+        "Pragma": "no-cache",
+    }
+
+    # Claimed files are deleted once the archive is sent or the client has gone
+    return StreamingResponse(
+        stream_zip(members, compression),
+        media_type="application/zip",
+        headers=headers,
+        background=_delete_objects(storage_keys_to_delete),
+    )
 
 
 @router.get("/{token}")
@@ -108,9 +320,9 @@ async def download_file(
     1. Validate token and find file
     2. Check file availability (not expired, not downloaded)
     3. Mark as downloaded BEFORE streaming (atomic operation)
-    4. Retrieve encrypted file from MinIO
+    4. Retrieve encrypted file from MinIO (inline objects: read in step 3)
     5. Decrypt file
-    6. Stream to client
+    6. Stream to client (decompressing if needed)
     7. Delete from storage after successful download
     8. Log audit event
 
@@ -123,18 +335,26 @@ async def download_file(
         StreamingResponse with decrypted file
 
     Raises:
-        HTTPException: 404 if not found, 410 if expired/downloaded
+        HTTPException: 404 if not found, 410 if expired/downloaded, 503 if
+            the worker's memory budget stays exhausted
     """
 
+    timer = get_stage_timer(request)
+
     # Step 1: Hash token to find file
     token_hash = token_service.hash_token(token)
 
+    # Reject definitely-unknown tokens before opening a locking transaction
+    if not token_filter.might_contain(token_hash):
+        raise HTTPException(status_code=404, detail="File not found")
+
     # Query file from database with row-level locking (FOR UPDATE)
     # Note: SQLite doesn't support FOR UPDATE, so skip in test mode
     query = db.query(FileModel).filter(FileModel.token_hash == token_hash)
     if not _is_test_mode():
         query = query.with_for_update()
-    file_record = query.first()
+    with timer.stage("db"):
+        file_record = query.first()
 
     if not file_record:
         raise HTTPException(status_code=404, detail="File not found")
@@ -150,31 +370,95 @@ async def download_file(
 
         raise HTTPException(status_code=410, detail=detail)
 
-    # Step 3: Mark as downloaded ATOMICALLY (prevents concurrent downloads)
-    file_record.downloaded_at = datetime.utcnow()
-    db.commit()
+    # Reserve the storage call before the token is consumed, so a saturated
+    # or failing storage returns a 503 that leaves the file downloadable;
+    # held until the fetch, which can then no longer be rejected
+    metadata = file_record.encryption_metadata
+    inline = inline_storage.is_inline(metadata)
+    slot = None if inline else storage_service.reserve()
 
     try:
-        # Step 4: Retrieve encrypted file from MinIO
-        try:
-            encrypted_content = storage_service.download_file(file_record.storage_key)
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Storage retrieval failed: {str(e)}"
-            )
+        # Reserve worker memory too; released once the body is streamed
+        reservation = await admission_controller.acquire(
+            int(file_record.file_size * settings.ADMISSION_DOWNLOAD_MEMORY_FACTOR)
+        )
+    except Exception:
+        if slot is not None:
+            slot.release()
+        raise
 
-        # Step 5: Decrypt file
-        try:
-            decrypted_content = encryption_service.decrypt_file(
-                encrypted_content,
-                file_record.encryption_metadata
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Decryption failed: {str(e)}"
-            )
+    try:
+        # Step 3: Mark as downloaded ATOMICALLY (prevents concurrent downloads)
+        # Shared blobs lose a reference in the same transaction; only the last
+        # reference returns a storage key to delete. Inline objects are read
+        # (and deleted, if unshared) in this transaction: no storage round trip
+        with timer.stage("db"):
+            file_record.downloaded_at = datetime.utcnow()
+            storage_key_to_delete = dedup_service.release(db, file_record)
+            if inline:
+                encrypted_content = inline_storage.take(
+                    db, file_record.storage_key, delete=storage_key_to_delete is not None
+                )
+                storage_key_to_delete = None
+            db.commit()
+    except Exception:
+        reservation.release()
+        if slot is not None:
+            slot.release()
+        raise
+    info_cache.mark_claimed(token_hash)
+    # The claim evicts the prefetched prefix (if any) whether or not it is used
+    prefetched = None
+    if prefetch_cache.enabled and not inline:
+        prefetched = prefetch_cache.pop(file_record.storage_key)
+
+    try:
+        with ExitStack() as buffers:
+            # Step 4: Retrieve encrypted file (prefetched or local disk: stream it;
+            # otherwise download into a pooled buffer, released after decryption)
+            try:
+                with timer.stage("fetch"):
+                    local_file = None
+                    fetched = inline or prefetched is not None
+                    if not fetched and metadata.get("format") == "segmented":
+                        local_file = storage_service.open_local(file_record.storage_key)
+                    if local_file is None and not fetched:
+                        encrypted_content = buffers.enter_context(
+                            storage_service.download_buffer(file_record.storage_key, slot=slot)
+                        )
+            except Exception as e:
+                # The token is consumed: not a retryable 503
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Storage retrieval failed: {str(e)}"
+                )
+            finally:
+                # Unused when the object was prefetched or read from local disk
+                if slot is not None:
+                    slot.release()
+
+            # Step 5: Decrypt file (payload may still be compressed)
+            # Local files are decrypted segment by segment while streaming; the
+            # open file stays readable after the object is deleted in step 7
+            background = None
+            if prefetched is not None:
+                # Starts with the cached segments; the rest is still read from
+                # storage, so the object is deleted after the response
+                payload = _prefetched_stream(file_record.storage_key, prefetched, metadata)
+                if storage_key_to_delete:
+                    background = _delete_objects([storage_key_to_delete])
+                storage_key_to_delete = None
+            elif local_file is not None:
+                payload = _local_decrypt_stream(local_file, metadata)
+            else:
+                try:
+                    with timer.stage("decrypt"):
+                        payload = [encryption_service.decrypt_file(encrypted_content, metadata)]
+                except Exception as e:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Decryption failed: {str(e)}"
+                    )
 
         # Step 6: Log successful download
         ip_hash = token_service.hash_ip(request.client.host)
@@ -193,7 +477,9 @@ async def download_file(
         # Step 7: Delete from storage (async, after streaming starts)
         # Note: In production, this should be a background task
         try:
-            storage_service.delete_file(file_record.storage_key)
+            if storage_key_to_delete:
+                with timer.stage("delete"):
+                    storage_service.delete_file(storage_key_to_delete)
         except Exception as e:
             # Log deletion failure but don't block download
             error_log = AuditLog(
@@ -208,28 +494,38 @@ async def download_file(
             db.add(error_log)
             db.commit()
 
-        # Step 8: Stream file to client
-        file_stream = io.BytesIO(decrypted_content)
+        # Step 8: Stream file to client (decompressing on the fly)
+        file_stream = compression_service.decompress_stream(
+            payload,
+            metadata.get("compression", "none"),
+        )
+
+        headers = {
+            "Content-Disposition": f'attachment; filename="{file_record.filename}"',
+            "Content-Length": str(file_record.file_size),
+            # Security headers
+            "X-Content-Type-Options": "nosniff",
+            "X-Frame-Options": "DENY",
+            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+            "Pragma": "no-cache",
+        }
+        if settings.SERVER_TIMING_ENABLED:
+            headers["Server-Timing"] = timer.server_timing()
 
         return StreamingResponse(
-            file_stream,
+            release_after(file_stream, reservation),
             media_type=file_record.mime_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{file_record.filename}"',
-                "Content-Length": str(file_record.file_size),
-                # Security headers
-                "X-Content-Type-Options": "nosniff",
-                "X-Frame-Options": "DENY",
-                "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-                "Pragma": "no-cache",
-            },
+            headers=headers,
+            background=background,
         )
 
     except HTTPException:
         # Re-raise HTTP exceptions
+        reservation.release()
         raise
     except Exception as e:
         # Log unexpected errors
+        reservation.release()
         ip_hash = token_service.hash_ip(request.client.host)
         error_log = AuditLog(
             event_type="error",
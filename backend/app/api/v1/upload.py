@@ -2,22 +2,52 @@
 File Upload Endpoint
 Handles secure file upload with antivirus scan, encryption, and storage
 """
+import asyncio
+import threading
+import time
 import uuid
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Request
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from sqlalchemy.orm import Session
 
+from app.core.admission import admission_controller, estimate_upload_bytes
+from app.core.buffer_pool import buffer_pool
 from app.core.config import settings
+from app.core.limiter import LimitExceeded
 from app.core.database import get_db
+from app.core.metrics import MIME_BLOCKED, UPLOAD_DURATION_SECONDS
+from app.core.scheduler import scheduler
+from app.core.timing import StageTimer, get_stage_timer
 from app.models.file import File as FileModel
 from app.models.audit_log import AuditLog
-from app.schemas.file import FileUploadResponse
+from app.models.bundle import Bundle
+from app.models.inline_object import InlineObject
+from app.schemas.file import (
+    BatchUploadResponse,
+    BundleMember,
+    BundleUploadResponse,
+    FileUploadResponse,
+)
 from app.services.token_service import TokenService
 from app.services.encryption import encryption_service
 from app.services.storage import storage_service
+from app.services.inline_storage import INLINE, inline_storage
 from app.services.antivirus import antivirus_service
+from app.services.cache import info_cache
+from app.services.token_filter import token_filter
+from app.services.dedup import dedup_service
+from app.services.compression import compression_service
+from app.services.mime_sniffer import SNIFF_SIZE, mime_sniffer
+from app.services.multipart_stream import (
+    FieldLimitExceeded,
+    FilePart,
+    MultipartError,
+    MultipartStream,
+    PartTooLarge,
+    TooManyFiles,
+)
 
 router = APIRouter()
 
@@ -25,10 +55,213 @@ router = APIRouter()
 token_service = TokenService()
 
 
-@router.post("", response_model=FileUploadResponse, status_code=201)
+def _check_size(file_size: int) -> None:
+    """Reject empty and oversized files"""
+    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
+    if file_size > max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE_MB}MB"
+        )
+
+    if file_size == 0:
+        raise HTTPException(status_code=400, detail="Empty file not allowed")
+
+
+async def _receive(
+    request: Request, db: Session, ip_hash: str, field: str, max_files: int, max_total: int
+) -> Tuple[List[FilePart], List[str]]:
+    """
+    Stream the multipart body into memory
+
+    Each file's type is detected from its first bytes as soon as they
+    arrive; a disallowed type (or size) is rejected before the rest of the
+    body is read. Nothing is spooled to disk.
+
+    Returns:
+        Tuple[List[FilePart], List[str]]: (file parts, detected MIME types)
+
+    Raises:
+        HTTPException: 413 for too large or too many files, 415 for
+            disallowed type, 422 for a malformed body
+    """
+    mime_types: List[str] = []
+
+    def check_head(part: FilePart, head: bytes) -> None:
+        mime_type = mime_sniffer.detect(head, part.content_type)
+        if head and not mime_sniffer.is_allowed(mime_type):
+            _reject_mime(db, ip_hash, part.filename, mime_type, part.content_type)
+        mime_types.append(mime_type)
+
+    try:
+        parser = MultipartStream(
+            request.headers.get("content-type", ""),
+            max_file_size=settings.MAX_FILE_SIZE_MB * 1024 * 1024,
+            max_total_size=max_total,
+            max_files=max_files,
+        )
+        files, _ = await parser.parse(request.stream(), SNIFF_SIZE, check_head)
+    except PartTooLarge as e:
+        if e.total:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large. Maximum size: {settings.BATCH_UPLOAD_MAX_TOTAL_MB}MB"
+            )
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE_MB}MB"
+        )
+    except TooManyFiles:
+        raise HTTPException(status_code=413, detail=f"Too many files. Maximum: {max_files}")
+    except FieldLimitExceeded as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except MultipartError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    if not files or any(part.name != field for part in files):
+        raise HTTPException(status_code=422, detail=f'Expected file field "{field}"')
+    for part in files:
+        if not part.filename:
+            raise HTTPException(status_code=400, detail="Filename is required")
+    return files, mime_types
+
+
+async def _admit_upload(request: Request) -> AsyncIterator[None]:
+    """Reserve worker memory for an upload before its body is read"""
+    estimate = estimate_upload_bytes(request, settings.MAX_FILE_SIZE_MB * 1024 * 1024)
+    async with admission_controller.reserve(estimate):
+        yield
+
+
+async def _admit_batch(request: Request) -> AsyncIterator[None]:
+    """Reserve worker memory for a batch upload before its body is read"""
+    estimate = estimate_upload_bytes(request, settings.BATCH_UPLOAD_MAX_TOTAL_MB * 1024 * 1024)
+    async with admission_controller.reserve(estimate):
+        yield
+
+
+def _form_schema(field: str, multiple: bool) -> Dict:
+    """OpenAPI request body for routes that parse multipart themselves"""
+    binary = {"type": "string", "format": "binary"}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": [field],
+        "properties": {field: {"type": "array", "items": binary} if multiple else binary},
+    }}}}}
+
+
+def _reject_mime(
+    db: Session, ip_hash: str, filename: str, mime_type: str, declared: Optional[str]
+) -> None:
+    """Log a blocked file type and reject the upload"""
+    MIME_BLOCKED.labels(mime_type=mime_type).inc()
+    audit_log = AuditLog(
+        event_type="mime_blocked",
+        ip_hash=ip_hash,
+        event_metadata={
+            "filename": filename,
+            "mime_type": mime_type,
+            "declared_mime_type": declared,
+        },
+    )
+    db.add(audit_log)
+    db.commit()
+
+    raise HTTPException(
+        status_code=415,
+        detail=f"File type not allowed: {mime_type}"
+    )
+
+
+def _reject_malware(
+    db: Session, ip_hash: str, filename: str, scan_result: str, file_size: int
+) -> None:
+    """Log a malware detection and reject the upload"""
+    audit_log = AuditLog(
+        event_type="malware_detected",
+        ip_hash=ip_hash,
+        event_metadata={
+            "filename": filename,
+            "scan_result": scan_result,
+            "file_size": file_size,
+        },
+    )
+    db.add(audit_log)
+    db.commit()
+
+    raise HTTPException(
+        status_code=422,
+        detail=f"File rejected: {scan_result}"
+    )
+
+
+def _encrypt_and_store(
+    data: bytes,
+    storage_key: str,
+    mime_type: str,
+    timer: StageTimer,
+    add_inline: Optional[Callable[[InlineObject], None]] = None,
+) -> Tuple[Dict[str, str], int]:
+    """
+    Compress (when worthwhile), encrypt and store file content
+
+    Args:
+        add_inline: Adds a row to the caller's transaction; when given,
+            small ciphertexts are stored inline instead of in MinIO
+
+    Returns:
+        Tuple[Dict, int]: (encryption_metadata, ciphertext_size)
+    """
+    with timer.stage("compress"):
+        payload, compression = compression_service.compress(data, mime_type)
+
+    # Ciphertext goes to a pooled buffer, released once stored
+    ciphertext_size = encryption_service.ciphertext_size(len(payload))
+    with buffer_pool.acquire(ciphertext_size) as encrypted_content:
+        try:
+            with timer.stage("encrypt"):
+                encryption_metadata = encryption_service.encrypt_into(payload, encrypted_content)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Encryption failed: {str(e)}"
+            )
+        encryption_metadata["compression"] = compression
+
+        if add_inline is not None and inline_storage.accepts(ciphertext_size):
+            with timer.stage("store"):
+                add_inline(inline_storage.put(storage_key, encrypted_content))
+            encryption_metadata["storage"] = INLINE
+            return encryption_metadata, ciphertext_size
+
+        try:
+            with timer.stage("store"):
+                stored = storage_service.upload_file(
+                    object_name=storage_key,
+                    data=encrypted_content,
+                    content_type="application/octet-stream",
+                )
+        except LimitExceeded:
+            raise
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Storage failed: {str(e)}"
+            )
+    if not stored:
+        raise HTTPException(status_code=500, detail="Storage failed")
+
+    return encryption_metadata, ciphertext_size
+
+
+@router.post(
+    "", response_model=FileUploadResponse, status_code=201,
+    dependencies=[Depends(_admit_upload)],
+    openapi_extra=_form_schema("file", multiple=False),
+)
 async def upload_file(
     request: Request,
-    file: UploadFile = File(...),
+    response: Response,
     ttl_hours: Optional[int] = None,
     db: Session = Depends(get_db),
 ):
@@ -36,17 +269,18 @@ async def upload_file(
     Upload a file securely
 
     Steps:
-    1. Validate file size and type
+    1. Validate file size and type (detected from magic bytes)
     2. Scan for malware with ClamAV
-    3. Encrypt file with AES-256-GCM
-    4. Store in MinIO
+    3. Compress (when worthwhile) and encrypt file (AEAD cipher suite, AES-256-GCM by default)
+    4. Store in MinIO (small ciphertexts inline in Postgres)
     5. Generate secure token
     6. Save metadata to database
     7. Log audit event
 
     Args:
-        request: FastAPI request object (for IP tracking)
-        file: Uploaded file
+        request: FastAPI request object (for IP tracking; the multipart
+            body, with a "file" part, is streamed from it)
+        response: Response (for the Server-Timing header)
         ttl_hours: Time-to-live in hours (default: 24)
         db: Database session
 
@@ -54,76 +288,65 @@ async def upload_file(
         FileUploadResponse with download URL and token
 
     Raises:
-        HTTPException: 400 for invalid file, 413 for too large, 422 for malware
+        HTTPException: 400 for invalid file, 413 for too large, 415 for
+            disallowed type, 422 for malware, 503 if the worker's memory
+            budget stays exhausted
     """
 
-    # Step 1: Validate file
-    if not file.filename:
-        raise HTTPException(status_code=400, detail="Filename is required")
+    timer = get_stage_timer(request)
+    started = time.perf_counter()
+    # Scan and crypto run in the pool of the upload's size class
+    size_class = scheduler.classify_request(request)
+    pool = scheduler.pool(size_class)
 
-    # Read file content
-    file_content = await file.read()
+    # Step 1: Receive the file, checking its real type as it arrives
+    ip_hash = token_service.hash_ip(request.client.host)
+    with timer.stage("read"):
+        files, mime_types = await _receive(
+            request, db, ip_hash, "file", max_files=1,
+            max_total=settings.MAX_FILE_SIZE_MB * 1024 * 1024,
+        )
+    file, mime_type = files[0], mime_types[0]
+    file_content = file.data
     file_size = len(file_content)
 
     # Check file size limit
-    max_size = settings.MAX_FILE_SIZE_MB * 1024 * 1024
-    if file_size > max_size:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size: {settings.MAX_FILE_SIZE_MB}MB"
-        )
-
-    if file_size == 0:
-        raise HTTPException(status_code=400, detail="Empty file not allowed")
+    _check_size(file_size)
 
     # Step 2: Scan for malware
-    is_clean, scan_result = antivirus_service.scan_file(file_content)
+    with timer.stage("scan"):
+        is_clean, scan_result = await pool.run(antivirus_service.scan_file, file_content)
 
     if not is_clean:
         # Log malware detection
-        ip_hash = token_service.hash_ip(request.client.host)
-        audit_log = AuditLog(
-            event_type="malware_detected",
-            ip_hash=ip_hash,
-            event_metadata={
-                "filename": file.filename,
-                "scan_result": scan_result,
-                "file_size": file_size,
-            },
-        )
-        db.add(audit_log)
-        db.commit()
-
-        raise HTTPException(
-            status_code=422,
-            detail=f"File rejected: {scan_result}"
-        )
-
-    # Step 3: Encrypt file
-    try:
-        encrypted_content, encryption_metadata = encryption_service.encrypt_file(file_content)
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Encryption failed: {str(e)}"
-        )
+        _reject_malware(db, ip_hash, file.filename, scan_result, file_size)
 
-    # Step 4: Generate unique storage key
+    # Step 3-5: Compress, encrypt and store in MinIO (or inline when small)
+    # (deduplicated mode reuses shared blobs)
     file_id = uuid.uuid4()
-    storage_key = f"{file_id}.enc"
+    blob_id = None
+    stored_keys: List[str] = []
 
-    # Step 5: Store in MinIO
-    try:
-        storage_service.upload_file(
-            object_name=storage_key,
-            data=encrypted_content,
-            content_type="application/octet-stream",
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Storage failed: {str(e)}"
+    def store(data: bytes, storage_key: str) -> Tuple[Dict[str, str], int]:
+        result = _encrypt_and_store(data, storage_key, mime_type, timer, db.add)
+        if not inline_storage.is_inline(result[0]):
+            stored_keys.append(storage_key)
+        return result
+
+    if settings.DEDUP_ENABLED:
+        blob = await pool.run(
+            dedup_service.acquire,
+            db,
+            file_content,
+            dedup_service.scope_for(ip_hash),
+            store,
         )
+        blob_id = blob.id
+        storage_key = blob.storage_key
+        encryption_metadata = blob.encryption_metadata
+    else:
+        storage_key = f"{file_id}.enc"
+        encryption_metadata, _ = await pool.run(store, file_content, storage_key)
 
     # Step 6: Generate secure token
     download_token, token_hash = token_service.generate_token()
@@ -133,41 +356,55 @@ async def upload_file(
     expires_at = datetime.utcnow() + timedelta(hours=ttl)
 
     # Step 7: Save file metadata to database
-    ip_hash = token_service.hash_ip(request.client.host)
-
     file_record = FileModel(
         id=file_id,
         token_hash=token_hash,
         filename=file.filename,
         file_size=file_size,
-        mime_type=file.content_type or "application/octet-stream",
+        mime_type=mime_type,
         storage_key=storage_key,
+        blob_id=blob_id,
         encryption_metadata=encryption_metadata,
         expires_at=expires_at,
         ip_hash=ip_hash,
         antivirus_status="clean",
     )
 
-    db.add(file_record)
-    db.flush()  # Flush to ensure file_id exists before adding audit log
+    try:
+        with timer.stage("db"):
+            db.add(file_record)
+            db.flush()  # Flush to ensure file_id exists before adding audit log
 
-    # Step 8: Log audit event
-    audit_log = AuditLog(
-        event_type="upload",
-        file_id=file_id,
-        ip_hash=ip_hash,
-        event_metadata={
-            "filename": file.filename,
-            "file_size": file_size,
-            "mime_type": file.content_type,
-            "ttl_hours": ttl,
-        },
-    )
-    db.add(audit_log)
+            # Step 8: Log audit event
+            audit_log = AuditLog(
+                event_type="upload",
+                file_id=file_id,
+                ip_hash=ip_hash,
+                event_metadata={
+                    "filename": file.filename,
+                    "file_size": file_size,
+                    "mime_type": mime_type,
+                    "declared_mime_type": file.content_type,
+                    "ttl_hours": ttl,
+                },
+            )
+            db.add(audit_log)
 
-    # Commit transaction
-    db.commit()
-    db.refresh(file_record)
+            # Commit transaction
+            db.commit()
+            db.refresh(file_record)
+    except Exception:
+        # Don't leave the stored object behind without a row
+        db.rollback()
+        for storage_key in stored_keys:
+            storage_service.delete_file(storage_key)
+        raise
+    info_cache.invalidate(token_hash)
+    token_filter.add(token_hash)
+
+    UPLOAD_DURATION_SECONDS.labels(size_class=size_class).observe(time.perf_counter() - started)
+    if settings.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timer.server_timing()
 
     # Step 9: Generate download URL
     download_url = f"{settings.API_BASE_URL}/api/v1/download/{download_token}"
@@ -179,5 +416,232 @@ async def upload_file(
         expires_at=expires_at,
         filename=file.filename,
         file_size=file_size,
-        mime_type=file.content_type or "application/octet-stream",
+        mime_type=mime_type,
+    )
+
+
+@router.post(
+    "/batch", response_model=BatchUploadResponse, status_code=201,
+    dependencies=[Depends(_admit_batch)],
+    openapi_extra=_form_schema("files", multiple=True),
+)
+async def upload_batch(
+    request: Request,
+    response: Response,
+    ttl_hours: Optional[int] = None,
+    bundle: bool = False,
+    db: Session = Depends(get_db),
+):
+    """
+    Upload several files in one request
+
+    Files are scanned, then compressed/encrypted/stored in parallel (at most
+    BATCH_UPLOAD_CONCURRENCY at a time). All files and audit rows are saved
+    in a single transaction: the batch is accepted or rejected as a whole.
+
+    Args:
+        request: FastAPI request object (for IP tracking; the multipart
+            body, with "files" parts, is streamed from it)
+        response: Response (for the Server-Timing header)
+        ttl_hours: Time-to-live in hours (default: 24)
+        bundle: Return one token for all files instead of one per file
+        db: Database session
+
+    Returns:
+        BatchUploadResponse with per-file tokens, or a bundle token
+
+    Raises:
+        HTTPException: 400 for invalid file, 413 for too large batch or
+            file, 415 for disallowed type, 422 if any file contains malware
+    """
+
+    timer = get_stage_timer(request)
+
+    # Step 1: Receive and validate files (count, size and type are
+    # checked while the body streams in)
+    ip_hash = token_service.hash_ip(request.client.host)
+    with timer.stage("read"):
+        files, mime_types = await _receive(
+            request, db, ip_hash, "files", max_files=settings.BATCH_UPLOAD_MAX_FILES,
+            max_total=settings.BATCH_UPLOAD_MAX_TOTAL_MB * 1024 * 1024,
+        )
+    contents = [upload.data for upload in files]
+    for content in contents:
+        _check_size(len(content))
+
+    file_ids = [uuid.uuid4() for _ in files]
+    semaphore = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY)
+
+    async def bounded(func, content, *args):
+        # Each file runs in the pool of its own size class
+        async with semaphore:
+            pool = scheduler.pool(scheduler.classify(len(content)))
+            return await pool.run(func, content, *args)
+
+    # Step 2: Scan for malware (any infected file rejects the batch)
+    with timer.stage("scan"):
+        scans = await asyncio.gather(
+            *(bounded(antivirus_service.scan_file, content) for content in contents)
+        )
+
+    for upload, content, (is_clean, scan_result) in zip(files, contents, scans):
+        if not is_clean:
+            _reject_malware(db, ip_hash, upload.filename, scan_result, len(content))
+
+    # Step 3-5: Compress, encrypt and store in MinIO (or inline when small)
+    # (per-file stage timings would overlap; the request timer gets the total)
+    stored_keys: List[str] = []
+    # Files are stored from several threads: inline rows join the session one at a time
+    session_lock = threading.Lock()
+
+    def add_inline(inline_object: InlineObject) -> None:
+        with session_lock:
+            db.add(inline_object)
+
+    def store(data: bytes, storage_key: str, mime_type: str) -> Tuple[Dict[str, str], int]:
+        result = _encrypt_and_store(data, storage_key, mime_type, StageTimer(), add_inline)
+        if not inline_storage.is_inline(result[0]):
+            stored_keys.append(storage_key)
+        return result
+
+    try:
+        with timer.stage("process"):
+            if settings.DEDUP_ENABLED:
+                # Blob lookups use the request's DB session: one file at a
+                # time, each off the event loop in its size class's pool
+                scope = dedup_service.scope_for(ip_hash)
+                stored = []
+                for content, mime_type in zip(contents, mime_types):
+                    pool = scheduler.pool(scheduler.classify(len(content)))
+                    blob = await pool.run(
+                        dedup_service.acquire, db, content, scope,
+                        lambda data, key, mime_type=mime_type: store(data, key, mime_type),
+                    )
+                    stored.append((blob.storage_key, blob.encryption_metadata, blob.id))
+            else:
+                keys = [f"{file_id}.enc" for file_id in file_ids]
+                outcomes = await asyncio.gather(
+                    *(bounded(store, content, key, mime_type)
+                      for content, key, mime_type in zip(contents, keys, mime_types)),
+                    return_exceptions=True,
+                )
+                for outcome in outcomes:
+                    if isinstance(outcome, BaseException):
+                        raise outcome
+                stored = [(key, metadata, None) for key, (metadata, _) in zip(keys, outcomes)]
+    except Exception:
+        db.rollback()
+        for storage_key in stored_keys:
+            storage_service.delete_file(storage_key)
+        raise
+
+    # Step 6: Generate secure tokens
+    ttl = ttl_hours if ttl_hours else settings.DEFAULT_TTL_HOURS
+    expires_at = datetime.utcnow() + timedelta(hours=ttl)
+
+    bundle_record = None
+    if bundle:
+        bundle_token, bundle_token_hash = token_service.generate_token()
+        bundle_record = Bundle(
+            id=uuid.uuid4(),
+            token_hash=bundle_token_hash,
+            file_count=len(files),
+            ip_hash=ip_hash,
+            expires_at=expires_at,
+        )
+
+    # Step 7: Save all file metadata and audit events in one transaction
+    records = []
+    download_tokens = []
+    for upload, content, mime_type, file_id, (storage_key, encryption_metadata, blob_id) in zip(
+        files, contents, mime_types, file_ids, stored
+    ):
+        # Bundle members are only reachable through the bundle token
+        download_token, token_hash = token_service.generate_token()
+        download_tokens.append(download_token)
+        records.append(FileModel(
+            id=file_id,
+            token_hash=token_hash,
+            filename=upload.filename,
+            file_size=len(content),
+            mime_type=mime_type,
+            storage_key=storage_key,
+            blob_id=blob_id,
+            bundle_id=bundle_record.id if bundle_record else None,
+            encryption_metadata=encryption_metadata,
+            expires_at=expires_at,
+            ip_hash=ip_hash,
+            antivirus_status="clean",
+        ))
+
+    try:
+        with timer.stage("db"):
+            if bundle_record:
+                db.add(bundle_record)
+            db.add_all(records)
+            db.flush()
+
+            db.add_all([
+                AuditLog(
+                    event_type="upload",
+                    file_id=record.id,
+                    ip_hash=ip_hash,
+                    event_metadata={
+                        "filename": record.filename,
+                        "file_size": record.file_size,
+                        "mime_type": record.mime_type,
+                        "declared_mime_type": upload.content_type,
+                        "ttl_hours": ttl,
+                        "batch_size": len(records),
+                        "bundle_id": str(bundle_record.id) if bundle_record else None,
+                    },
+                )
+                for record, upload in zip(records, files)
+            ])
+            db.commit()
+    except Exception:
+        db.rollback()
+        for storage_key in stored_keys:
+            storage_service.delete_file(storage_key)
+        raise
+
+    if settings.SERVER_TIMING_ENABLED:
+        response.headers["Server-Timing"] = timer.server_timing()
+
+    if bundle_record:
+        return BatchUploadResponse(
+            bundle=BundleUploadResponse(
+                bundle_id=str(bundle_record.id),
+                download_url=f"{settings.API_BASE_URL}/api/v1/download/bundle/{bundle_token}",
+                download_token=bundle_token,
+                expires_at=expires_at,
+                files=[
+                    BundleMember(
+                        file_id=str(record.id),
+                        filename=record.filename,
+                        file_size=record.file_size,
+                        mime_type=record.mime_type,
+                    )
+                    for record in records
+                ],
+            )
+        )
+
+    for record in records:
+        info_cache.invalidate(record.token_hash)
+        token_filter.add(record.token_hash)
+
+    return BatchUploadResponse(
+        files=[
+            FileUploadResponse(
+                file_id=str(record.id),
+                download_url=f"{settings.API_BASE_URL}/api/v1/download/{download_token}",
+                download_token=download_token,
+                expires_at=expires_at,
+                filename=record.filename,
+                file_size=record.file_size,
+                mime_type=record.mime_type,
+            )
+            for record, download_token in zip(records, download_tokens)
+        ]
     )
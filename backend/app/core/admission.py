@@ -0,0 +1,165 @@
+"""
+Admission control
+Per-worker memory budget for in-flight transfers
+
+Uploads and downloads reserve an estimate of the memory they will hold
+(plaintext, compressed payload, ciphertext) before touching the body or
+consuming a one-time token. When the budget is used up, requests wait in a
+bounded FIFO queue for at most ADMISSION_MAX_WAIT_SECONDS, then get 503
+with Retry-After: the worker degrades by refusing work instead of being
+OOM-killed.
+"""
+import asyncio
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Iterator, Tuple
+
+from fastapi import Request
+
+from app.core.config import settings
+from app.core.metrics import (
+    ADMISSION_QUEUE_LENGTH,
+    ADMISSION_REJECTED,
+    ADMISSION_RESERVED_BYTES,
+)
+
+
+class AdmissionRejected(Exception):
+    """The memory budget stayed exhausted (queue full or wait timed out)"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Reservation:
+    """Bytes reserved against the budget; release() is idempotent and thread-safe"""
+
+    def __init__(self, controller: "AdmissionController", nbytes: int):
+        self.controller = controller
+        self.nbytes = nbytes
+        self._released = False
+
+    def release(self) -> None:
+        with self.controller._lock:
+            if self._released:
+                return
+            self._released = True
+        self.controller._release(self.nbytes)
+
+
+class AdmissionController:
+    """
+    Memory budget shared by the transfers of one worker
+
+    Args:
+        budget_bytes: Bytes that may be reserved at once
+        max_queue: Requests allowed to wait for budget
+        max_wait: Seconds a request waits before being rejected
+    """
+
+    def __init__(self, budget_bytes: int, max_queue: int, max_wait: float):
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.reserved = 0
+        self._waiters: Deque[Tuple[int, asyncio.Future]] = deque()
+        # Reservations may be released from threadpool threads (streamed bodies)
+        self._lock = threading.Lock()
+
+    def _update_metrics(self) -> None:
+        ADMISSION_RESERVED_BYTES.set(self.reserved)
+        ADMISSION_QUEUE_LENGTH.set(len(self._waiters))
+
+    async def acquire(self, nbytes: int) -> Reservation:
+        """
+        Reserve nbytes, waiting for budget if needed
+
+        A request larger than the whole budget reserves the whole budget,
+        so it runs alone instead of never running.
+
+        Raises:
+            AdmissionRejected: If the queue is full or the wait times out
+        """
+        nbytes = max(0, min(nbytes, self.budget_bytes))
+        with self._lock:
+            # FIFO: don't overtake requests already waiting
+            if not self._waiters and self.reserved + nbytes <= self.budget_bytes:
+                self.reserved += nbytes
+                self._update_metrics()
+                return Reservation(self, nbytes)
+            if len(self._waiters) >= self.max_queue:
+                ADMISSION_REJECTED.labels(reason="queue_full").inc()
+                raise AdmissionRejected("queue_full", settings.ADMISSION_RETRY_AFTER_SECONDS)
+            waiter = (nbytes, asyncio.get_running_loop().create_future())
+            self._waiters.append(waiter)
+            self._update_metrics()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.max_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            with self._lock:
+                # Popped by _release means granted, even if not resolved yet
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+                    self._update_metrics()
+            if granted:
+                # Granted while timing out: hand the bytes back
+                self._release(nbytes)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            ADMISSION_REJECTED.labels(reason="timeout").inc()
+            raise AdmissionRejected("timeout", settings.ADMISSION_RETRY_AFTER_SECONDS)
+        return Reservation(self, nbytes)
+
+    @asynccontextmanager
+    async def reserve(self, nbytes: int) -> AsyncIterator[Reservation]:
+        """Reserve nbytes for the duration of the block"""
+        reservation = await self.acquire(nbytes)
+        try:
+            yield reservation
+        finally:
+            reservation.release()
+
+    def _release(self, nbytes: int) -> None:
+        with self._lock:
+            self.reserved -= nbytes
+            # Grant waiters in order while they fit
+            while self._waiters and self.reserved + self._waiters[0][0] <= self.budget_bytes:
+                size, future = self._waiters.popleft()
+                self.reserved += size
+                future.get_loop().call_soon_threadsafe(_grant, future)
+            self._update_metrics()
+
+
+def _grant(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+def release_after(stream: Iterator[bytes], reservation: Reservation) -> Iterator[bytes]:
+    """Release a reservation once a response body has been streamed (or aborted)"""
+    try:
+        yield from stream
+    finally:
+        reservation.release()
+
+
+def estimate_upload_bytes(request: Request, max_bytes: int) -> int:
+    """Memory estimate for an upload, from Content-Length (max_bytes if unknown)"""
+    try:
+        size = min(int(request.headers["content-length"]), max_bytes)
+    except (KeyError, ValueError):
+        size = max_bytes
+    return int(size * settings.ADMISSION_UPLOAD_MEMORY_FACTOR)
+
+
+# Singleton instance
+admission_controller = AdmissionController(
+    budget_bytes=settings.ADMISSION_MEMORY_BUDGET_MB * 1024 * 1024,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+    max_wait=settings.ADMISSION_MAX_WAIT_SECONDS,
+)
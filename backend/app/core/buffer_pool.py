@@ -0,0 +1,62 @@
+"""
+Reusable buffer pool
+Size-classed bytearrays shared by crypto and I/O paths
+
+Buffers are handed out as memoryviews sized to the request and return to
+the pool when the block exits, so large transfers stop allocating (and
+freeing) a fresh multi-megabyte object per operation. Views must not be
+kept after the block: the memory is reused by the next caller.
+"""
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List
+
+from app.core.config import settings
+from app.core.metrics import BUFFER_POOL_ACQUIRES, BUFFER_POOL_POOLED_BYTES
+
+
+class BufferPool:
+    """Thread-safe pool of bytearrays in power-of-two size classes"""
+
+    def __init__(self, max_bytes: int, min_size: int = 64 * 1024):
+        self.max_bytes = max_bytes
+        self.min_size = min_size
+        self.pooled_bytes = 0
+        self._free: Dict[int, List[bytearray]] = {}
+        self._lock = threading.Lock()
+
+    def _size_class(self, size: int) -> int:
+        """Smallest power of two >= size (and >= min_size)"""
+        size = max(size, self.min_size)
+        return 1 << (size - 1).bit_length()
+
+    @contextmanager
+    def acquire(self, size: int) -> Iterator[memoryview]:
+        """
+        Borrow a buffer of at least size bytes
+
+        Yields:
+            memoryview: Writable view of exactly size bytes
+        """
+        size_class = self._size_class(size)
+        with self._lock:
+            free = self._free.get(size_class)
+            buffer = free.pop() if free else None
+            if buffer is not None:
+                self.pooled_bytes -= size_class
+        BUFFER_POOL_ACQUIRES.labels(result="hit" if buffer is not None else "miss").inc()
+        if buffer is None:
+            buffer = bytearray(size_class)
+
+        try:
+            yield memoryview(buffer)[:size]
+        finally:
+            with self._lock:
+                if self.pooled_bytes + size_class <= self.max_bytes:
+                    self._free.setdefault(size_class, []).append(buffer)
+                    self.pooled_bytes += size_class
+                BUFFER_POOL_POOLED_BYTES.set(self.pooled_bytes)
+
+
+# Singleton instance
+buffer_pool = BufferPool(settings.BUFFER_POOL_MAX_MB * 1024 * 1024)
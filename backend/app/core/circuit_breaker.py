@@ -0,0 +1,184 @@
+"""
+Circuit breakers
+Closed / open / half-open breaker per client (antivirus, storage, redis)
+
+Without a breaker every request paid the full client timeout against a
+dead dependency. After CIRCUIT_BREAKER_FAILURE_THRESHOLD consecutive
+failures the circuit opens and calls are refused at once (CircuitOpen).
+After CIRCUIT_BREAKER_RESET_SECONDS (+/- CIRCUIT_BREAKER_JITTER, so
+workers don't all probe together) one call is let through as a probe:
+success closes the circuit, failure opens it again.
+
+What a refused call means is each client's policy:
+- antivirus: CLAMAV_FAIL_POLICY ("open" skips the scan, "closed" -> 503)
+- storage: fail-closed (503), there is nothing to fall back to
+- redis: fail-open (rate limits and the info cache are skipped)
+"""
+import math
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple, Type
+
+from app.core.config import settings
+from app.core.limiter import LimitExceeded
+from app.core.metrics import CIRCUIT_REJECTED, CIRCUIT_STATE
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# CIRCUIT_STATE gauge values
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class DependencyUnavailable(LimitExceeded):
+    """A dependency can't serve the call (503 for fail-closed clients)"""
+
+    def __init__(self, dependency: str, retry_after: int = 1):
+        super().__init__(dependency, retry_after)
+        self.args = (f"{dependency} is unavailable",)
+
+
+class CircuitOpen(DependencyUnavailable):
+    """The dependency's circuit is open: the call was refused without being made"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for one dependency (thread-safe)
+
+    Args:
+        name: Dependency name (metrics label)
+        failure_threshold: Consecutive failures that open the circuit
+        reset_timeout: Seconds the circuit stays open before a probe
+        jitter: Random fraction (+/-) applied to reset_timeout
+        excluded: Exceptions that count as neither success nor failure
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int,
+        reset_timeout: float,
+        jitter: float = 0.0,
+        excluded: Tuple[Type[BaseException], ...] = (LimitExceeded,),
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.jitter = jitter
+        self.excluded = excluded
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_until = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(dependency=name).set(STATE_VALUES[CLOSED])
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        CIRCUIT_STATE.labels(dependency=self.name).set(STATE_VALUES[state])
+
+    def _open(self, now: float) -> None:
+        spread = self.reset_timeout * self.jitter
+        self.opened_until = now + self.reset_timeout + random.uniform(-spread, spread)
+        self._probe_started = None
+        self._set_state(OPEN)
+
+    def _reject(self, now: float) -> CircuitOpen:
+        CIRCUIT_REJECTED.labels(dependency=self.name).inc()
+        return CircuitOpen(self.name, retry_after=max(1, math.ceil(self.opened_until - now)))
+
+    def check(self) -> None:
+        """
+        Fail fast if the circuit is open and no probe is due (reserves nothing)
+
+        Raises:
+            CircuitOpen: If calls are currently refused
+        """
+        if settings.CIRCUIT_BREAKER_ENABLED and self.state == OPEN:
+            now = time.monotonic()
+            if now < self.opened_until:
+                raise self._reject(now)
+
+    def acquire(self) -> None:
+        """
+        Ask to make a call; in half-open state only one probe is let through
+
+        Every successful acquire() must be followed by record_success(),
+        record_failure() or release().
+
+        Raises:
+            CircuitOpen: If the call is refused
+        """
+        if not settings.CIRCUIT_BREAKER_ENABLED:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            if self.state == OPEN:
+                if now < self.opened_until:
+                    raise self._reject(now)
+                self._set_state(HALF_OPEN)
+            # A probe that never reported (lost caller) doesn't block the next one
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                raise self._reject(now)
+            self._probe_started = now
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_started = None
+            if self.state != CLOSED:
+                self._set_state(CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                self._open(time.monotonic())
+
+    def release(self) -> None:
+        """End a call without an outcome (e.g. rejected by the concurrency limiter)"""
+        with self._lock:
+            self._probe_started = None
+
+    @contextmanager
+    def call(self) -> Iterator[None]:
+        """
+        Run a call to the dependency through the breaker
+
+        Raises:
+            CircuitOpen: If the call is refused (the block does not run)
+        """
+        self.acquire()
+        try:
+            yield
+        except self.excluded:
+            self.release()
+            raise
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+
+    def status(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures}
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    return CircuitBreaker(
+        name,
+        failure_threshold=settings.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        reset_timeout=settings.CIRCUIT_BREAKER_RESET_SECONDS,
+        jitter=settings.CIRCUIT_BREAKER_JITTER,
+    )
+
+
+# Singleton instances
+breakers: Dict[str, CircuitBreaker] = {
+    name: _breaker(name) for name in ("antivirus", "storage", "redis")
+}
@@ -25,8 +25,28 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://:redispassword@redis:6379/0"
 
-    # Storage (MinIO/S3)
-    STORAGE_TYPE: str = "minio"
+    # File info cache (Redis)
+    INFO_CACHE_ENABLED: bool = True
+    INFO_CACHE_TTL_SECONDS: int = 30
+    INFO_CACHE_NEGATIVE_TTL_SECONDS: int = 10
+    INFO_CACHE_REDIS_TIMEOUT: float = 0.5  # seconds
+
+    # Ciphertext prefetch (warmed by /info, used by the following download)
+    PREFETCH_ENABLED: bool = False
+    PREFETCH_SEGMENTS: int = 4  # leading segments fetched per file
+    PREFETCH_CACHE_MAX_MB: int = 64  # per worker, LRU beyond
+    PREFETCH_TTL_SECONDS: float = 30.0
+    PREFETCH_WORKERS: int = 2  # background fetch threads
+
+    # Token filter (in-process counting Bloom filter of live token hashes)
+    TOKEN_FILTER_ENABLED: bool = True
+    TOKEN_FILTER_CAPACITY: int = 500000
+    TOKEN_FILTER_ERROR_RATE: float = 0.001
+    TOKEN_FILTER_REBUILD_SECONDS: int = 3600
+
+    # Storage (MinIO/S3, or local disk)
+    STORAGE_TYPE: str = "minio"  # minio, local
+    LOCAL_STORAGE_PATH: str = "/app/data/files"
     MINIO_ENDPOINT: str = "minio:9000"
     MINIO_ACCESS_KEY: str = "minioadmin"
     MINIO_SECRET_KEY: str = "minioadmin123"
@@ -34,32 +54,125 @@ class Settings(BaseSettings):
     MINIO_QUARANTINE_BUCKET: str = "secureshare-quarantine"
     MINIO_SECURE: bool = False
 
+    # Deduplicated storage (shared blobs with reference counting)
+    DEDUP_ENABLED: bool = False
+    DEDUP_KEY: str = ""  # HMAC key for content hashes (default: SECRET_KEY)
+    DEDUP_SCOPE: str = "global"  # global | uploader
+
+    # Inline storage (small ciphertexts in Postgres instead of the object store)
+    INLINE_STORAGE_MAX_KB: int = 32  # 0 = disabled
+
     # Vault
     VAULT_ADDR: str = "http://vault:8200"
     VAULT_TOKEN: str = "dev-root-token"
     VAULT_TRANSIT_KEY_NAME: str = "file-encryption"
 
+    # Encryption (KEK keyring: "version:hexkey,..." - empty = ephemeral dev key)
+    ENCRYPTION_KEYS: str = ""
+    ENCRYPTION_ACTIVE_KEY_VERSION: str = "1"
+    ENCRYPTION_SEGMENT_SIZE: int = 256 * 1024  # plaintext bytes per GCM segment
+    ENCRYPTION_PARALLELISM: int = 0  # threads sealing the segments of one file (0 = CPU count)
+    ENCRYPTION_SUITE: str = "auto"  # suite for new files, or auto: fastest allowed at startup
+    ENCRYPTION_ALLOWED_SUITES: str = "AES-256-GCM,ChaCha20-Poly1305"  # also: AES-256-GCM-SIV
+    ENCRYPTION_BENCHMARK_KB: int = 1024  # payload per suite for the startup benchmark
+    BUFFER_POOL_MAX_MB: int = 256  # idle crypto/I-O buffers kept for reuse
+
+    # Admission control (memory budget for in-flight transfers, per worker)
+    ADMISSION_MEMORY_BUDGET_MB: int = 1024
+    ADMISSION_MAX_QUEUE: int = 100  # transfers waiting for budget; beyond: 503
+    ADMISSION_MAX_WAIT_SECONDS: float = 10.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 5
+    ADMISSION_UPLOAD_MEMORY_FACTOR: float = 3.0  # plaintext + compressed + ciphertext
+    ADMISSION_DOWNLOAD_MEMORY_FACTOR: float = 2.0  # ciphertext + plaintext
+
+    # Key rotation
+    KEY_ROTATION_BATCH_SIZE: int = 500
+    KEY_ROTATION_WORKERS: int = 4
+    KEY_ROTATION_MAX_MB_PER_SECOND: int = 50  # re-encryption throttle
+    KEY_ROTATION_CHECKPOINT_PATH: str = "/app/logs/key_rotation.json"
+    KEY_ROTATION_RETRY_PASSES: int = 3  # retries of rows locked by downloads
+    KEY_ROTATION_RETRY_DELAY_SECONDS: float = 5.0
+
     # ClamAV
     ANTIVIRUS_ENABLED: bool = True
     CLAMAV_HOST: str = "clamav"
     CLAMAV_PORT: int = 3310
     CLAMAV_TIMEOUT: int = 120
+    CLAMAV_CONNECT_TIMEOUT: float = 5.0  # startup/first-use ping
+    CLAMAV_FAIL_POLICY: str = "open"  # open: skip the scan when clamd fails, closed: 503
+
+    # Startup & readiness
+    STARTUP_DEPENDENCY_TIMEOUT_SECONDS: float = 5.0  # per dependency, run concurrently
+    READINESS_REQUIRED_DEPENDENCIES: str = "database,storage"  # others are reported only
+    HEALTH_PROBE_INTERVAL_SECONDS: float = 10.0  # background re-check of every dependency
+    HEALTH_PROBE_TIMEOUT_SECONDS: float = 2.0
+    LOAD_SHEDDING_ENABLED: bool = True  # 503 on uploads while a required dependency is down
+    LOAD_SHEDDING_RETRY_AFTER_SECONDS: int = 10
+
+    # Adaptive concurrency limits (AIMD) for storage, antivirus and database
+    ADAPTIVE_LIMIT_ENABLED: bool = True
+    ADAPTIVE_LIMIT_INITIAL: int = 20
+    ADAPTIVE_LIMIT_MIN: int = 2
+    ADAPTIVE_LIMIT_MAX: int = 200
+    ADAPTIVE_LIMIT_LATENCY_TOLERANCE: float = 2.0  # back off above this x baseline latency
+    ADAPTIVE_LIMIT_BACKOFF: float = 0.7  # multiplicative decrease
+
+    # Circuit breakers for the antivirus, storage and redis clients
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD: int = 5  # consecutive failures that open the circuit
+    CIRCUIT_BREAKER_RESET_SECONDS: float = 30.0  # open time before a half-open probe
+    CIRCUIT_BREAKER_JITTER: float = 0.2  # +/- fraction of the open time
 
     # Security
     RATE_LIMIT_ENABLED: bool = True
     RATE_LIMIT_GLOBAL_PER_MINUTE: int = 100
     RATE_LIMIT_UPLOAD_PER_HOUR: int = 10
     RATE_LIMIT_DOWNLOAD_PER_HOUR: int = 50
+    RATE_LIMIT_REDIS_TIMEOUT: float = 0.5  # seconds; limits are skipped if Redis fails
 
     # File Upload
     MAX_FILE_SIZE_MB: int = 100
     ALLOWED_MIME_TYPES: str = "application/pdf,image/jpeg,image/png,image/gif,application/zip,text/plain"
+    BATCH_UPLOAD_MAX_FILES: int = 20
+    BATCH_UPLOAD_MAX_TOTAL_MB: int = 500
+    BATCH_UPLOAD_CONCURRENCY: int = 4  # files scanned/encrypted/stored in parallel
+
+    # Size-class scheduling (separate scan/crypto thread pools)
+    SIZE_CLASS_SMALL_MAX_KB: int = 1024  # uploads up to this size use the small-file pool
+    SIZE_CLASS_SMALL_WORKERS: int = 8
+    SIZE_CLASS_LARGE_WORKERS: int = 4
+
+    # Compression (zstd, before encryption)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_LEVEL: int = 3
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes
+    COMPRESSION_MAX_ENTROPY: float = 7.5  # bits per byte of the sampled prefix
 
     # Token
     TOKEN_LENGTH: int = 32  # bytes (256 bits)
     DEFAULT_TTL_HOURS: int = 24
     MAX_TTL_HOURS: int = 48
 
+    # Monitoring
+    SERVER_TIMING_ENABLED: bool = False  # per-stage Server-Timing response header
+    PROFILING_ENABLED: bool = False
+    PROFILING_ADMIN_TOKEN: str = ""  # X-Profile-Token value that forces a profile
+    PROFILING_SAMPLE_RATE: float = 0.0  # fraction of requests profiled
+    PROFILING_INTERVAL_MS: float = 1.0
+    PROFILING_DIR: str = "/app/logs/profiles"
+    PROFILING_MAX_FILES: int = 100  # ring size (oldest profiles deleted)
+
+    # Tracing
+    TRACING_ENABLED: bool = False
+    TRACING_SERVICE_NAME: str = "secureshare-backend"
+    TRACING_SAMPLE_RATE: float = 0.01
+    TRACING_TRUST_INCOMING_SAMPLING: bool = False  # follow traceparent sampled flags (trusted callers only)
+    TRACING_EXPORTER: str = "otlp"  # otlp, jsonl
+    TRACING_OTLP_ENDPOINT: str = "http://localhost:4318/v1/traces"
+    TRACING_JSONL_PATH: str = "/app/logs/traces.jsonl"
+    TRACING_MAX_QUEUE_SIZE: int = 2048  # spans dropped beyond this
+    TRACING_EXPORT_INTERVAL_SECONDS: float = 5.0
+
     # CORS
     CORS_ORIGINS: List[str] = ["http://localhost:3000", "http://localhost:8080"]
     CORS_ALLOW_CREDENTIALS: bool = True
@@ -0,0 +1,177 @@
+"""
+Service container
+Initializes external dependencies concurrently, off the startup path, then
+keeps probing them in the background
+
+The app starts serving (/health) immediately; each dependency is then
+initialized in a dedicated thread pool (never the request threadpool) with
+a bounded wait, all at once. /ready
+reports 503 until the dependencies listed in READINESS_REQUIRED_DEPENDENCIES
+are initialized, so load balancers only route traffic to warm workers.
+Services still initialize lazily on first use if a request arrives first.
+
+Afterwards every dependency is re-checked each HEALTH_PROBE_INTERVAL_SECONDS
+and the result is cached: /ready and upload load shedding read the cache
+and never touch a dependency themselves. A check still running after its
+wait timed out (the thread can't be interrupted) is not started again: the
+dependency stays down until it returns.
+"""
+import asyncio
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.metrics import DEPENDENCY_PROBE_SECONDS, DEPENDENCY_UP
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+class Dependency:
+    """An external dependency and the result of its initialization"""
+
+    def __init__(self, name: str, init: Callable[[], None]):
+        self.name = name
+        self.init = init
+        self.ready = False
+        self.error: Optional[str] = None
+        self.init_seconds: Optional[float] = None
+        self.latency_seconds: Optional[float] = None
+        self.checked_at: Optional[datetime] = None
+        # Last check submitted to the probe threads
+        self.probe: Optional[Future] = None
+
+    @property
+    def required(self) -> bool:
+        required = [name.strip() for name in settings.READINESS_REQUIRED_DEPENDENCIES.split(",")]
+        return self.name in required
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "required": self.required,
+            "error": self.error,
+            "init_ms": _ms(self.init_seconds),
+            "latency_ms": _ms(self.latency_seconds),
+            "checked_at": self.checked_at.isoformat() if self.checked_at else None,
+        }
+
+
+class ServiceContainer:
+    """Registry of dependencies initialized and probed in the background"""
+
+    def __init__(self):
+        self.dependencies: Dict[str, Dependency] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(self, name: str, init: Callable[[], None]) -> None:
+        """
+        Register a blocking init function (raises if the dependency is unusable)
+
+        The same function is used as the periodic health check, so it must be
+        cheap and safe to call repeatedly.
+        """
+        self.dependencies[name] = Dependency(name, init)
+
+    def _submit(self, dependency: Dependency) -> Optional[Future]:
+        """Run the dependency's check in a probe thread, unless one is still running"""
+        if dependency.probe is not None and not dependency.probe.done():
+            return None
+        if self._executor is None:
+            # One thread per dependency: a hung check never delays another
+            self._executor = ThreadPoolExecutor(
+                max_workers=max(1, len(self.dependencies)), thread_name_prefix="probe"
+            )
+        dependency.probe = self._executor.submit(dependency.init)
+        return dependency.probe
+
+    async def _initialize(self, dependency: Dependency, timeout: float) -> None:
+        start = time.perf_counter()
+        first = dependency.init_seconds is None
+        try:
+            probe = self._submit(dependency)
+            if probe is None:
+                raise RuntimeError("Previous check still running")
+            # The thread is not interrupted on timeout; the wait is bounded
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(probe)), timeout)
+            dependency.ready = True
+            dependency.error = None
+        except asyncio.TimeoutError:
+            dependency.ready = False
+            dependency.error = f"Timed out after {timeout}s"
+        except Exception as e:
+            dependency.ready = False
+            dependency.error = str(e) or type(e).__name__
+        finally:
+            dependency.latency_seconds = time.perf_counter() - start
+            dependency.checked_at = datetime.utcnow()
+            if first:
+                dependency.init_seconds = dependency.latency_seconds
+            DEPENDENCY_UP.labels(dependency=dependency.name).set(1 if dependency.ready else 0)
+            DEPENDENCY_PROBE_SECONDS.labels(dependency=dependency.name).set(
+                dependency.latency_seconds
+            )
+
+    async def initialize(self, timeout: Optional[float] = None) -> None:
+        """Initialize every dependency concurrently"""
+        timeout = timeout or settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS
+        await asyncio.gather(
+            *(self._initialize(dependency, timeout) for dependency in self.dependencies.values())
+        )
+
+    async def _run(self) -> None:
+        await self.initialize()
+        while True:
+            await asyncio.sleep(settings.HEALTH_PROBE_INTERVAL_SECONDS)
+            await self.initialize(settings.HEALTH_PROBE_TIMEOUT_SECONDS)
+
+    def start(self) -> None:
+        """Start initialization, then periodic probing, in the background"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._executor is not None:
+            # Hung checks are abandoned, not waited for
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    @property
+    def ready(self) -> bool:
+        return all(
+            dependency.ready for dependency in self.dependencies.values() if dependency.required
+        )
+
+    def unavailable(self) -> List[str]:
+        """
+        Required dependencies whose last check failed
+
+        Dependencies not checked yet are not listed: a request arriving
+        during startup initializes them lazily instead of being rejected.
+        """
+        return [
+            name for name, dependency in self.dependencies.items()
+            if dependency.required and dependency.error is not None and not dependency.ready
+        ]
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "not_ready",
+            "dependencies": {
+                name: dependency.status() for name, dependency in self.dependencies.items()
+            },
+        }
+
+
+# Singleton instance
+container = ServiceContainer()
@@ -1,11 +1,15 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
+import math
+import os
+
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.core.limiter import limiters
 
 # Create database engine
 engine = create_engine(
@@ -14,6 +18,11 @@ engine = create_engine(
     pool_size=20,
     max_overflow=10,
     echo=settings.DEBUG,
+    # A dead server fails the connection instead of hanging its thread
+    connect_args=(
+        {"connect_timeout": math.ceil(settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS)}
+        if settings.DATABASE_URL.startswith("postgresql") else {}
+    ),
 )
 
 # Session factory
@@ -23,6 +32,23 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+def check_connection() -> None:
+    """
+    Open a connection and run a trivial query
+
+    Raises:
+        Exception: If the database is unreachable
+    """
+    if os.environ.get("ENVIRONMENT") == "test":
+        return  # Tests use their own SQLite engine
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            # Only for this transaction: the connection goes back to the pool
+            timeout_ms = int(settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS * 1000)
+            connection.execute(text(f"SET LOCAL statement_timeout = {timeout_ms}"))
+        connection.execute(text("SELECT 1"))
+
+
 def get_db():
     """
     Database dependency for FastAPI endpoints
@@ -31,7 +57,14 @@ def get_db():
         @app.get("/items")
         def read_items(db: Session = Depends(get_db)):
             return db.query(Item).all()
+
+    Raises:
+        LimitExceeded: If the database is at its adaptive concurrency limit
     """
+    # Shed the request while the database is saturated, before it starts:
+    # its statements are not limited once they run
+    limiters["database"].check()
+
     db = SessionLocal()
     try:
         yield db
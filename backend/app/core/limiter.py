@@ -0,0 +1,181 @@
+"""
+Adaptive concurrency limits
+AIMD limiter per downstream dependency (storage, antivirus, database)
+
+Each dependency gets a concurrency limit that adapts to how it behaves:
+while call latency stays near its baseline the limit grows additively
+(+1 per limit's worth of calls), and when latency exceeds
+ADAPTIVE_LIMIT_LATENCY_TOLERANCE x baseline or a call fails it shrinks
+multiplicatively (x ADAPTIVE_LIMIT_BACKOFF). Calls beyond the limit fail
+fast with LimitExceeded (503) instead of queuing behind a slow dependency
+until they time out.
+
+Transfer latency grows with payload size, so calls that move data pass
+their size and latency is compared per SIZE_UNIT: a 100 MB upload is not
+mistaken for congestion by a baseline learned on 1 KB files.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+from app.core.config import settings
+from app.core.metrics import LIMITER_IN_FLIGHT, LIMITER_LIMIT, LIMITER_REJECTED
+
+# How fast the baseline follows latencies above it (it drops to lower ones at once)
+BASELINE_DRIFT = 0.01
+SIZE_UNIT = 1024 * 1024
+# Sub-millisecond calls jitter by more than the tolerance: compare above this
+LATENCY_FLOOR = 0.005
+MIN_DECREASE_INTERVAL = 0.1
+
+
+class LimitExceeded(Exception):
+    """A dependency is at its concurrency limit"""
+
+    def __init__(self, dependency: str, retry_after: int = 1):
+        super().__init__(f"{dependency} is at its concurrency limit")
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit for one dependency (thread-safe)
+
+    Args:
+        name: Dependency name (metrics label)
+        initial: Starting limit
+        min_limit: The limit never drops below this
+        max_limit: The limit never grows above this
+    """
+
+    def __init__(self, name: str, initial: int, min_limit: int, max_limit: int):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self.baseline: Optional[float] = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        LIMITER_LIMIT.labels(dependency=name).set(initial)
+
+    def check(self) -> None:
+        """
+        Fail fast if the dependency is currently saturated (reserves nothing)
+
+        Raises:
+            LimitExceeded: If calls are at the limit
+        """
+        if settings.ADAPTIVE_LIMIT_ENABLED and self.in_flight >= int(self.limit):
+            LIMITER_REJECTED.labels(dependency=self.name).inc()
+            raise LimitExceeded(self.name)
+
+    def acquire(self, enforce: bool = True) -> float:
+        """
+        Take a slot
+
+        Args:
+            enforce: Reject the call at the limit (otherwise it is only
+                counted and measured)
+
+        Returns:
+            float: Start time, to pass to release()
+
+        Raises:
+            LimitExceeded: If calls are at the limit
+        """
+        with self._lock:
+            if enforce:
+                self.check()
+            self.in_flight += 1
+            LIMITER_IN_FLIGHT.labels(dependency=self.name).set(self.in_flight)
+        return time.perf_counter()
+
+    def cancel(self) -> None:
+        """Free a slot taken ahead of a call that was not made (no limit change)"""
+        with self._lock:
+            self.in_flight -= 1
+            LIMITER_IN_FLIGHT.labels(dependency=self.name).set(self.in_flight)
+
+    def release(self, started: float, failed: bool = False, size: int = 0) -> None:
+        """Free a slot and adapt the limit to the call's outcome"""
+        now = time.perf_counter()
+        elapsed = now - started
+        latency = elapsed / (1 + size / SIZE_UNIT)
+        with self._lock:
+            self.in_flight -= 1
+            LIMITER_IN_FLIGHT.labels(dependency=self.name).set(self.in_flight)
+
+            if self.baseline is None or latency < self.baseline:
+                self.baseline = latency
+            else:
+                self.baseline += (latency - self.baseline) * BASELINE_DRIFT
+
+            threshold = max(self.baseline, LATENCY_FLOOR) * settings.ADAPTIVE_LIMIT_LATENCY_TOLERANCE
+            if failed or latency > threshold:
+                # At most one decrease per call duration: a burst of slow calls
+                # started together is one congestion signal, not many
+                if now - self._last_decrease >= max(elapsed, MIN_DECREASE_INTERVAL):
+                    self.limit = max(self.min_limit, self.limit * settings.ADAPTIVE_LIMIT_BACKOFF)
+                    self._last_decrease = now
+            else:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            LIMITER_LIMIT.labels(dependency=self.name).set(int(self.limit))
+
+    @contextmanager
+    def limit_calls(self, size: int = 0) -> Iterator[None]:
+        """Run a call to the dependency (moving size bytes) within its limit"""
+        started = self.acquire()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.release(started, failed, size)
+
+    def instrument_sqlalchemy(self, engine) -> None:
+        """
+        Count and measure the SQL statements executed on the engine
+
+        Statements are never rejected: one can run after a one-time claim
+        (the audit commit of a download) or after an object was stored,
+        where failing would lose work that can't be retried. Requests are
+        checked against the limit once, when they open a session (get_db).
+        """
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            context._limiter_started = self.acquire(enforce=False)
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_limiter_started", None)
+            if started is not None:
+                context._limiter_started = None
+                self.release(started)
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(exception_context):
+            context = exception_context.execution_context
+            started = getattr(context, "_limiter_started", None) if context else None
+            if started is not None:
+                context._limiter_started = None
+                self.release(started, failed=True)
+
+
+def _limiter(name: str) -> AdaptiveLimiter:
+    return AdaptiveLimiter(
+        name,
+        initial=settings.ADAPTIVE_LIMIT_INITIAL,
+        min_limit=settings.ADAPTIVE_LIMIT_MIN,
+        max_limit=settings.ADAPTIVE_LIMIT_MAX,
+    )
+
+
+# Singleton instances
+limiters: Dict[str, AdaptiveLimiter] = {
+    name: _limiter(name) for name in ("storage", "antivirus", "database")
+}
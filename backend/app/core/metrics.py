@@ -0,0 +1,139 @@
+"""
+Prometheus metrics
+Scraped by Prometheus on /metrics (see infrastructure/prometheus)
+"""
+from prometheus_client import Counter, Gauge, Histogram
+
+# Key rotation
+KEY_ROTATION_FILES = Counter(
+    "secureshare_key_rotation_files_total",
+    "Files processed by key rotation",
+    ["action"],  # rewrapped, reencrypted, skipped, failed
+)
+KEY_ROTATION_BYTES = Counter(
+    "secureshare_key_rotation_bytes_total",
+    "Ciphertext bytes re-encrypted by key rotation",
+)
+KEY_ROTATION_LAST_BATCH = Gauge(
+    "secureshare_key_rotation_last_batch_timestamp",
+    "Unix time of the last completed key rotation batch",
+)
+
+# Compression
+COMPRESSION_BYTES = Counter(
+    "secureshare_compression_bytes_total",
+    "Bytes entering and leaving the compression stage",
+    ["stage"],  # input, output
+)
+
+# Upload validation (KRI-03)
+MIME_BLOCKED = Counter(
+    "secureshare_mime_blocked_total",
+    "Uploads rejected because their detected MIME type is not allowed",
+    ["mime_type"],
+)
+
+# Buffer pool
+BUFFER_POOL_ACQUIRES = Counter(
+    "secureshare_buffer_pool_acquires_total",
+    "Buffers borrowed from the shared pool",
+    ["result"],  # hit, miss
+)
+BUFFER_POOL_POOLED_BYTES = Gauge(
+    "secureshare_buffer_pool_pooled_bytes",
+    "Bytes held by idle pooled buffers",
+)
+
+# Admission control (per-worker memory budget)
+ADMISSION_RESERVED_BYTES = Gauge(
+    "secureshare_admission_reserved_bytes",
+    "Memory reserved by in-flight transfers",
+)
+ADMISSION_QUEUE_LENGTH = Gauge(
+    "secureshare_admission_queue_length",
+    "Transfers waiting for memory budget",
+)
+ADMISSION_REJECTED = Counter(
+    "secureshare_admission_rejected_total",
+    "Transfers rejected with 503 for lack of memory budget",
+    ["reason"],  # queue_full, timeout
+)
+
+# Size-class scheduling
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SCHEDULER_QUEUE_SECONDS = Histogram(
+    "secureshare_scheduler_queue_seconds",
+    "Time blocking work waited for a thread of its size-class pool",
+    ["size_class"],  # small, large
+    buckets=LATENCY_BUCKETS,
+)
+UPLOAD_DURATION_SECONDS = Histogram(
+    "secureshare_upload_duration_seconds",
+    "Upload request duration by size class",
+    ["size_class"],
+    buckets=LATENCY_BUCKETS,
+)
+
+# Adaptive concurrency limits (AIMD, per dependency)
+LIMITER_LIMIT = Gauge(
+    "secureshare_limiter_limit",
+    "Current adaptive concurrency limit",
+    ["dependency"],  # storage, antivirus, database
+)
+LIMITER_IN_FLIGHT = Gauge(
+    "secureshare_limiter_in_flight",
+    "Calls in flight to a dependency",
+    ["dependency"],
+)
+LIMITER_REJECTED = Counter(
+    "secureshare_limiter_rejected_total",
+    "Calls failed fast because a dependency was at its limit",
+    ["dependency"],
+)
+
+# Cipher suites (startup benchmark)
+ENCRYPTION_SUITE_THROUGHPUT = Gauge(
+    "secureshare_encryption_suite_throughput_bytes",
+    "Encryption throughput measured at startup, in bytes per second",
+    ["suite"],
+)
+
+# Ciphertext prefetch (after /info lookups)
+PREFETCH_REQUESTS = Counter(
+    "secureshare_prefetch_requests_total",
+    "Download claims by prefetch cache result",
+    ["result"],  # hit, miss
+)
+PREFETCH_CACHE_BYTES = Gauge(
+    "secureshare_prefetch_cache_bytes",
+    "Ciphertext bytes held by the prefetch cache",
+)
+
+# Circuit breakers (per dependency client)
+CIRCUIT_STATE = Gauge(
+    "secureshare_circuit_state",
+    "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ["dependency"],  # antivirus, storage, redis
+)
+CIRCUIT_REJECTED = Counter(
+    "secureshare_circuit_rejected_total",
+    "Calls refused without being made because a circuit was open",
+    ["dependency"],
+)
+
+# Dependency health (background prober)
+DEPENDENCY_UP = Gauge(
+    "secureshare_dependency_up",
+    "Whether the last health check of a dependency succeeded",
+    ["dependency"],
+)
+DEPENDENCY_PROBE_SECONDS = Gauge(
+    "secureshare_dependency_probe_seconds",
+    "Duration of the last health check of a dependency",
+    ["dependency"],
+)
+LOAD_SHED_REQUESTS = Counter(
+    "secureshare_load_shed_requests_total",
+    "Requests rejected with 503 because a critical dependency is down",
+    ["dependency"],
+)
@@ -0,0 +1,40 @@
+"""
+Per-request stage timings
+Reported as a Server-Timing header when SERVER_TIMING_ENABLED is set
+"""
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from fastapi import Request
+
+
+class StageTimer:
+    """Accumulates wall-clock time spent in named pipeline stages"""
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}  # stage -> seconds
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block of code as the given stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def server_timing(self) -> str:
+        """Format stages as a Server-Timing header value (milliseconds)"""
+        return ", ".join(
+            f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()
+        )
+
+
+def get_stage_timer(request: Request) -> StageTimer:
+    """Get (or create) the stage timer of a request"""
+    timer = getattr(request.state, "stage_timer", None)
+    if timer is None:
+        timer = StageTimer()
+        request.state.stage_timer = timer
+    return timer
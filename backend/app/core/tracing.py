@@ -0,0 +1,427 @@
+"""
+Distributed tracing
+OpenTelemetry-compatible spans with W3C traceparent propagation
+
+A trace is started per request by TracingMiddleware (honouring an incoming
+traceparent header); service calls, SQL statements and Redis commands are
+recorded as child spans. Spans outside a sampled trace are no-ops, so
+instrumented code costs a context variable lookup when tracing is off or
+the request is not sampled.
+
+Finished spans are exported in batches from a background thread, either to
+an OTLP/HTTP collector (JSON encoding) or to a JSON-lines file.
+"""
+import contextvars
+import functools
+import json
+import os
+import queue
+import re
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar(
+    "current_span", default=None
+)
+
+
+class Span:
+    """A recorded operation within a trace"""
+
+    __slots__ = (
+        "trace_id", "span_id", "parent_id", "name", "kind",
+        "start_ns", "end_ns", "attributes", "status", "status_message",
+    )
+
+    sampled = True
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str,
+                 kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = STATUS_UNSET
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": (self.end_ns - self.start_ns) / 1e6,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message,
+        }
+
+
+class NoopSpan:
+    """Stand-in for spans outside a sampled trace"""
+
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_exception(self, exc: BaseException) -> None:
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class JsonLinesExporter:
+    """Appends spans to a JSON-lines file (one span per line)"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as f:
+            for span in spans:
+                f.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def shutdown(self) -> None:
+        pass
+
+
+class OTLPHttpExporter:
+    """Sends spans to an OTLP/HTTP collector using the JSON encoding"""
+
+    def __init__(self, endpoint: str, service_name: str, timeout: float = 5.0):
+        import httpx
+
+        self.endpoint = endpoint
+        self.service_name = service_name
+        self.client = httpx.Client(timeout=timeout)
+
+    @staticmethod
+    def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+        encoded = []
+        for key, value in attributes.items():
+            if isinstance(value, bool):
+                encoded.append({"key": key, "value": {"boolValue": value}})
+            elif isinstance(value, int):
+                encoded.append({"key": key, "value": {"intValue": str(value)}})
+            elif isinstance(value, float):
+                encoded.append({"key": key, "value": {"doubleValue": value}})
+            else:
+                encoded.append({"key": key, "value": {"stringValue": str(value)}})
+        return encoded
+
+    def encode(self, spans: List[Span]) -> Dict[str, Any]:
+        """Build an ExportTraceServiceRequest body"""
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": self._attributes({"service.name": self.service_name})},
+                "scopeSpans": [{
+                    "scope": {"name": "secureshare"},
+                    "spans": [
+                        {
+                            "traceId": span.trace_id,
+                            "spanId": span.span_id,
+                            "parentSpanId": span.parent_id or "",
+                            "name": span.name,
+                            "kind": span.kind,
+                            "startTimeUnixNano": str(span.start_ns),
+                            "endTimeUnixNano": str(span.end_ns),
+                            "attributes": self._attributes(span.attributes),
+                            "status": {"code": span.status, "message": span.status_message},
+                        }
+                        for span in spans
+                    ],
+                }],
+            }],
+        }
+
+    def export(self, spans: List[Span]) -> None:
+        response = self.client.post(self.endpoint, json=self.encode(spans))
+        response.raise_for_status()
+
+    def shutdown(self) -> None:
+        self.client.close()
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished spans and exports them in batches from a background thread
+
+    The queue is bounded: spans are dropped rather than blocking requests
+    when the exporter falls behind.
+    """
+
+    def __init__(self, exporter, max_queue_size: int = 2048,
+                 batch_size: int = 512, interval: float = 5.0):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: "queue.Queue[Span]" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._export_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """Export every queued span"""
+        with self._export_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if not batch:
+                    return
+                try:
+                    self.exporter.export(batch)
+                except Exception as e:
+                    print(f"Span export failed: {e}")
+
+    def shutdown(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval)
+            self._thread = None
+        self.flush()
+        self.exporter.shutdown()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the span processor"""
+
+    def __init__(self, sample_rate: Optional[float] = None, processor: Optional[BatchSpanProcessor] = None):
+        self.sample_rate = settings.TRACING_SAMPLE_RATE if sample_rate is None else sample_rate
+        self.trust_incoming_sampling = settings.TRACING_TRUST_INCOMING_SAMPLING
+        self.processor = processor
+
+    @property
+    def enabled(self) -> bool:
+        return self.processor is not None
+
+    def _sampled(self, trace_id: str) -> bool:
+        """Ratio sampling on the trace id, consistent across services"""
+        return int(trace_id[16:], 16) < self.sample_rate * 2**64
+
+    @contextmanager
+    def start_trace(self, name: str, traceparent: Optional[str] = None,
+                    kind: int = KIND_SERVER,
+                    attributes: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """
+        Start the root span of a request or job
+
+        An incoming traceparent header continues the caller's trace; its
+        sampling flag is followed only with TRACING_TRUST_INCOMING_SAMPLING
+        (callers are untrusted clients otherwise, and could force every
+        request to be traced). Other traces are sampled at sample_rate.
+        """
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+
+        parent = TRACEPARENT_RE.match(traceparent.strip().lower()) if traceparent else None
+        if parent:
+            trace_id, parent_id, flags = parent.groups()
+            if self.trust_incoming_sampling:
+                sampled = bool(int(flags, 16) & 1)
+            else:
+                # The caller chose the trace id: don't sample on it
+                sampled = self._sampled(secrets.token_hex(16))
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = self._sampled(trace_id)
+
+        if not sampled:
+            yield NOOP_SPAN
+            return
+
+        span = Span(trace_id, parent_id, name, kind, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL,
+                   attributes: Optional[Dict[str, Any]] = None) -> Any:
+        """Start a child of the current span (not made current)"""
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(parent.trace_id, parent.span_id, name, kind, attributes)
+
+    def end_span(self, span: Any) -> None:
+        if span.sampled:
+            span.end_ns = time.time_ns()
+            self.processor.on_end(span)
+
+    @contextmanager
+    def span(self, name: str, kind: int = KIND_INTERNAL,
+             attributes: Optional[Dict[str, Any]] = None) -> Iterator[Any]:
+        """Record a block of code as a child span of the current span"""
+        span = self.start_span(name, kind, attributes)
+        if not span.sampled:
+            yield span
+            return
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.record_exception(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            self.end_span(span)
+
+    def traced(self, name: str, kind: int = KIND_INTERNAL) -> Callable:
+        """Decorator recording each call of a function as a span"""
+
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if _current_span.get() is None:
+                    return func(*args, **kwargs)
+                with self.span(name, kind):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+    def configure(self) -> None:
+        """Set up the exporter from settings and start exporting"""
+        if not settings.TRACING_ENABLED or self.enabled:
+            return
+
+        if settings.TRACING_EXPORTER == "jsonl":
+            exporter = JsonLinesExporter(settings.TRACING_JSONL_PATH)
+        else:
+            exporter = OTLPHttpExporter(settings.TRACING_OTLP_ENDPOINT, settings.TRACING_SERVICE_NAME)
+
+        self.processor = BatchSpanProcessor(
+            exporter,
+            max_queue_size=settings.TRACING_MAX_QUEUE_SIZE,
+            interval=settings.TRACING_EXPORT_INTERVAL_SECONDS,
+        )
+        self.processor.start()
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown()
+            self.processor = None
+
+    def instrument_sqlalchemy(self, engine) -> None:
+        """Record each SQL statement executed on the engine as a span"""
+        from sqlalchemy import event
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            span = self.start_span(
+                f"db.{statement.split(None, 1)[0].upper()}" if statement else "db.query",
+                KIND_CLIENT,
+            )
+            if span.sampled:
+                span.set_attribute("db.system", engine.dialect.name)
+                span.set_attribute("db.statement", statement[:500])
+            context._trace_span = span
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            span = getattr(context, "_trace_span", NOOP_SPAN)
+            self.end_span(span)
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(exception_context):
+            context = exception_context.execution_context
+            span = getattr(context, "_trace_span", NOOP_SPAN) if context else NOOP_SPAN
+            span.record_exception(exception_context.original_exception)
+            self.end_span(span)
+
+    def instrument_redis(self) -> None:
+        """Record each Redis command as a span"""
+        import redis
+
+        original = redis.Redis.execute_command
+        if getattr(original, "_traced", False):
+            return
+
+        @functools.wraps(original)
+        def execute_command(client, *args, **options):
+            span = self.start_span(f"redis.{args[0]}" if args else "redis", KIND_CLIENT)
+            if not span.sampled:
+                return original(client, *args, **options)
+            span.set_attribute("db.system", "redis")
+            try:
+                return original(client, *args, **options)
+            except Exception as e:
+                span.record_exception(e)
+                raise
+            finally:
+                self.end_span(span)
+
+        execute_command._traced = True
+        redis.Redis.execute_command = execute_command
+
+
+# Singleton instance
+tracer = Tracer()
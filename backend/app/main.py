@@ -1,13 +1,101 @@
 """
 SecureShare Backend - Main Application Entry Point
 """
-from fastapi import FastAPI
+import os
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
 
+from app.core.admission import AdmissionRejected
+from app.core.circuit_breaker import DependencyUnavailable
 from app.core.config import settings
+from app.core.limiter import LimitExceeded, limiters
+from app.core.container import container
+from app.core.database import SessionLocal, check_connection, engine
+from app.core.scheduler import scheduler
+from app.core.tracing import tracer
 from app.api.v1 import api_router
+from app.middleware.load_shedding import LoadSheddingMiddleware
+from app.middleware.profiling import ProfilingMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.middleware.security_headers import SecurityHeadersMiddleware
+from app.middleware.tracing import TracingMiddleware
+from app.services.antivirus import antivirus_service
+from app.services.encryption import encryption_service
+from app.services.prefetch import prefetch_cache
+from app.services.storage import storage_service
+from app.services.token_filter import token_filter
+
+
+def check_redis() -> None:
+    """Ping Redis (rate limiting, info cache, token filter)"""
+    if os.environ.get("ENVIRONMENT") == "test":
+        return
+    import redis
+    client = redis.from_url(
+        settings.REDIS_URL,
+        socket_connect_timeout=settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS,
+        socket_timeout=settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS,
+    )
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+
+def check_kms() -> None:
+    """Check that Vault is initialized and unsealed"""
+    if os.environ.get("ENVIRONMENT") == "test":
+        return
+    import httpx
+    # sys/health answers 200 when active, 429/473 for standbys; others mean unusable
+    response = httpx.get(
+        f"{settings.VAULT_ADDR}/v1/sys/health",
+        timeout=settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS,
+    )
+    if response.status_code not in (200, 429, 473):
+        raise ConnectionError(f"Vault unhealthy (HTTP {response.status_code})")
+
+
+# External dependencies, initialized concurrently after startup, then probed
+container.register("database", check_connection)
+container.register("redis", check_redis)
+container.register("storage", storage_service.connect)
+container.register("antivirus", antivirus_service.connect)
+container.register("kms", check_kms)
+
+# Adaptive concurrency limit on SQL statements
+limiters["database"].instrument_sqlalchemy(engine)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services without waiting for dependencies"""
+    tracer.configure()
+    if tracer.enabled:
+        tracer.instrument_sqlalchemy(engine)
+        tracer.instrument_redis()
+    # A few milliseconds: pick the fastest cipher suite before serving uploads
+    throughput = encryption_service.select_suite()
+    if throughput:
+        print(
+            f"Cipher suite for new files: {encryption_service.suite} ("
+            + ", ".join(f"{name} {rate / 1e6:.0f} MB/s" for name, rate in throughput.items())
+            + ")"
+        )
+    container.start()
+    token_filter.start(SessionLocal)
+    yield
+    token_filter.stop()
+    scheduler.shutdown()
+    encryption_service.shutdown()
+    prefetch_cache.shutdown()
+    await container.stop()
+    tracer.shutdown()
+
 
 app = FastAPI(
     title="SecureShare API",
@@ -15,8 +103,16 @@ app = FastAPI(
     version="1.0.0",
     docs_url="/docs",
     redoc_url="/redoc",
+    lifespan=lifespan,
 )
 
+# Profiling Middleware (innermost, opt-in)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
+# Load Shedding Middleware (503 on uploads while a required dependency is down)
+app.add_middleware(LoadSheddingMiddleware)
+
 # Security Headers Middleware (applied first)
 app.add_middleware(SecurityHeadersMiddleware)
 
@@ -32,10 +128,44 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tracing Middleware (outermost, opt-in)
+if settings.TRACING_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 # Include API routers
 app.include_router(api_router, prefix=settings.API_V1_PREFIX)
 
 
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Worker memory budget exhausted: ask the client to retry later"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server busy. Please try again later."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(LimitExceeded)
+async def limit_exceeded_handler(request: Request, exc: LimitExceeded):
+    """A dependency is at its adaptive concurrency limit: fail fast"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service busy. Please try again later."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+@app.exception_handler(DependencyUnavailable)
+async def dependency_unavailable_handler(request: Request, exc: DependencyUnavailable):
+    """A fail-closed dependency is down (or its circuit is open)"""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Service temporarily unavailable. Please try again later."},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -49,13 +179,31 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint for monitoring"""
+    """Liveness check: the process serves requests (no dependency checks)"""
     return {
         "status": "healthy",
         "service": "secureshare-backend",
     }
 
 
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """
+    Readiness check: required dependencies are up
+
+    Served from the background prober's cached results, so probes are free.
+    """
+    if not container.ready:
+        response.status_code = 503
+    return container.status()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics endpoint"""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,47 @@
+"""
+Load Shedding Middleware
+Rejects uploads up front while a critical dependency is down
+
+Uploads need the database and object storage; if either is known to be
+down (from the container's cached health checks), the upload would only
+time out after the body was received. It is refused with 503 and
+Retry-After before the body is read instead.
+"""
+from typing import Callable
+
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.config import settings
+from app.core.container import container
+from app.core.metrics import LOAD_SHED_REQUESTS
+
+
+class LoadSheddingMiddleware(BaseHTTPMiddleware):
+    """503 on uploads while a required dependency is unavailable"""
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        """Shed the request if it is an upload and a dependency is down"""
+
+        if (
+            not settings.LOAD_SHEDDING_ENABLED
+            or request.method != "POST"
+            or "/upload" not in request.url.path
+        ):
+            return await call_next(request)
+
+        unavailable = container.unavailable()
+        if not unavailable:
+            return await call_next(request)
+
+        for name in unavailable:
+            LOAD_SHED_REQUESTS.labels(dependency=name).inc()
+        return JSONResponse(
+            status_code=503,
+            content={
+                "detail": "Service temporarily unavailable. Please try again later.",
+                "unavailable": unavailable,
+            },
+            headers={"Retry-After": str(settings.LOAD_SHEDDING_RETRY_AFTER_SECONDS)},
+        )
@@ -0,0 +1,251 @@
+"""
+Profiling Middleware
+On-demand wall-clock profiling of individual requests
+
+A request is profiled when it carries the admin X-Profile-Token header or
+is picked by PROFILING_SAMPLE_RATE. Its stack samples are written as a
+speedscope file, next to a JSON file with the per-stage timings of the
+upload/download pipeline, in a bounded on-disk ring (PROFILING_DIR).
+
+Uses pyinstrument (async-aware) when installed, otherwise a built-in
+sampler of every thread. pyinstrument profiles one request at a time (it
+refuses to start a second async profiler on the event loop): requests
+profiled meanwhile use the built-in sampler. pyinstrument only sees the event-loop thread:
+the work the request hands to thread pools (crypto, scan, storage) is
+missing from its profiles, while the built-in sampler records it along
+with whatever other requests run at the same time.
+
+Profiles are named after the route template, never the request path:
+download paths carry the one-time token.
+"""
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Tuple
+
+from fastapi import Request, Response
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.config import settings
+from app.core.timing import get_stage_timer
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover
+    pyinstrument = None
+
+PROFILE_HEADER = "X-Profile-Token"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+# Innermost frames of a thread waiting for work
+IDLE_MODULES = {"threading.py", "queue.py", "selectors.py", "thread.py"}
+# Held while a request is profiled with pyinstrument
+_pyinstrument_lock = threading.Lock()
+
+
+class StackSampler:
+    """
+    Samples the stacks of all threads at a fixed interval
+
+    A request's crypto, scan and storage work runs in pool threads, not in
+    the event-loop thread that dispatches it, so every thread is sampled
+    and gets its own profile. Threads idle for the whole request are left
+    out. The loop and the pools are shared: work done at the same time for
+    other requests shows up in the profile too.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples: Dict[int, List[Tuple[Tuple[str, str, int], ...]]] = {}
+        self.weights: Dict[int, List[float]] = {}
+        self.names: Dict[int, str] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id == self._thread.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, frame.f_lineno))
+                    frame = frame.f_back
+                self.samples.setdefault(thread_id, []).append(tuple(reversed(stack)))
+                self.weights.setdefault(thread_id, []).append(now - last)
+                self.names.setdefault(thread_id, names.get(thread_id, str(thread_id)))
+            last = now
+
+    @staticmethod
+    def _idle(stack: Tuple[Tuple[str, str, int], ...]) -> bool:
+        """Whether a sample is a thread waiting for work (pool queue, selector)"""
+        return not stack or os.path.basename(stack[-1][1]) in IDLE_MODULES
+
+    def start(self) -> None:
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._duration = time.perf_counter() - self._started
+
+    def speedscope(self, name: str) -> Dict:
+        """Export samples in speedscope's sampled-profile format, one profile per thread"""
+        frames: List[Dict] = []
+        index: Dict[Tuple[str, str, int], int] = {}
+        profiles = []
+        for thread_id, stacks in self.samples.items():
+            if all(self._idle(stack) for stack in stacks):
+                continue
+            samples = []
+            for stack in stacks:
+                sample = []
+                for frame in stack:
+                    if frame not in index:
+                        index[frame] = len(frames)
+                        frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                    sample.append(index[frame])
+                samples.append(sample)
+            profiles.append({
+                "type": "sampled",
+                "name": f"{name} [{self.names[thread_id]}]",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": self._duration,
+                "samples": samples,
+                "weights": self.weights[thread_id],
+            })
+
+        return {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": name,
+            "exporter": "secureshare",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """
+    Opt-in per-request profiler
+
+    Profiles cover the handler until it returns its response; the body of
+    streaming responses is sent afterwards and is not included.
+    """
+
+    def _requested(self, request: Request) -> bool:
+        token = request.headers.get(PROFILE_HEADER)
+        return bool(
+            token
+            and settings.PROFILING_ADMIN_TOKEN
+            and hmac.compare_digest(token, settings.PROFILING_ADMIN_TOKEN)
+        )
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        """Profile the request if requested or sampled"""
+
+        requested = self._requested(request)
+        if not requested and random.random() >= settings.PROFILING_SAMPLE_RATE:
+            return await call_next(request)
+
+        profile_id = f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        timer = get_stage_timer(request)
+
+        profiler = self._start()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = await call_next(request)
+        finally:
+            duration = time.perf_counter() - start
+            self._stop(profiler)
+            # The route template, never the path: download paths carry the token
+            route = request.scope.get("route")
+            name = f"{request.method} {route.path if route is not None else '<unmatched>'}"
+            stages = {
+                "id": profile_id,
+                "request": name,
+                "status": response.status_code if response else 500,
+                "duration_ms": duration * 1000,
+                "stages_ms": {k: v * 1000 for k, v in timer.stages.items()},
+                "trigger": "header" if requested else "sampled",
+            }
+            await run_in_threadpool(self._write, profile_id, name, profiler, stages)
+
+        if requested:
+            response.headers["X-Profile-Id"] = profile_id
+        return response
+
+    @staticmethod
+    def _start():
+        """Start pyinstrument if installed and free, otherwise the built-in sampler"""
+        if pyinstrument is not None and _pyinstrument_lock.acquire(blocking=False):
+            profiler = pyinstrument.Profiler(
+                interval=settings.PROFILING_INTERVAL_MS / 1000, async_mode="enabled"
+            )
+            try:
+                profiler.start()
+                return profiler
+            except Exception as e:
+                _pyinstrument_lock.release()
+                print(f"pyinstrument failed to start, using the built-in sampler: {e}")
+
+        profiler = StackSampler(settings.PROFILING_INTERVAL_MS / 1000)
+        profiler.start()
+        return profiler
+
+    @staticmethod
+    def _stop(profiler) -> None:
+        if isinstance(profiler, StackSampler):
+            profiler.stop()
+            return
+        try:
+            profiler.stop()
+        finally:
+            _pyinstrument_lock.release()
+
+    def _write(self, profile_id: str, name: str, profiler, stages: Dict) -> None:
+        """Write the profile to the ring directory and drop the oldest ones"""
+        try:
+            os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+            slug = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-")[:60]
+            base = os.path.join(settings.PROFILING_DIR, f"{profile_id}-{slug}")
+
+            if not isinstance(profiler, StackSampler):
+                from pyinstrument.renderers import SpeedscopeRenderer
+                content = profiler.output(SpeedscopeRenderer())
+            else:
+                content = json.dumps(profiler.speedscope(name))
+            with open(f"{base}.speedscope.json", "w") as f:
+                f.write(content)
+            with open(f"{base}.stages.json", "w") as f:
+                json.dump(stages, f)
+
+            self._prune()
+        except Exception as e:
+            print(f"Profile write failed: {e}")
+
+    @staticmethod
+    def _prune() -> None:
+        profiles = sorted(
+            name for name in os.listdir(settings.PROFILING_DIR)
+            if name.endswith(".speedscope.json")
+        )
+        for name in profiles[: max(0, len(profiles) - settings.PROFILING_MAX_FILES)]:
+            base = name[: -len(".speedscope.json")]
+            for suffix in (".speedscope.json", ".stages.json"):
+                path = os.path.join(settings.PROFILING_DIR, base + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
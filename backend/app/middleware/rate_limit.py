@@ -9,6 +9,7 @@ from fastapi import Request, Response, HTTPException
 from starlette.middleware.base import BaseHTTPMiddleware
 import redis
 
+from app.core.circuit_breaker import CircuitOpen, breakers
 from app.core.config import settings
 
 
@@ -20,6 +21,9 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
     - Global: 100 requests per minute per IP
     - Upload: 10 requests per hour per IP
     - Download: 50 requests per hour per IP
+
+    Fails open: while Redis is unreachable (or its circuit is open)
+    requests are let through without rate limiting.
     """
 
     def __init__(self, app):
@@ -30,10 +34,34 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             self.redis_client = redis.from_url(
                 settings.REDIS_URL,
                 decode_responses=True,
+                socket_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
+                socket_connect_timeout=settings.RATE_LIMIT_REDIS_TIMEOUT,
             )
         else:
             self.redis_client = None
 
+    def _hit(self, key: str, limit: int, window: int, current_time: int) -> bool:
+        """
+        Record a request in a sliding window
+
+        Returns:
+            bool: True if the limit was already reached (request not recorded)
+        """
+        # Remove expired entries (older than window)
+        min_score = current_time - window
+        self.redis_client.zremrangebyscore(key, 0, min_score)
+
+        # Count requests in current window
+        if self.redis_client.zcard(key) >= limit:
+            return True
+
+        # Add current request to sorted set
+        self.redis_client.zadd(key, {str(current_time): current_time})
+
+        # Set expiration on key (cleanup)
+        self.redis_client.expire(key, window)
+        return False
+
     async def dispatch(self, request: Request, call_next: Callable) -> Response:
         """Process request with rate limiting"""
 
@@ -85,32 +113,23 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
 
             # Sliding window rate limit check
             try:
-                # Remove expired entries (older than window)
-                min_score = current_time - window
-                self.redis_client.zremrangebyscore(key, 0, min_score)
-
-                # Count requests in current window
-                request_count = self.redis_client.zcard(key)
-
-                if request_count >= limit:
-                    # Rate limit exceeded
-                    raise HTTPException(
-                        status_code=429,
-                        detail=message,
-                        headers={"Retry-After": str(window)},
-                    )
-
-                # Add current request to sorted set
-                self.redis_client.zadd(key, {str(current_time): current_time})
-
-                # Set expiration on key (cleanup)
-                self.redis_client.expire(key, window)
-
-            except HTTPException:
-                raise
+                with breakers["redis"].call():
+                    exceeded = self._hit(key, limit, window, current_time)
+            except CircuitOpen:
+                # Redis is down: skip the remaining limits without waiting on it
+                break
             except Exception as e:
                 # Log error but don't block request if Redis fails
                 print(f"Rate limit check failed: {e}")
+                continue
+
+            if exceeded:
+                # Rate limit exceeded
+                raise HTTPException(
+                    status_code=429,
+                    detail=message,
+                    headers={"Retry-After": str(window)},
+                )
 
         # Process request
         response = await call_next(request)
@@ -0,0 +1,46 @@
+"""
+Tracing Middleware
+Starts a trace per request, continuing the caller's W3C traceparent
+"""
+from typing import Callable
+
+from fastapi import Request, Response
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.core.tracing import STATUS_ERROR, tracer
+
+
+class TracingMiddleware(BaseHTTPMiddleware):
+    """
+    Records each request as a server span
+
+    The span ends when the handler returns its response; the body of
+    streaming downloads is sent afterwards and is not included.
+
+    Only the matched route template is recorded, never the request path:
+    download paths carry the one-time token.
+    """
+
+    async def dispatch(self, request: Request, call_next: Callable) -> Response:
+        """Wrap the request in a root span"""
+
+        # Renamed after routing, once the route template is known
+        with tracer.start_trace(
+            request.method,
+            traceparent=request.headers.get("traceparent"),
+        ) as span:
+            if not span.sampled:
+                return await call_next(request)
+
+            span.set_attribute("http.method", request.method)
+            response = await call_next(request)
+
+            route = request.scope.get("route")
+            if route is not None:
+                span.name = f"{request.method} {route.path}"
+                span.set_attribute("http.route", route.path)
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                span.status = STATUS_ERROR
+            response.headers["traceresponse"] = span.traceparent
+            return response
@@ -1,5 +1,8 @@
 """Database models"""
 from app.models.file import File
 from app.models.audit_log import AuditLog
+from app.models.blob import Blob
+from app.models.bundle import Bundle
+from app.models.inline_object import InlineObject
 
-__all__ = ["File", "AuditLog"]
+__all__ = ["File", "AuditLog", "Blob", "Bundle", "InlineObject"]
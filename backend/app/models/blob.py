@@ -0,0 +1,38 @@
+"""
+Blob model - Shared ciphertext objects for deduplicated storage
+"""
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, BigInteger, DateTime, Integer, JSON
+
+from app.core.database import Base
+from app.core.types import GUID
+
+
+class Blob(Base):
+    """Content-addressed encrypted object shared by one or more files"""
+
+    __tablename__ = "blobs"
+
+    # Primary key
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+
+    # Keyed content hash: HMAC-SHA256(dedup key, scope + plaintext)
+    content_hash = Column(String(64), unique=True, nullable=False, index=True)
+
+    # Storage
+    storage_key = Column(String(255), unique=True, nullable=False)  # S3 object key
+    encryption_metadata = Column(JSON, nullable=False)  # IV, wrapped DEK, KEK version
+    size = Column(BigInteger, nullable=False)  # ciphertext bytes
+
+    # Number of files rows referencing this blob
+    ref_count = Column(Integer, nullable=False, default=0)
+
+    # Audit
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = Column(
+        DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+    def __repr__(self):
+        return f"<Blob {self.id} - {self.ref_count} refs>"
@@ -0,0 +1,40 @@
+"""
+Bundle model - One download token for a set of files
+"""
+import uuid
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, Integer
+
+from app.core.database import Base
+from app.core.types import GUID
+
+
+class Bundle(Base):
+    """Set of files shared (and downloaded once) with a single token"""
+
+    __tablename__ = "bundles"
+
+    # Primary key
+    id = Column(GUID(), primary_key=True, default=uuid.uuid4)
+
+    # Token (hashed)
+    token_hash = Column(String(64), unique=True, nullable=False, index=True)
+
+    # Members
+    file_count = Column(Integer, nullable=False)
+
+    # User tracking (anonymized)
+    ip_hash = Column(String(64), nullable=False, index=True)
+
+    # Timestamps
+    expires_at = Column(DateTime, nullable=False, index=True)
+    downloaded_at = Column(DateTime, nullable=True)  # NULL = not yet downloaded
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Bundle {self.id} - {self.file_count} files>"
+
+    @property
+    def is_available(self) -> bool:
+        """Check if bundle is available for download"""
+        return datetime.utcnow() <= self.expires_at and self.downloaded_at is None
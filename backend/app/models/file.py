@@ -4,6 +4,7 @@ File model - Stores metadata for uploaded files
 import uuid
 from datetime import datetime, timedelta
 from sqlalchemy import Column, String, BigInteger, DateTime, Integer, JSON, Boolean
+from sqlalchemy import ForeignKey
 
 from app.core.database import Base
 from app.core.types import GUID
@@ -26,7 +27,13 @@ class File(Base):
     file_size = Column(BigInteger, nullable=False)  # bytes
 
     # Storage
-    storage_key = Column(String(255), unique=True, nullable=False)  # S3 object key
+    storage_key = Column(String(255), nullable=False, index=True)  # S3 object key
+    blob_id = Column(
+        GUID(), ForeignKey("blobs.id", ondelete="SET NULL"), nullable=True, index=True
+    )  # Shared blob when deduplicated
+    bundle_id = Column(
+        GUID(), ForeignKey("bundles.id", ondelete="CASCADE"), nullable=True, index=True
+    )  # Bundle the file was uploaded in (bundle uploads only)
 
     # Encryption metadata
     encryption_metadata = Column(JSON, nullable=True)  # IV, tag, KEK version
@@ -0,0 +1,25 @@
+"""
+InlineObject model - Small ciphertexts stored in Postgres instead of MinIO
+"""
+from datetime import datetime
+from sqlalchemy import Column, String, DateTime, LargeBinary
+
+from app.core.database import Base
+
+
+class InlineObject(Base):
+    """Ciphertext of a small file, addressed by its storage key"""
+
+    __tablename__ = "inline_objects"
+
+    # Same key the object would have in MinIO (files/blobs storage_key)
+    storage_key = Column(String(255), primary_key=True)
+
+    # Segmented ciphertext (bytea, kept out of line by TOAST when large)
+    data = Column(LargeBinary, nullable=False)
+
+    # Audit
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<InlineObject {self.storage_key} - {len(self.data)} bytes>"
@@ -1,4 +1,14 @@
 """Pydantic schemas for request/response validation"""
-from app.schemas.file import FileUploadResponse, FileInfoResponse
+from app.schemas.file import (
+    FileUploadResponse,
+    FileInfoResponse,
+    BatchUploadResponse,
+    BundleUploadResponse,
+)
 
-__all__ = ["FileUploadResponse", "FileInfoResponse"]
+__all__ = [
+    "FileUploadResponse",
+    "FileInfoResponse",
+    "BatchUploadResponse",
+    "BundleUploadResponse",
+]
@@ -2,7 +2,7 @@
 File schemas for API requests and responses
 """
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -31,6 +31,34 @@ class FileUploadResponse(BaseModel):
         }
 
 
+class BundleMember(BaseModel):
+    """File included in a bundle"""
+
+    file_id: str
+    filename: str
+    file_size: int
+    mime_type: str
+
+
+class BundleUploadResponse(BaseModel):
+    """Single token covering every file of a batch upload"""
+
+    bundle_id: str = Field(..., description="Unique bundle identifier")
+    download_url: str = Field(..., description="One-time download URL (ZIP of all files)")
+    download_token: str = Field(..., description="Download token")
+    expires_at: datetime = Field(..., description="Expiration timestamp (UTC)")
+    files: List[BundleMember]
+
+
+class BatchUploadResponse(BaseModel):
+    """Response after a batch upload: per-file tokens, or one bundle token"""
+
+    files: List[FileUploadResponse] = Field(
+        default_factory=list, description="Per-file tokens (empty for bundles)"
+    )
+    bundle: Optional[BundleUploadResponse] = None
+
+
 class FileInfoResponse(BaseModel):
     """File metadata without downloading"""
 
@@ -1,66 +1,130 @@
 """
 Antivirus Service - ClamAV integration
 """
+import socket
+import struct
 import clamd
-from typing import Tuple
+from typing import Optional, Tuple
 
+from app.core.circuit_breaker import CircuitOpen, DependencyUnavailable, breakers
 from app.core.config import settings
+from app.core.limiter import LimitExceeded, limiters
+from app.core.tracing import tracer
+
+STREAM_CHUNK_SIZE = 64 * 1024  # must stay below StreamMaxLength in clamd.conf
 
 
 class AntivirusService:
     """Service for malware scanning using ClamAV"""
 
     def __init__(self):
-        if settings.ANTIVIRUS_ENABLED:
-            try:
-                self.client = clamd.ClamdNetworkSocket(
-                    host=settings.CLAMAV_HOST,
-                    port=settings.CLAMAV_PORT,
-                    timeout=settings.CLAMAV_TIMEOUT,
-                )
-                # Test connection
-                self.client.ping()
-                self.available = True
-            except Exception as e:
-                print(f"ClamAV not available: {e}")
-                self.available = False
-        else:
+        # Unknown until connect() runs (at startup, or on the first scan)
+        self.available: Optional[bool] = None
+
+    def connect(self) -> None:
+        """
+        Ping ClamAV, waiting at most CLAMAV_CONNECT_TIMEOUT seconds
+
+        Raises:
+            Exception: If ClamAV is enabled but unreachable
+        """
+        if not settings.ANTIVIRUS_ENABLED:
+            self.available = False
+            return
+
+        try:
+            client = clamd.ClamdNetworkSocket(
+                host=settings.CLAMAV_HOST,
+                port=settings.CLAMAV_PORT,
+                timeout=settings.CLAMAV_CONNECT_TIMEOUT,
+            )
+            client.ping()
+            self.available = True
+        except Exception:
             self.available = False
+            raise
 
+    def _instream(self, data) -> str:
+        """
+        Send data to clamd with INSTREAM and return its reply
+
+        Chunks are memoryview slices of the caller's buffer: nothing is
+        copied (clamd.instream re-reads the data 1 KiB at a time).
+        """
+        view = memoryview(data)
+        with socket.create_connection(
+            (settings.CLAMAV_HOST, settings.CLAMAV_PORT), timeout=settings.CLAMAV_TIMEOUT
+        ) as sock:
+            sock.sendall(b"nINSTREAM\n")
+            for offset in range(0, len(view), STREAM_CHUNK_SIZE):
+                chunk = view[offset:offset + STREAM_CHUNK_SIZE]
+                sock.sendall(struct.pack("!L", len(chunk)))
+                sock.sendall(chunk)
+            sock.sendall(struct.pack("!L", 0))
+
+            with sock.makefile("rb") as reply:
+                return reply.readline().decode("utf-8").strip()
+
+    @tracer.traced("antivirus.scan")
     def scan_file(self, data: bytes) -> Tuple[bool, str]:
         """
         Scan file for malware
 
         Args:
-            data: File content as bytes
+            data: File content (any bytes-like object)
 
         Returns:
             Tuple[bool, str]: (is_clean, result)
                 - is_clean: True if file is clean
                 - result: Scan result message
+
+        Raises:
+            LimitExceeded: If clamd is at its adaptive concurrency limit
+            DependencyUnavailable: If clamd is unreachable, fails or its
+                circuit is open and CLAMAV_FAIL_POLICY is "closed"
         """
+        fail_closed = settings.CLAMAV_FAIL_POLICY == "closed"
+        if self.available is None:
+            try:
+                self.connect()
+            except Exception as e:
+                print(f"ClamAV not available: {e}")
+                if fail_closed:
+                    raise DependencyUnavailable("antivirus") from e
+
         if not self.available:
+            if fail_closed and settings.ANTIVIRUS_ENABLED:
+                # Down since startup or the last readiness probe
+                raise DependencyUnavailable("antivirus")
             # If ClamAV is not available, consider file clean (development mode)
             return True, "Antivirus not available - scan skipped"
 
         try:
-            # ClamAV instream requires a file-like object or uses the buffer interface
-            import io
-            file_stream = io.BytesIO(data)
-            result = self.client.instream(file_stream)
-            status = result["stream"]
+            # Reply: "stream: OK", "stream: <signature> FOUND" or "... ERROR"
+            with breakers["antivirus"].call():
+                with limiters["antivirus"].limit_calls(len(data)):
+                    result = self._instream(data)
 
-            if status[0] == "OK":
+            if result.endswith(" OK"):
                 return True, "Clean"
-            elif status[0] == "FOUND":
-                return False, f"Malware detected: {status[1]}"
+            elif result.endswith(" FOUND"):
+                signature = result[:-len(" FOUND")].split(": ", 1)[-1]
+                return False, f"Malware detected: {signature}"
             else:
-                return False, f"Scan error: {status}"
+                return False, f"Scan error: {result}"
 
+        except CircuitOpen:
+            if fail_closed:
+                raise
+            return True, "Antivirus circuit open - scan skipped"
+        except LimitExceeded:
+            # Never skip the scan because clamd is saturated: fail the upload
+            raise
         except Exception as e:
             print(f"Antivirus scan error: {e}")
-            # In development, log error but allow upload
-            # In production, this should reject the file
+            if fail_closed:
+                raise DependencyUnavailable("antivirus") from e
+            # Fail-open policy (development): log the error but allow the upload
             return True, f"Scan skipped due to error: {str(e)}"
 
 
@@ -0,0 +1,163 @@
+"""
+Cache Service - Redis cache for file info lookups
+
+Caches FileInfoResponse payloads by token hash with a short TTL, plus
+negative entries for unknown hashes, so repeated /info lookups (link
+previews, refresh storms, invalid-token floods) don't reach Postgres.
+Redis calls go through the "redis" circuit breaker and fail open: while
+the circuit is open every lookup is a miss.
+
+A download claim replaces the entry with a "claimed" marker rather than
+deleting it, and info is only cached where no entry exists: a lookup that
+read the row just before the claim can't cache it as available again.
+"""
+import os
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.core.circuit_breaker import CircuitOpen, breakers
+from app.core.config import settings
+from app.schemas.file import FileInfoResponse
+
+
+class InfoCache:
+    """Short-TTL cache of file info keyed by token hash"""
+
+    KEY_PREFIX = "fileinfo:"
+    MISSING = "-"
+    CLAIMED = "!"
+
+    def __init__(self):
+        self._client: Optional[object] = None
+        # In-memory cache for testing: key -> (value, expires_at)
+        self._test_storage: dict = {}
+
+    @property
+    def client(self):
+        """Lazy initialization of Redis client"""
+        if self._client is None and not self._is_test_mode():
+            import redis
+            self._client = redis.from_url(
+                settings.REDIS_URL,
+                decode_responses=True,
+                socket_timeout=settings.INFO_CACHE_REDIS_TIMEOUT,
+                socket_connect_timeout=settings.INFO_CACHE_REDIS_TIMEOUT,
+            )
+        return self._client
+
+    def _is_test_mode(self) -> bool:
+        """Check if running in test mode"""
+        return os.environ.get("ENVIRONMENT") == "test"
+
+    def _get(self, key: str) -> Optional[str]:
+        if self._is_test_mode():
+            value, expires_at = self._test_storage.get(key, (None, 0.0))
+            return value if expires_at > time.monotonic() else None
+        with breakers["redis"].call():
+            return self.client.get(key)
+
+    def _set(self, key: str, value: str, ttl: int, nx: bool = False) -> None:
+        if self._is_test_mode():
+            if nx and self._get(key) is not None:
+                return
+            self._test_storage[key] = (value, time.monotonic() + ttl)
+            return
+        with breakers["redis"].call():
+            self.client.set(key, value, ex=ttl, nx=nx)
+
+    def get(self, token_hash: str) -> Tuple[bool, Optional[FileInfoResponse]]:
+        """
+        Look up cached file info
+
+        Returns:
+            Tuple[bool, Optional[FileInfoResponse]]: (hit, info)
+                - hit: True if the cache answered (a claimed file is a
+                  miss: the database tells why it is gone)
+                - info: Cached info, or None for a cached unknown token
+        """
+        if not settings.INFO_CACHE_ENABLED:
+            return False, None
+
+        try:
+            value = self._get(self.KEY_PREFIX + token_hash)
+        except CircuitOpen:
+            return False, None
+        except Exception as e:
+            # Cache failures must never block lookups
+            print(f"Info cache read failed: {e}")
+            return False, None
+
+        if value is None or value == self.CLAIMED:
+            return False, None
+        if value == self.MISSING:
+            return True, None
+        return True, FileInfoResponse.model_validate_json(value)
+
+    def set(self, token_hash: str, info: FileInfoResponse) -> None:
+        """Cache file info, never beyond the file's expiration (or over a claim)"""
+        if not settings.INFO_CACHE_ENABLED:
+            return
+
+        remaining = int((info.expires_at - datetime.utcnow()).total_seconds())
+        ttl = min(settings.INFO_CACHE_TTL_SECONDS, remaining)
+        if ttl <= 0:
+            return
+
+        try:
+            self._set(self.KEY_PREFIX + token_hash, info.model_dump_json(), ttl, nx=True)
+        except CircuitOpen:
+            pass
+        except Exception as e:
+            print(f"Info cache write failed: {e}")
+
+    def set_missing(self, token_hash: str) -> None:
+        """Cache a negative entry for an unknown token hash"""
+        if not settings.INFO_CACHE_ENABLED:
+            return
+
+        try:
+            self._set(
+                self.KEY_PREFIX + token_hash,
+                self.MISSING,
+                settings.INFO_CACHE_NEGATIVE_TTL_SECONDS,
+            )
+        except CircuitOpen:
+            pass
+        except Exception as e:
+            print(f"Info cache write failed: {e}")
+
+    def mark_claimed(self, token_hash: str) -> None:
+        """Replace the cached entry once the file is claimed (lasts a cache TTL)"""
+        if not settings.INFO_CACHE_ENABLED:
+            return
+
+        try:
+            self._set(
+                self.KEY_PREFIX + token_hash, self.CLAIMED, settings.INFO_CACHE_TTL_SECONDS
+            )
+        except CircuitOpen:
+            pass
+        except Exception as e:
+            print(f"Info cache write failed: {e}")
+
+    def invalidate(self, token_hash: str) -> None:
+        """Drop the cached entry (scan status change, new upload)"""
+        if not settings.INFO_CACHE_ENABLED:
+            return
+
+        key = self.KEY_PREFIX + token_hash
+        try:
+            if self._is_test_mode():
+                self._test_storage.pop(key, None)
+            else:
+                with breakers["redis"].call():
+                    self.client.delete(key)
+        except CircuitOpen:
+            pass
+        except Exception as e:
+            print(f"Info cache invalidation failed: {e}")
+
+
+# Singleton instance
+info_cache = InfoCache()
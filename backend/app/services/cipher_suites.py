@@ -0,0 +1,136 @@
+"""
+Cipher Suites - AEAD algorithms for file payloads
+
+Every suite takes a 256-bit key and a 96-bit nonce and appends a 16-byte
+tag, so the segmented format is the same whichever one sealed a file; the
+suite's name is recorded in encryption_metadata["algorithm"] and any
+registered suite decrypts, whatever is allowed for new files.
+
+Which suite is fastest depends on the host: AES-GCM wins with AES-NI,
+ChaCha20-Poly1305 without it. With ENCRYPTION_SUITE=auto a short
+benchmark at startup picks the fastest of ENCRYPTION_ALLOWED_SUITES.
+"""
+import os
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives.ciphers import aead
+
+DEFAULT_SUITE = "AES-256-GCM"
+KEY_SIZE = 32
+NONCE_SIZE = 12
+BENCHMARK_ROUNDS = 3
+
+
+class CipherSuite:
+    """
+    An AEAD algorithm usable for file payloads
+
+    Args:
+        name: Name recorded in encryption metadata
+        factory: AEAD class taking the key (None if this cryptography
+            release doesn't provide it)
+    """
+
+    def __init__(self, name: str, factory: Optional[Callable]):
+        self.name = name
+        self.factory = factory
+        self._available: Optional[bool] = None
+
+    @property
+    def available(self) -> bool:
+        """Whether the installed OpenSSL supports the algorithm"""
+        if self._available is None:
+            self._available = self.factory is not None
+            if self._available:
+                try:
+                    self.factory(bytes(KEY_SIZE))
+                except UnsupportedAlgorithm:
+                    self._available = False
+        return self._available
+
+    def aead(self, key: bytes):
+        """AEAD instance for a data key"""
+        return self.factory(key)
+
+    def benchmark(self, size: int) -> float:
+        """
+        Measure encryption throughput (best of BENCHMARK_ROUNDS)
+
+        Args:
+            size: Payload size in bytes
+
+        Returns:
+            float: Bytes per second
+        """
+        cipher = self.aead(os.urandom(KEY_SIZE))
+        data = bytes(size)
+        nonce = os.urandom(NONCE_SIZE)
+        best = float("inf")
+        for _ in range(BENCHMARK_ROUNDS):
+            started = time.perf_counter()
+            cipher.encrypt(nonce, data, None)
+            best = min(best, time.perf_counter() - started)
+        return size / max(best, 1e-9)
+
+
+SUITES: Dict[str, CipherSuite] = {
+    suite.name: suite
+    for suite in (
+        CipherSuite("AES-256-GCM", aead.AESGCM),
+        CipherSuite("ChaCha20-Poly1305", aead.ChaCha20Poly1305),
+        # Nonce-misuse resistant; needs OpenSSL 3.2+
+        CipherSuite("AES-256-GCM-SIV", getattr(aead, "AESGCMSIV", None)),
+    )
+}
+
+
+def get_suite(name: str) -> CipherSuite:
+    """
+    Look up a suite by its metadata name
+
+    Raises:
+        ValueError: If the suite is unknown or not supported on this host
+    """
+    suite = SUITES.get(name)
+    if suite is None:
+        raise ValueError(f"Unknown cipher suite: {name}")
+    if not suite.available:
+        raise ValueError(f"Cipher suite not supported on this host: {name}")
+    return suite
+
+
+def allowed_suites(value: str) -> List[CipherSuite]:
+    """
+    Parse a comma-separated suite list, keeping the suites available here
+
+    Raises:
+        ValueError: If a name is unknown or no listed suite is available
+    """
+    suites = []
+    for name in (item.strip() for item in value.split(",")):
+        if not name:
+            continue
+        if name not in SUITES:
+            raise ValueError(f"Unknown cipher suite: {name}")
+        if SUITES[name].available:
+            suites.append(SUITES[name])
+    if not suites:
+        raise ValueError(f"No available cipher suite in: {value}")
+    return suites
+
+
+def fastest_suite(suites: List[CipherSuite], size: int) -> Tuple[str, Dict[str, float]]:
+    """
+    Benchmark suites and pick the fastest
+
+    Args:
+        suites: Candidate suites
+        size: Benchmark payload size in bytes
+
+    Returns:
+        Tuple[str, Dict[str, float]]: (fastest suite name, bytes/s by suite)
+    """
+    results = {suite.name: suite.benchmark(size) for suite in suites}
+    return max(results, key=results.get), results
@@ -0,0 +1,133 @@
+"""
+Compression Service - zstd compression stage before encryption
+
+Compressible uploads (text, logs, legacy office documents) are compressed
+before encryption; ciphertext can't be compressed afterwards. Formats that
+are already compressed are skipped by MIME type, and an entropy probe on
+a sample skips anything else that wouldn't shrink.
+"""
+import math
+from typing import Iterable, Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from app.core import metrics
+from app.core.config import settings
+
+# Already-compressed formats: compressing again only burns CPU
+PRECOMPRESSED_MIME_TYPES = frozenset({
+    "image/jpeg",
+    "image/png",
+    "image/gif",
+    "image/webp",
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/gzip",
+    "application/x-7z-compressed",
+    "application/x-rar-compressed",
+    "application/x-bzip2",
+    "application/x-xz",
+    "application/zstd",
+})
+PRECOMPRESSED_MIME_PREFIXES = (
+    "video/",
+    "audio/",
+    "application/vnd.openxmlformats-officedocument.",  # docx/xlsx/pptx are zip
+)
+
+ENTROPY_SAMPLE_SIZE = 64 * 1024
+DECOMPRESS_CHUNK_SIZE = 1024 * 1024
+
+
+class CompressionService:
+    """Service for transparent compression of file payloads"""
+
+    @property
+    def available(self) -> bool:
+        return settings.COMPRESSION_ENABLED and zstandard is not None
+
+    @staticmethod
+    def entropy(sample: bytes) -> float:
+        """Shannon entropy of a sample in bits per byte (0-8)"""
+        if not sample:
+            return 0.0
+        total = len(sample)
+        result = 0.0
+        for byte in range(256):
+            count = sample.count(byte)
+            if count:
+                p = count / total
+                result -= p * math.log2(p)
+        return result
+
+    def should_compress(self, data: bytes, mime_type: str) -> bool:
+        """Decide whether compressing this payload is worthwhile"""
+        if not self.available or len(data) < settings.COMPRESSION_MIN_SIZE:
+            return False
+
+        mime_type = (mime_type or "").lower()
+        if mime_type in PRECOMPRESSED_MIME_TYPES or mime_type.startswith(
+            PRECOMPRESSED_MIME_PREFIXES
+        ):
+            return False
+
+        return self.entropy(data[:ENTROPY_SAMPLE_SIZE]) <= settings.COMPRESSION_MAX_ENTROPY
+
+    def compress(self, data: bytes, mime_type: str) -> Tuple[bytes, str]:
+        """
+        Compress data if worthwhile
+
+        Args:
+            data: Plaintext file content
+            mime_type: MIME type of the content
+
+        Returns:
+            Tuple[bytes, str]: (payload, compression)
+                - payload: Data to encrypt
+                - compression: "zstd" or "none" (recorded in encryption metadata)
+        """
+        if not self.should_compress(data, mime_type):
+            return data, "none"
+
+        compressed = zstandard.ZstdCompressor(level=settings.COMPRESSION_LEVEL).compress(data)
+        if len(compressed) >= len(data):
+            return data, "none"
+
+        metrics.COMPRESSION_BYTES.labels(stage="input").inc(len(data))
+        metrics.COMPRESSION_BYTES.labels(stage="output").inc(len(compressed))
+        return compressed, "zstd"
+
+    def decompress_stream(self, chunks: Iterable[bytes], compression: str) -> Iterator[bytes]:
+        """
+        Stream-decompress a payload
+
+        Args:
+            chunks: Decrypted payload chunks
+            compression: Compression recorded in encryption metadata
+
+        Yields:
+            bytes: Plaintext chunks
+        """
+        if compression in (None, "none"):
+            yield from chunks
+            return
+        if compression != "zstd":
+            raise ValueError(f"Unsupported compression: {compression}")
+
+        decompressor = zstandard.ZstdDecompressor().decompressobj()
+        for chunk in chunks:
+            view = memoryview(chunk)
+            for offset in range(0, len(view), DECOMPRESS_CHUNK_SIZE):
+                output = decompressor.decompress(view[offset:offset + DECOMPRESS_CHUNK_SIZE])
+                if output:
+                    yield output
+        remainder = decompressor.flush()
+        if remainder:
+            yield remainder
+
+
+# Singleton instance
+compression_service = CompressionService()
@@ -0,0 +1,141 @@
+"""
+Dedup Service - Content-addressed storage with reference counting
+
+Identical uploads share one encrypted blob, addressed by a keyed content
+hash (HMAC, so stored hashes can't be used to confirm guessed content).
+Each files row holds one reference; the object is deleted only when the
+last reference is released.
+"""
+import hashlib
+import hmac
+import os
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.blob import Blob
+from app.models.file import File as FileModel
+from app.services.storage import storage_service
+
+
+class DedupService:
+    """Service for deduplicated blob storage"""
+
+    def _is_test_mode(self) -> bool:
+        """Check if running in test mode (SQLite doesn't support FOR UPDATE)"""
+        return os.environ.get("ENVIRONMENT") == "test"
+
+    def scope_for(self, ip_hash: str) -> str:
+        """
+        Dedup scope of an upload
+
+        "global" dedups across all uploads, "uploader" only within uploads
+        from the same (hashed) client, so one client can't probe whether
+        another already shared some content.
+        """
+        return ip_hash if settings.DEDUP_SCOPE == "uploader" else ""
+
+    def content_hash(self, data: bytes, scope: str = "") -> str:
+        """Keyed content hash: HMAC-SHA256(dedup key, scope + plaintext)"""
+        key = (settings.DEDUP_KEY or settings.SECRET_KEY).encode()
+        mac = hmac.new(key, scope.encode() + b"\0", hashlib.sha256)
+        mac.update(data)
+        return mac.hexdigest()
+
+    def _query(self, db: Session):
+        query = db.query(Blob)
+        if not self._is_test_mode():
+            query = query.with_for_update()
+        return query
+
+    def acquire(
+        self,
+        db: Session,
+        data: bytes,
+        scope: str,
+        store: Callable[[bytes, str], Tuple[Dict[str, str], int]],
+    ) -> Blob:
+        """
+        Take a reference on the blob for this content, storing it if new
+
+        The reference is added to the caller's transaction (not committed);
+        a new blob is inserted in a savepoint of it.
+
+        Args:
+            db: Database session
+            data: Plaintext content
+            scope: Dedup scope (see scope_for)
+            store: Callback encrypting and storing data under a storage key,
+                returning (encryption_metadata, ciphertext_size)
+
+        Returns:
+            Blob: Shared blob (ref_count already incremented)
+        """
+        content_hash = self.content_hash(data, scope)
+
+        for _ in range(2):
+            blob = self._query(db).filter(Blob.content_hash == content_hash).first()
+            if blob:
+                blob.ref_count += 1
+                db.flush()
+                return blob
+
+            blob_id = uuid.uuid4()
+            storage_key = f"{blob_id}.enc"
+            # Losing the race must only undo this blob (and its inline row),
+            # not the caller's transaction: a batch holds earlier files in it
+            savepoint = db.begin_nested()
+            try:
+                encryption_metadata, size = store(data, storage_key)
+                blob = Blob(
+                    id=blob_id,
+                    content_hash=content_hash,
+                    storage_key=storage_key,
+                    encryption_metadata=encryption_metadata,
+                    size=size,
+                    ref_count=1,
+                )
+                db.add(blob)
+                db.flush()
+            except IntegrityError:
+                # Lost a race with a concurrent upload of the same content
+                savepoint.rollback()
+                storage_service.delete_file(storage_key)
+                continue
+            except Exception:
+                savepoint.rollback()
+                raise
+            savepoint.commit()
+            return blob
+
+        raise RuntimeError("Could not acquire deduplicated blob")
+
+    def release(self, db: Session, file_record: FileModel) -> Optional[str]:
+        """
+        Drop a file's reference in the caller's transaction
+
+        Returns:
+            Optional[str]: Storage key to delete once the transaction is
+                committed, or None if other files still use the object
+        """
+        if file_record.blob_id is None:
+            return file_record.storage_key
+
+        blob = self._query(db).filter(Blob.id == file_record.blob_id).first()
+        if blob is None:
+            return None
+
+        blob.ref_count -= 1
+        if blob.ref_count > 0:
+            return None
+
+        # Last reference: no new upload can attach to it once committed
+        db.delete(blob)
+        return blob.storage_key
+
+
+# Singleton instance
+dedup_service = DedupService()
@@ -1,25 +1,286 @@
 """
-Encryption Service - AES-256-GCM encryption
+Encryption Service - AEAD envelope encryption
+
+Each file is encrypted with its own random data key (DEK). The DEK is
+wrapped with a versioned key-encryption key (KEK) and stored in the file's
+encryption metadata, so rotating the KEK only requires re-wrapping DEKs.
+KEKs are always AES-256-GCM; payloads use the cipher suite recorded in
+encryption_metadata["algorithm"] (see cipher_suites).
+
+Payloads use the "segmented" format: fixed-size plaintext segments, each
+sealed with its own nonce (IV prefix + segment index) and with the index
+and a final-segment flag as associated data, so segments can be decrypted
+one at a time while reordering and truncation are still detected. Files
+without a "format" entry were sealed as a single GCM message.
+
+Segments are independent, so whole-file encryption and decryption split
+them into contiguous runs sealed on a thread pool (ENCRYPTION_PARALLELISM
+threads, the calling thread included); each run writes its own slice of
+the output, which keeps segment order without any reassembly.
 """
 import os
-from typing import Tuple, Dict
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Callable, Tuple, Dict, Iterable, Iterator, List, Optional
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 
 from app.core.config import settings
+from app.core.metrics import ENCRYPTION_SUITE_THROUGHPUT
+from app.core.tracing import tracer
+from app.services.cipher_suites import (
+    DEFAULT_SUITE,
+    KEY_SIZE,
+    allowed_suites,
+    fastest_suite,
+    get_suite,
+)
+
+TAG_SIZE = 16  # GCM authentication tag
+# Segments per parallel run: smaller files are not worth the hand-off
+PARALLEL_MIN_SEGMENTS = 4
 
 
 class EncryptionService:
-    """Service for file encryption/decryption using AES-256-GCM"""
+    """Service for file encryption/decryption (AES-256-GCM or another AEAD suite)"""
 
-    def __init__(self):
-        # For demo purposes, we generate a key
+    def __init__(
+        self,
+        keys: Optional[Dict[str, bytes]] = None,
+        active_version: Optional[str] = None,
+        segment_size: Optional[int] = None,
+        parallelism: Optional[int] = None,
+        suite: Optional[str] = None,
+    ):
+        # Keyring of KEKs by version
+        # For demo purposes, we generate a key when none is configured
         # In production, this should come from Vault KMS
-        self.key = AESGCM.generate_key(bit_length=256)
+        self.active_version = active_version or settings.ENCRYPTION_ACTIVE_KEY_VERSION
+        self.keys = keys if keys is not None else self._load_keys(self.active_version)
+        if self.active_version not in self.keys:
+            raise ValueError(f"Active key version {self.active_version} is not configured")
+
+        self.key = self.keys[self.active_version]
         self.aesgcm = AESGCM(self.key)
+        self.segment_size = segment_size or settings.ENCRYPTION_SEGMENT_SIZE
+        if parallelism is None:
+            parallelism = settings.ENCRYPTION_PARALLELISM
+        self.parallelism = max(1, parallelism or os.cpu_count() or 1)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+        # Suite for new files: configured, or the first allowed one until
+        # select_suite() has benchmarked them
+        if suite is None and settings.ENCRYPTION_SUITE != "auto":
+            suite = settings.ENCRYPTION_SUITE
+        if suite is None:
+            suite = allowed_suites(settings.ENCRYPTION_ALLOWED_SUITES)[0].name
+        self.suite = get_suite(suite).name
+
+    @staticmethod
+    def _load_keys(active_version: str) -> Dict[str, bytes]:
+        """
+        Parse settings.ENCRYPTION_KEYS ("version:hexkey,version:hexkey")
+
+        Returns:
+            Dict[str, bytes]: KEKs by version
+        """
+        keys: Dict[str, bytes] = {}
+        for entry in settings.ENCRYPTION_KEYS.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            version, _, hex_key = entry.partition(":")
+            keys[version.strip()] = bytes.fromhex(hex_key.strip())
+
+        if not keys:
+            keys[active_version] = AESGCM.generate_key(bit_length=256)
+        return keys
+
+    def _kek(self, version: str) -> AESGCM:
+        """Get the KEK cipher for a key version"""
+        if version not in self.keys:
+            raise KeyError(f"Unknown key version: {version}")
+        return AESGCM(self.keys[version])
+
+    def _wrap_key(self, dek: bytes, version: str) -> Dict[str, str]:
+        """Wrap a DEK with the KEK of the given version"""
+        key_iv = os.urandom(12)
+        wrapped = self._kek(version).encrypt(key_iv, dek, version.encode())
+        return {
+            "key_version": version,
+            "key_iv": key_iv.hex(),
+            "wrapped_key": wrapped.hex(),
+        }
+
+    def select_suite(self) -> Dict[str, float]:
+        """
+        Pick the fastest allowed suite for new files (ENCRYPTION_SUITE=auto)
+
+        Returns:
+            Dict[str, float]: Measured throughput in bytes/s by suite
+                (empty when the suite is configured explicitly)
+        """
+        if settings.ENCRYPTION_SUITE != "auto":
+            return {}
+        self.suite, results = fastest_suite(
+            allowed_suites(settings.ENCRYPTION_ALLOWED_SUITES),
+            settings.ENCRYPTION_BENCHMARK_KB * 1024,
+        )
+        for name, throughput in results.items():
+            ENCRYPTION_SUITE_THROUGHPUT.labels(suite=name).set(throughput)
+        return results
+
+    def _unwrap_key(self, metadata: Dict[str, str]) -> bytes:
+        """Recover the DEK from encryption metadata"""
+        version = metadata["key_version"]
+        if "wrapped_key" not in metadata:
+            # Legacy format: file encrypted directly with the KEK
+            return self.keys[version]
+
+        return self._kek(version).decrypt(
+            bytes.fromhex(metadata["key_iv"]),
+            bytes.fromhex(metadata["wrapped_key"]),
+            version.encode(),
+        )
+
+    def _data_cipher(self, metadata: Dict[str, str]):
+        """AEAD instance for a file's payload (suite from its metadata)"""
+        suite = get_suite(metadata.get("algorithm", DEFAULT_SUITE))
+        return suite.aead(self._unwrap_key(metadata))
+
+    @staticmethod
+    def _segment_nonce(prefix: bytes, index: int) -> bytes:
+        """96-bit GCM nonce of a segment: 8-byte random prefix + 32-bit index"""
+        return prefix + index.to_bytes(4, "big")
+
+    @staticmethod
+    def _segment_aad(index: int, final: bool) -> bytes:
+        return index.to_bytes(4, "big") + (b"\x01" if final else b"\x00")
+
+    @staticmethod
+    def _seal_into(cipher, nonce: bytes, data, aad: bytes, out: memoryview) -> None:
+        """Encrypt into out (len(data) + TAG_SIZE bytes)"""
+        if hasattr(cipher, "encrypt_into"):
+            cipher.encrypt_into(nonce, data, aad, out)
+        else:  # Older cryptography releases
+            out[:] = cipher.encrypt(nonce, data, aad)
+
+    @staticmethod
+    def _open_into(cipher, nonce: bytes, data, aad: Optional[bytes], out: memoryview) -> None:
+        """Decrypt into out (len(data) - TAG_SIZE bytes)"""
+        if hasattr(cipher, "decrypt_into"):
+            cipher.decrypt_into(nonce, data, aad, out)
+        else:  # Older cryptography releases
+            out[:] = cipher.decrypt(nonce, data, aad)
+
+    def _run_segments(self, count: int, seal: Callable[[int, int], None]) -> None:
+        """
+        Call seal(start, stop) over contiguous runs covering segments 0..count
+
+        Runs go to the segment pool (the calling thread takes the first
+        one); the first error raised by a run is re-raised once all are done.
+        """
+        runs = min(self.parallelism, count // PARALLEL_MIN_SEGMENTS)
+        if runs <= 1:
+            seal(0, count)
+            return
+
+        with self._executor_lock:
+            # Created on first use: no threads at import time
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.parallelism - 1, thread_name_prefix="segment-pool"
+                )
+        bounds = [count * run // runs for run in range(runs + 1)]
+        futures = [
+            self._executor.submit(seal, bounds[run], bounds[run + 1]) for run in range(1, runs)
+        ]
+        errors: List[BaseException] = []
+        try:
+            seal(bounds[0], bounds[1])
+        except Exception as e:
+            errors.append(e)
+        for future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def ciphertext_size(self, plaintext_size: int) -> int:
+        """Size of the segmented ciphertext of a plaintext"""
+        count = max(1, -(-plaintext_size // self.segment_size))
+        return plaintext_size + count * TAG_SIZE
+
+    @staticmethod
+    def plaintext_size(ciphertext_size: int, metadata: Dict[str, str]) -> int:
+        """Size of the plaintext of a ciphertext"""
+        if metadata.get("format") != "segmented":
+            return ciphertext_size - TAG_SIZE
+        record_size = int(metadata["segment_size"]) + TAG_SIZE
+        return ciphertext_size - max(1, -(-ciphertext_size // record_size)) * TAG_SIZE
+
+    def encrypt_into(self, data: bytes, out: memoryview) -> Dict[str, str]:
+        """
+        Encrypt file data into a caller-provided buffer
+
+        Args:
+            data: File content (any bytes-like object)
+            out: Writable buffer of exactly ciphertext_size(len(data)) bytes
+
+        Returns:
+            Dict: IV, wrapped DEK and other encryption metadata
+        """
+        out = memoryview(out)
+        if len(out) != self.ciphertext_size(len(data)):
+            raise ValueError("Output buffer must be exactly ciphertext_size(len(data)) bytes")
+
+        # Generate per-file data key and random nonce prefix
+        dek = os.urandom(KEY_SIZE)
+        iv = os.urandom(8)
+        suite = get_suite(self.suite)
+        cipher = suite.aead(dek)
+
+        # Encrypt segment by segment (an empty file is one empty final segment)
+        view = memoryview(data)
+        segment_size = self.segment_size
+        record_size = segment_size + TAG_SIZE
+        count = max(1, -(-len(data) // segment_size))
+
+        def seal(start: int, stop: int) -> None:
+            for index in range(start, stop):
+                segment = view[index * segment_size:(index + 1) * segment_size]
+                position = index * record_size
+                self._seal_into(
+                    cipher,
+                    self._segment_nonce(iv, index),
+                    segment,
+                    self._segment_aad(index, index == count - 1),
+                    out[position:position + len(segment) + TAG_SIZE],
+                )
+
+        self._run_segments(count, seal)
+
+        metadata = {
+            "algorithm": suite.name,
+            "format": "segmented",
+            "segment_size": self.segment_size,
+            "iv": iv.hex(),
+        }
+        metadata.update(self._wrap_key(dek, self.active_version))
+        return metadata
 
+    @tracer.traced("encryption.encrypt")
     def encrypt_file(self, data: bytes) -> Tuple[bytes, Dict[str, str]]:
         """
-        Encrypt file data using AES-256-GCM
+        Encrypt file data with the service's cipher suite
 
         Args:
             data: File content as bytes
@@ -27,30 +288,66 @@ class EncryptionService:
         Returns:
             Tuple[bytes, Dict]: (encrypted_data, metadata)
                 - encrypted_data: Ciphertext
-                - metadata: IV and other encryption metadata
+                - metadata: IV, wrapped DEK and other encryption metadata
         """
-        # Generate random IV (96 bits = 12 bytes for GCM)
-        iv = os.urandom(12)
+        ciphertext = bytearray(self.ciphertext_size(len(data)))
+        metadata = self.encrypt_into(data, memoryview(ciphertext))
+        return bytes(ciphertext), metadata
 
-        # Encrypt
-        ciphertext = self.aesgcm.encrypt(iv, data, None)
+    def decrypt_into(self, ciphertext: bytes, metadata: Dict[str, str], out: memoryview) -> int:
+        """
+        Decrypt file data into a caller-provided buffer
 
-        # Return encrypted data and metadata
-        metadata = {
-            "algorithm": "AES-256-GCM",
-            "iv": iv.hex(),
-            "key_version": "1",
-        }
+        Args:
+            ciphertext: Encrypted file content (any bytes-like object)
+            metadata: Encryption metadata (IV, wrapped DEK, etc.)
+            out: Writable buffer of at least plaintext_size(len(ciphertext)) bytes
+
+        Returns:
+            int: Number of plaintext bytes written
+
+        Raises:
+            InvalidTag: If the ciphertext was modified, reordered or truncated
+        """
+        view = memoryview(ciphertext)
+        out = memoryview(out)
+        size = self.plaintext_size(len(view), metadata)
+        if len(out) < size:
+            raise ValueError("Output buffer too small")
+        cipher = self._data_cipher(metadata)
+
+        if metadata.get("format") != "segmented":
+            self._open_into(cipher, bytes.fromhex(metadata["iv"]), view, None, out[:size])
+            return size
+
+        prefix = bytes.fromhex(metadata["iv"])
+        segment_size = int(metadata["segment_size"])
+        record_size = segment_size + TAG_SIZE
+        count = max(1, -(-len(view) // record_size))
+
+        def open_segments(start: int, stop: int) -> None:
+            for index in range(start, stop):
+                record = view[index * record_size:(index + 1) * record_size]
+                position = index * segment_size
+                self._open_into(
+                    cipher,
+                    self._segment_nonce(prefix, index),
+                    record,
+                    self._segment_aad(index, index == count - 1),
+                    out[position:position + len(record) - TAG_SIZE],
+                )
 
-        return ciphertext, metadata
+        self._run_segments(count, open_segments)
+        return size
 
+    @tracer.traced("encryption.decrypt")
     def decrypt_file(self, ciphertext: bytes, metadata: Dict[str, str]) -> bytes:
         """
         Decrypt file data
 
         Args:
             ciphertext: Encrypted file content
-            metadata: Encryption metadata (IV, etc.)
+            metadata: Encryption metadata (IV, wrapped DEK, etc.)
 
         Returns:
             bytes: Decrypted file content
@@ -58,10 +355,153 @@ class EncryptionService:
         Raises:
             Exception: If decryption fails
         """
+        if metadata.get("format") == "segmented":
+            plaintext = bytearray(self.plaintext_size(len(ciphertext), metadata))
+            self.decrypt_into(ciphertext, metadata, memoryview(plaintext))
+            return bytes(plaintext)
+
         iv = bytes.fromhex(metadata["iv"])
-        plaintext = self.aesgcm.decrypt(iv, ciphertext, None)
+        plaintext = self._data_cipher(metadata).decrypt(iv, ciphertext, None)
         return plaintext
 
+    def decrypt_stream(
+        self, chunks: Iterable[bytes], metadata: Dict[str, str]
+    ) -> Iterator[bytes]:
+        """
+        Decrypt a ciphertext stream segment by segment
+
+        Memory use is bounded by the segment size. Records lying entirely
+        within a chunk are decrypted in place; only records split across
+        chunks are copied. Files in the single message format are buffered
+        and decrypted at the end.
+
+        Args:
+            chunks: Ciphertext chunks of any size
+            metadata: Encryption metadata
+
+        Yields:
+            bytes: Plaintext segments
+
+        Raises:
+            InvalidTag: If a segment was modified, reordered or dropped
+        """
+        if metadata.get("format") != "segmented":
+            yield self.decrypt_file(b"".join(chunks), metadata)
+            return
+
+        cipher = self._data_cipher(metadata)
+        prefix = bytes.fromhex(metadata["iv"])
+        record_size = int(metadata["segment_size"]) + TAG_SIZE
+
+        # A full record is only known not to be the last once more data follows
+        pending = bytearray()
+        index = 0
+        for chunk in chunks:
+            view = memoryview(chunk)
+            offset = 0
+
+            # Complete the record carried over from previous chunks
+            if pending:
+                offset = min(record_size - len(pending), len(view))
+                pending += view[:offset]
+                if len(pending) < record_size or offset == len(view):
+                    continue
+                yield cipher.decrypt(
+                    self._segment_nonce(prefix, index), pending, self._segment_aad(index, False)
+                )
+                pending.clear()
+                index += 1
+
+            # Whole records within this chunk, keeping the last one back
+            while len(view) - offset > record_size:
+                yield cipher.decrypt(
+                    self._segment_nonce(prefix, index),
+                    view[offset:offset + record_size],
+                    self._segment_aad(index, False),
+                )
+                offset += record_size
+                index += 1
+            pending += view[offset:]
+
+        yield cipher.decrypt(
+            self._segment_nonce(prefix, index), pending, self._segment_aad(index, True)
+        )
+
+    def decrypt_fileobj(self, fileobj: BinaryIO, metadata: Dict[str, str]) -> Iterator[bytes]:
+        """
+        Decrypt a stored file segment by segment, reading with readinto
+
+        Each segment is read into one reused buffer and decrypted from a
+        memoryview of it, so the plaintext segment handed to the caller is
+        the only allocation per segment.
+
+        Args:
+            fileobj: Ciphertext file opened in binary mode
+            metadata: Encryption metadata
+
+        Yields:
+            bytes: Plaintext segments
+
+        Raises:
+            InvalidTag: If a segment was modified, reordered or dropped
+        """
+        if metadata.get("format") != "segmented":
+            yield self.decrypt_file(fileobj.read(), metadata)
+            return
+
+        cipher = self._data_cipher(metadata)
+        prefix = bytes.fromhex(metadata["iv"])
+        record_size = int(metadata["segment_size"]) + TAG_SIZE
+        remaining = os.fstat(fileobj.fileno()).st_size - fileobj.tell()
+
+        view = memoryview(bytearray(min(record_size, max(remaining, TAG_SIZE))))
+        index = 0
+        while True:
+            size = min(record_size, remaining)
+            filled = 0
+            while filled < size:
+                read = fileobj.readinto(view[filled:size])
+                if not read:
+                    raise EOFError("Ciphertext file truncated while reading")
+                filled += read
+            remaining -= size
+            final = remaining == 0
+            yield cipher.decrypt(
+                self._segment_nonce(prefix, index), view[:size], self._segment_aad(index, final)
+            )
+            if final:
+                return
+            index += 1
+
+    def needs_reencryption(self, metadata: Dict[str, str]) -> bool:
+        """Check if a file has no wrapped DEK and must be fully re-encrypted"""
+        return "wrapped_key" not in metadata
+
+    def rewrap_key(
+        self, metadata: Dict[str, str], target_version: Optional[str] = None
+    ) -> Dict[str, str]:
+        """
+        Re-wrap a file's DEK with another KEK without touching the payload
+
+        Args:
+            metadata: Current encryption metadata
+            target_version: KEK version to wrap with (default: active version)
+
+        Returns:
+            Dict: New encryption metadata
+
+        Raises:
+            ValueError: If the file uses the legacy format (no wrapped DEK)
+        """
+        if self.needs_reencryption(metadata):
+            raise ValueError("Legacy encryption format requires full re-encryption")
+
+        target = target_version or self.active_version
+        dek = self._unwrap_key(metadata)
+        new_metadata = dict(metadata)
+        new_metadata.update(self._wrap_key(dek, target))
+        return new_metadata
+
 
 # Singleton instance
 encryption_service = EncryptionService()
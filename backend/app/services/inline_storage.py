@@ -0,0 +1,67 @@
+"""
+Inline Storage - small ciphertexts kept in Postgres
+
+Most uploads are a few KB, yet each one cost a MinIO put_object, then a
+get_object and remove_object on download. Ciphertexts up to
+INLINE_STORAGE_MAX_KB are stored in the inline_objects table instead:
+the row is added in the upload's transaction, and on download it is read
+and deleted in the claim transaction, so a small file never touches the
+object store. Inline objects are marked with "storage": "inline" in their
+encryption metadata.
+"""
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.inline_object import InlineObject
+
+INLINE = "inline"
+
+
+class InlineStorage:
+    """Small-object storage in the database"""
+
+    def accepts(self, size: int) -> bool:
+        """Check if a ciphertext of this size is stored inline"""
+        return size <= settings.INLINE_STORAGE_MAX_KB * 1024
+
+    @staticmethod
+    def is_inline(metadata: Optional[dict]) -> bool:
+        return bool(metadata) and metadata.get("storage") == INLINE
+
+    def put(self, storage_key: str, data: bytes) -> InlineObject:
+        """
+        Build the row for a ciphertext
+
+        The caller adds it to the transaction that creates the files row
+        (or blob), so the object exists exactly when its metadata does.
+        """
+        return InlineObject(storage_key=storage_key, data=bytes(data))
+
+    def take(self, db: Session, storage_key: str, delete: bool) -> bytes:
+        """
+        Read a ciphertext in the caller's (claim) transaction
+
+        Args:
+            db: Database session
+            storage_key: Object key
+            delete: Delete the row in the same transaction (last reference)
+
+        Returns:
+            bytes: Ciphertext
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+        inline_object = db.get(InlineObject, storage_key)
+        if inline_object is None:
+            raise FileNotFoundError(f"Inline object not found: {storage_key}")
+        data = inline_object.data
+        if delete:
+            db.delete(inline_object)
+        return data
+
+
+# Singleton instance
+inline_storage = InlineStorage()
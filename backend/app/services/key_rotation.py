@@ -0,0 +1,459 @@
+"""
+Key Rotation Service - Move stored files to a new KEK version
+
+Walks the files table in batches of rows whose key_version differs from
+the target. Files with a wrapped DEK are re-wrapped in place (metadata
+only). Legacy files encrypted directly with a KEK are streamed through a
+throttled worker pool and fully re-encrypted under a new storage key.
+Shared dedup blobs are re-wrapped the same way as files.
+
+Rows locked by an in-flight download are skipped rather than waited for,
+and retried after the sweep (KEY_ROTATION_RETRY_PASSES times); the run is
+only reported complete once none is left on an old version.
+
+Usage:
+    python -m app.services.key_rotation --target-version 2
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, field
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.file import File as FileModel
+from app.models.audit_log import AuditLog
+from app.models.blob import Blob
+from app.services.encryption import EncryptionService, encryption_service
+from app.services.storage import StorageService, storage_service
+from app.services.token_service import TokenService
+
+
+@dataclass
+class RotationProgress:
+    """Counters for a rotation run (persisted as checkpoint)"""
+
+    target_version: str
+    last_id: Optional[str] = None
+    # Files skipped because a download held their row lock
+    pending_ids: List[str] = field(default_factory=list)
+    rewrapped: int = 0
+    reencrypted: int = 0
+    skipped: int = 0
+    failed: int = 0
+    bytes_reencrypted: int = 0
+    completed: bool = False
+    started_at: float = field(default_factory=time.time)
+
+    @property
+    def processed(self) -> int:
+        return self.rewrapped + self.reencrypted + self.skipped + self.failed
+
+
+class Throttle:
+    """Pace re-encryption bandwidth across all workers (bytes per second)"""
+
+    def __init__(self, bytes_per_second: int):
+        self.rate = bytes_per_second
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def consume(self, nbytes: int) -> None:
+        """Block until nbytes may be processed"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot)
+            self._next_slot = start + nbytes / self.rate
+        delay = start - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class KeyRotationService:
+    """Batch job re-wrapping or re-encrypting files to a target key version"""
+
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        encryption: EncryptionService = encryption_service,
+        storage: StorageService = storage_service,
+        batch_size: int = settings.KEY_ROTATION_BATCH_SIZE,
+        workers: int = settings.KEY_ROTATION_WORKERS,
+        max_mb_per_second: int = settings.KEY_ROTATION_MAX_MB_PER_SECOND,
+        checkpoint_path: Optional[str] = settings.KEY_ROTATION_CHECKPOINT_PATH,
+        on_progress: Optional[Callable[[RotationProgress], None]] = None,
+    ):
+        self.session_factory = session_factory
+        self.encryption = encryption
+        self.storage = storage
+        self.batch_size = batch_size
+        self.workers = workers
+        self.throttle = Throttle(max_mb_per_second * 1024 * 1024)
+        self.checkpoint_path = checkpoint_path
+        self.on_progress = on_progress or self._print_progress
+        self._lock = threading.Lock()
+
+    def _is_test_mode(self) -> bool:
+        """Check if running in test mode (SQLite doesn't support FOR UPDATE)"""
+        return os.environ.get("ENVIRONMENT") == "test"
+
+    def _load_checkpoint(self, target_version: str) -> RotationProgress:
+        """Resume an interrupted run for the same target version"""
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            with open(self.checkpoint_path) as f:
+                data = json.load(f)
+            if data.get("target_version") == target_version and not data.get("completed"):
+                return RotationProgress(**data)
+        return RotationProgress(target_version=target_version)
+
+    def _save_checkpoint(self, progress: RotationProgress) -> None:
+        """Atomically persist progress"""
+        if not self.checkpoint_path:
+            return
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(progress), f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    @staticmethod
+    def _print_progress(progress: RotationProgress) -> None:
+        elapsed = max(time.time() - progress.started_at, 1e-6)
+        print(
+            f"Key rotation to v{progress.target_version}: {progress.processed} files "
+            f"({progress.rewrapped} rewrapped, {progress.reencrypted} re-encrypted, "
+            f"{progress.skipped} skipped, {progress.failed} failed) "
+            f"- {progress.processed / elapsed:.1f} files/s"
+        )
+
+    def _count(self, progress: RotationProgress, action: str, nbytes: int = 0) -> None:
+        """Update run counters and Prometheus metrics"""
+        with self._lock:
+            setattr(progress, action, getattr(progress, action) + 1)
+            progress.bytes_reencrypted += nbytes
+        metrics.KEY_ROTATION_FILES.labels(action=action).inc()
+        if nbytes:
+            metrics.KEY_ROTATION_BYTES.inc(nbytes)
+
+    def _lock_rows(self, query) -> list:
+        """Lock a query's rows, skipping those held by an in-flight download"""
+        if not self._is_test_mode():
+            query = query.with_for_update(skip_locked=True)
+        return query.all()
+
+    def _next_batch(
+        self,
+        db: Session,
+        target_version: str,
+        last_id: Optional[str] = None,
+        ids: Optional[List[str]] = None,
+    ) -> Tuple[List[FileModel], List[str], Optional[str]]:
+        """
+        Lock the next batch of live files not yet on the target version
+
+        Candidates are listed without locking first, so the rows skipped
+        because a download holds them are known and can be retried.
+
+        Args:
+            db: Database session
+            target_version: KEK version to move to
+            last_id: Continue the sweep after this id
+            ids: Only consider these ids (retry of skipped rows)
+
+        Returns:
+            Tuple[List[FileModel], List[str], Optional[str]]: (locked rows,
+                skipped ids, last candidate id or None when done)
+        """
+        key_version = FileModel.encryption_metadata["key_version"].as_string()
+        conditions = (
+            FileModel.downloaded_at.is_(None),
+            FileModel.encryption_metadata.isnot(None),
+            key_version != target_version,
+        )
+        query = db.query(FileModel.id).filter(*conditions)
+        if last_id:
+            query = query.filter(FileModel.id > last_id)
+        if ids is not None:
+            query = query.filter(FileModel.id.in_(ids))
+        candidates = [str(row.id) for row in query.order_by(FileModel.id).limit(self.batch_size)]
+        if not candidates:
+            return [], [], None
+
+        batch = self._lock_rows(
+            db.query(FileModel)
+            .filter(FileModel.id.in_(candidates), *conditions)
+            .order_by(FileModel.id)
+        )
+        locked = {str(file_record.id) for file_record in batch}
+        # Includes rows downloaded meanwhile: the retry drops them
+        skipped = [file_id for file_id in candidates if file_id not in locked]
+        return batch, skipped, candidates[-1]
+
+    def _reencrypt(self, file_id, target_version: str, progress: RotationProgress) -> bool:
+        """
+        Fully re-encrypt one legacy file under a new storage key
+
+        Returns:
+            bool: False if a download held the row (to be retried)
+        """
+        db = self.session_factory()
+        try:
+            rows = self._lock_rows(db.query(FileModel).filter(FileModel.id == file_id))
+            file_record = rows[0] if rows else None
+            if file_record is None:
+                held = db.query(FileModel.id).filter(FileModel.id == file_id).first()
+                if held is not None:
+                    return False
+
+            if (
+                file_record is None
+                or file_record.is_downloaded
+                or file_record.encryption_metadata.get("key_version") == target_version
+            ):
+                self._count(progress, "skipped")
+                return True
+
+            old_key = file_record.storage_key
+            ciphertext = self.storage.download_file(old_key)
+            self.throttle.consume(len(ciphertext))
+
+            plaintext = self.encryption.decrypt_file(ciphertext, file_record.encryption_metadata)
+            new_ciphertext, new_metadata = self.encryption.encrypt_file(plaintext)
+            # The decrypted payload is still compressed: keep its compression
+            if "compression" in file_record.encryption_metadata:
+                new_metadata["compression"] = file_record.encryption_metadata["compression"]
+            if new_metadata["key_version"] != target_version:
+                new_metadata = self.encryption.rewrap_key(new_metadata, target_version)
+
+            new_key = f"{file_record.id}.v{target_version}.enc"
+            if not self.storage.upload_file(new_key, new_ciphertext):
+                raise RuntimeError(f"Storage upload failed: {new_key}")
+
+            file_record.storage_key = new_key
+            file_record.encryption_metadata = new_metadata
+            db.commit()
+
+            # Old object is only removed once the row points at the new one
+            self.storage.delete_file(old_key)
+            self._count(progress, "reencrypted", len(new_ciphertext))
+        except Exception as e:
+            db.rollback()
+            print(f"Key rotation failed for file {file_id}: {e}")
+            self._count(progress, "failed")
+        finally:
+            db.close()
+        return True
+
+    def _rewrap_blobs(self, target_version: str, progress: RotationProgress) -> int:
+        """
+        Re-wrap DEKs of shared dedup blobs (always in wrapped format)
+
+        Blobs locked by a download are skipped; the sweep is repeated while
+        some remain on an old version (KEY_ROTATION_RETRY_PASSES times).
+        Blobs that fail to re-wrap are counted as failed and not retried.
+
+        Returns:
+            int: Blobs still on an old version, other than failed ones
+        """
+        key_version = Blob.encryption_metadata["key_version"].as_string()
+        failed = []
+        for attempt in range(settings.KEY_ROTATION_RETRY_PASSES + 1):
+            if attempt:
+                time.sleep(settings.KEY_ROTATION_RETRY_DELAY_SECONDS)
+            last_id = None
+            while True:
+                db = self.session_factory()
+                try:
+                    query = db.query(Blob).filter(key_version != target_version)
+                    if failed:
+                        query = query.filter(Blob.id.notin_(failed))
+                    if last_id:
+                        query = query.filter(Blob.id > last_id)
+                    batch = self._lock_rows(query.order_by(Blob.id).limit(self.batch_size))
+                    if not batch:
+                        break
+
+                    for blob in batch:
+                        try:
+                            blob.encryption_metadata = self.encryption.rewrap_key(
+                                blob.encryption_metadata, target_version
+                            )
+                            self._count(progress, "rewrapped")
+                        except Exception as e:
+                            print(f"Key rewrap failed for blob {blob.id}: {e}")
+                            self._count(progress, "failed")
+                            failed.append(blob.id)
+                    last_id = str(batch[-1].id)
+                    db.commit()
+                finally:
+                    db.close()
+
+            db = self.session_factory()
+            try:
+                query = db.query(Blob).filter(key_version != target_version)
+                if failed:
+                    query = query.filter(Blob.id.notin_(failed))
+                remaining = query.count()
+            finally:
+                db.close()
+            if not remaining:
+                break
+        return remaining
+
+    def _rotate_batch(
+        self,
+        pool: ThreadPoolExecutor,
+        target_version: str,
+        progress: RotationProgress,
+        last_id: Optional[str] = None,
+        ids: Optional[List[str]] = None,
+    ) -> Optional[str]:
+        """
+        Rotate one batch (see _next_batch); skipped files join progress.pending_ids
+
+        Returns:
+            Optional[str]: Last candidate id, or None if there was none
+        """
+        db = self.session_factory()
+        try:
+            batch, skipped, batch_last_id = self._next_batch(db, target_version, last_id, ids)
+            if batch_last_id is None:
+                return None
+
+            legacy_ids = []
+            for file_record in batch:
+                if self.encryption.needs_reencryption(file_record.encryption_metadata):
+                    legacy_ids.append(file_record.id)
+                    continue
+                try:
+                    file_record.encryption_metadata = self.encryption.rewrap_key(
+                        file_record.encryption_metadata, target_version
+                    )
+                    self._count(progress, "rewrapped")
+                except Exception as e:
+                    print(f"Key rewrap failed for file {file_record.id}: {e}")
+                    self._count(progress, "failed")
+
+            db.commit()
+        finally:
+            db.close()
+
+        # Re-encrypt legacy files of this batch before checkpointing past them
+        done = list(pool.map(
+            lambda fid: self._reencrypt(fid, target_version, progress), legacy_ids
+        ))
+        skipped += [str(fid) for fid, ok in zip(legacy_ids, done) if not ok]
+        progress.pending_ids.extend(skipped)
+        return batch_last_id
+
+    def run(self, target_version: Optional[str] = None, resume: bool = True) -> RotationProgress:
+        """
+        Rotate all live files to the target key version
+
+        Args:
+            target_version: KEK version to move to (default: active version)
+            resume: Continue from the checkpoint of an interrupted run
+
+        Returns:
+            RotationProgress: Final counters
+        """
+        target = target_version or self.encryption.active_version
+        if target not in self.encryption.keys:
+            raise ValueError(f"Unknown key version: {target}")
+
+        if resume:
+            progress = self._load_checkpoint(target)
+        else:
+            progress = RotationProgress(target_version=target)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                last_id = self._rotate_batch(pool, target, progress, last_id=progress.last_id)
+                if last_id is None:
+                    break
+                progress.last_id = last_id
+                self._save_checkpoint(progress)
+                metrics.KEY_ROTATION_LAST_BATCH.set_to_current_time()
+                self.on_progress(progress)
+
+            # Retry the files a download held during the sweep
+            for _ in range(settings.KEY_ROTATION_RETRY_PASSES):
+                if not progress.pending_ids:
+                    break
+                time.sleep(settings.KEY_ROTATION_RETRY_DELAY_SECONDS)
+                pending, progress.pending_ids = progress.pending_ids, []
+                for start in range(0, len(pending), self.batch_size):
+                    chunk = pending[start:start + self.batch_size]
+                    self._rotate_batch(pool, target, progress, ids=chunk)
+                self._save_checkpoint(progress)
+                self.on_progress(progress)
+
+        blobs_remaining = self._rewrap_blobs(target, progress)
+
+        # Not complete while rows are left on an old KEK: a resumed run retries them
+        progress.completed = not progress.pending_ids and not blobs_remaining
+        if not progress.completed:
+            print(
+                f"Key rotation to v{target} incomplete: {len(progress.pending_ids)} files "
+                f"and {blobs_remaining} blobs still locked"
+            )
+        self._save_checkpoint(progress)
+        self._log_audit(progress)
+        return progress
+
+    def _log_audit(self, progress: RotationProgress) -> None:
+        """Record the rotation run in the audit log"""
+        db = self.session_factory()
+        try:
+            db.add(
+                AuditLog(
+                    event_type="key_rotation",
+                    ip_hash=TokenService.hash_ip("key-rotation-job"),
+                    event_metadata={
+                        "target_version": progress.target_version,
+                        "rewrapped": progress.rewrapped,
+                        "reencrypted": progress.reencrypted,
+                        "skipped": progress.skipped,
+                        "failed": progress.failed,
+                        "bytes_reencrypted": progress.bytes_reencrypted,
+                        "pending": len(progress.pending_ids),
+                        "completed": progress.completed,
+                    },
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+def main() -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Rotate file encryption keys")
+    parser.add_argument("--target-version", default=None)
+    parser.add_argument("--batch-size", type=int, default=settings.KEY_ROTATION_BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=settings.KEY_ROTATION_WORKERS)
+    parser.add_argument(
+        "--max-mb-per-second", type=int, default=settings.KEY_ROTATION_MAX_MB_PER_SECOND
+    )
+    parser.add_argument("--no-resume", action="store_true")
+    args = parser.parse_args()
+
+    service = KeyRotationService(
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_mb_per_second=args.max_mb_per_second,
+    )
+    progress = service.run(target_version=args.target_version, resume=not args.no_resume)
+    raise SystemExit(1 if progress.failed or not progress.completed else 0)
+
+
+if __name__ == "__main__":
+    main()
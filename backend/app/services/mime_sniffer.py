@@ -0,0 +1,174 @@
+"""
+MIME Sniffer - content-type detection from magic bytes
+
+The client's Content-Type is not trusted: the type is detected from the
+first SNIFF_SIZE bytes of the upload and checked against
+ALLOWED_MIME_TYPES before the rest of the file is read, scanned or
+encrypted. Executables and scripts get their own type so blocked uploads
+can be reported by kind (KRI-03).
+"""
+import codecs
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.core.config import settings
+
+SNIFF_SIZE = 4096
+OCTET_STREAM = "application/octet-stream"
+
+# (offset, magic, mime type), most specific first within a first byte
+SIGNATURES: Tuple[Tuple[int, bytes, str], ...] = (
+    (0, b"%PDF-", "application/pdf"),
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"PK\x03\x04", "application/zip"),
+    (0, b"PK\x05\x06", "application/zip"),  # empty archive
+    (0, b"\x1f\x8b", "application/gzip"),
+    (0, b"7z\xbc\xaf\x27\x1c", "application/x-7z-compressed"),
+    (0, b"Rar!\x1a\x07", "application/x-rar-compressed"),
+    (0, b"BZh", "application/x-bzip2"),
+    (0, b"\xfd7zXZ\x00", "application/x-xz"),
+    (0, b"\x28\xb5\x2f\xfd", "application/zstd"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "application/x-ole-storage"),  # legacy office, msi
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (0, b"\x00\x00\x01\x00", "image/x-icon"),
+    (0, b"ID3", "audio/mpeg"),
+    (0, b"OggS", "audio/ogg"),
+    (0, b"fLaC", "audio/flac"),
+    (0, b"\x1aE\xdf\xa3", "video/webm"),
+    (0, b"MZ", "application/x-msdownload"),
+    (0, b"\x7fELF", "application/x-executable"),
+    (0, b"\xfe\xed\xfa\xce", "application/x-mach-binary"),
+    (0, b"\xfe\xed\xfa\xcf", "application/x-mach-binary"),
+    (0, b"\xcf\xfa\xed\xfe", "application/x-mach-binary"),
+    (0, b"\xce\xfa\xed\xfe", "application/x-mach-binary"),
+    (0, b"\xca\xfe\xba\xbe", "application/java-vm"),  # also fat Mach-O
+    (0, b"\x00asm", "application/wasm"),
+    (0, b"#!", "text/x-shellscript"),
+    (4, b"ftyp", "video/mp4"),
+    (8, b"WEBP", "image/webp"),
+    (8, b"WAVE", "audio/wav"),
+    (8, b"AVI ", "video/x-msvideo"),
+    (257, b"ustar", "application/x-tar"),
+)
+
+# Text formats recognized by their leading markup (after whitespace, case-insensitive)
+TEXT_PREFIXES: Tuple[Tuple[bytes, str], ...] = (
+    (b"<?php", "application/x-php"),
+    (b"<!doctype html", "text/html"),
+    (b"<html", "text/html"),
+    (b"<script", "text/html"),
+    (b"<svg", "image/svg+xml"),
+    (b"<?xml", "application/xml"),
+    (b"{\\rtf", "application/rtf"),
+)
+
+# Container formats: magic bytes can't tell these apart, so a declared type
+# from the same family is kept (it is still checked against the allowlist)
+CONTAINER_FAMILIES: Dict[str, FrozenSet[str]] = {
+    "application/zip": frozenset({
+        "application/x-zip-compressed",
+        "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+        "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+        "application/vnd.oasis.opendocument.text",
+        "application/vnd.oasis.opendocument.spreadsheet",
+        "application/epub+zip",
+    }),
+    "application/x-ole-storage": frozenset({
+        "application/msword",
+        "application/vnd.ms-excel",
+        "application/vnd.ms-powerpoint",
+    }),
+}
+
+# Allowed in text: tab, newline, form feed, carriage return, escape
+TEXT_CONTROL_BYTES = frozenset({0x09, 0x0A, 0x0C, 0x0D, 0x1B})
+BINARY_BYTES = bytes(b for b in range(0x20) if b not in TEXT_CONTROL_BYTES) + b"\x7f"
+
+
+def _index(signatures) -> Tuple[Dict[int, List[Tuple[bytes, str]]], List[Tuple[int, bytes, str]]]:
+    """Split the table: offset-0 signatures keyed by first byte, and the rest"""
+    by_first_byte: Dict[int, List[Tuple[bytes, str]]] = {}
+    at_offset = []
+    for offset, magic, mime_type in signatures:
+        if offset == 0:
+            by_first_byte.setdefault(magic[0], []).append((magic, mime_type))
+        else:
+            at_offset.append((offset, magic, mime_type))
+    return by_first_byte, at_offset
+
+
+_BY_FIRST_BYTE, _AT_OFFSET = _index(SIGNATURES)
+
+
+@lru_cache(maxsize=4)
+def parse_allowlist(value: str) -> FrozenSet[str]:
+    """Parse a comma-separated MIME type list into a frozen set"""
+    return frozenset(item.strip().lower() for item in value.split(",") if item.strip())
+
+
+class MimeSniffer:
+    """Detects the content type of an upload from its first bytes"""
+
+    @staticmethod
+    def _is_text(head: bytes) -> bool:
+        if head.translate(None, BINARY_BYTES) != head:
+            return False
+        try:
+            # Not final: head may end in the middle of a multi-byte character
+            codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+        except UnicodeDecodeError:
+            return False
+        return True
+
+    def detect(self, head: bytes, declared: Optional[str] = None) -> str:
+        """
+        Detect the MIME type of a file from its first bytes
+
+        Args:
+            head: Start of the file (SNIFF_SIZE bytes, or less if shorter)
+            declared: Client's Content-Type, only used to name the format
+                inside a container (e.g. docx inside zip)
+
+        Returns:
+            str: Detected MIME type (application/octet-stream if unknown)
+        """
+        if not head:
+            return OCTET_STREAM
+
+        mime_type = self._match(head)
+        declared = (declared or "").split(";")[0].strip().lower()
+        if declared in CONTAINER_FAMILIES.get(mime_type, ()):
+            return declared
+        return mime_type
+
+    def _match(self, head: bytes) -> str:
+        for magic, mime_type in _BY_FIRST_BYTE.get(head[0], ()):
+            if head.startswith(magic):
+                return mime_type
+        for offset, magic, mime_type in _AT_OFFSET:
+            if head.startswith(magic, offset):
+                return mime_type
+
+        if head.startswith(codecs.BOM_UTF8):
+            head = head[len(codecs.BOM_UTF8):]
+        if self._is_text(head):
+            start = head.lstrip()[:16].lower()
+            for prefix, mime_type in TEXT_PREFIXES:
+                if start.startswith(prefix):
+                    return mime_type
+            return "text/plain"
+
+        return OCTET_STREAM
+
+    def is_allowed(self, mime_type: str) -> bool:
+        return mime_type in parse_allowlist(settings.ALLOWED_MIME_TYPES)
+
+
+# Singleton instance
+mime_sniffer = MimeSniffer()
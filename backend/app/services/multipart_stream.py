@@ -0,0 +1,234 @@
+"""
+Streaming multipart parser
+Parses multipart/form-data incrementally from the request stream
+
+Starlette's form parser spools every file part to a SpooledTemporaryFile,
+which rolls over to disk after 1 MB: plaintext uploads were written to
+/tmp and read back before processing. Here file parts are accumulated in
+memory as the body arrives (never touching disk), with the size limits
+enforced while reading, and each part's first bytes are handed to a
+callback as soon as they arrive so a disallowed file is rejected before
+the rest of the body is read.
+"""
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+try:
+    import multipart
+    from multipart.multipart import parse_options_header
+except ImportError:  # pragma: no cover
+    multipart = None
+    parse_options_header = None
+
+MAX_FIELD_SIZE = 64 * 1024
+# Non-file form fields per body: count and combined size (uploads send none)
+MAX_FIELDS = 32
+MAX_FIELDS_SIZE = 256 * 1024
+
+
+class MultipartError(ValueError):
+    """Malformed multipart body"""
+
+
+class PartTooLarge(MultipartError):
+    """A file part or the whole upload exceeds its size limit"""
+
+    def __init__(self, message: str, total: bool = False):
+        super().__init__(message)
+        self.total = total
+
+
+class TooManyFiles(MultipartError):
+    """More file parts than allowed"""
+
+
+class FieldLimitExceeded(MultipartError):
+    """Too many form fields, or a field or all fields together too large"""
+
+
+class FilePart:
+    """A file part, received in memory"""
+
+    def __init__(self, name: str, filename: str, content_type: Optional[str]):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.data = bytearray()
+        self.complete = False
+        self.head_checked = False
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+
+def _decode(value: bytes) -> str:
+    try:
+        return value.decode("utf-8")
+    except UnicodeDecodeError:
+        return value.decode("latin-1")
+
+
+class MultipartStream:
+    """
+    Incremental multipart/form-data parser
+
+    Args:
+        content_type: Request Content-Type header (with the boundary)
+        max_file_size: Limit per file part, in bytes
+        max_total_size: Limit for all file parts together, in bytes
+        max_files: Maximum number of file parts
+        max_fields: Maximum number of non-file form fields
+        max_fields_size: Limit for all non-file form fields together, in bytes
+    """
+
+    def __init__(
+        self,
+        content_type: str,
+        max_file_size: int,
+        max_total_size: int,
+        max_files: int = 1,
+        max_fields: int = MAX_FIELDS,
+        max_fields_size: int = MAX_FIELDS_SIZE,
+    ):
+        if multipart is None:  # pragma: no cover
+            raise RuntimeError("python-multipart is required for upload parsing")
+
+        media_type, params = parse_options_header(content_type or "")
+        if media_type != b"multipart/form-data" or b"boundary" not in params:
+            raise MultipartError("Expected a multipart/form-data body")
+
+        self.boundary = params[b"boundary"]
+        self.max_file_size = max_file_size
+        self.max_total_size = max_total_size
+        self.max_files = max_files
+        self.max_fields = max_fields
+        self.max_fields_size = max_fields_size
+
+        self.files: List[FilePart] = []
+        self.fields: Dict[str, str] = {}
+        self._total = 0
+        self._field_count = 0
+        self._fields_total = 0
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_name = b""
+        self._header_value = b""
+        self._file: Optional[FilePart] = None
+        self._field_name: Optional[str] = None
+        self._field_value = bytearray()
+
+    # Parser callbacks (run synchronously inside parser.write)
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._file = None
+        self._field_name = None
+        self._field_value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_name.lower()] = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if b"name" not in options:
+            raise MultipartError('Content-Disposition must provide a "name"')
+        name = _decode(options[b"name"])
+
+        if b"filename" not in options:
+            self._field_count += 1
+            if self._field_count > self.max_fields:
+                raise FieldLimitExceeded(f"Too many form fields. Maximum: {self.max_fields}")
+            self._field_name = name
+            return
+
+        if len(self.files) >= self.max_files:
+            raise TooManyFiles(f"Too many files. Maximum: {self.max_files}")
+        content_type = self._headers.get(b"content-type")
+        self._file = FilePart(
+            name,
+            _decode(options[b"filename"]),
+            _decode(content_type) if content_type else None,
+        )
+        self.files.append(self._file)
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        size = end - start
+        if self._file is None:
+            if len(self._field_value) + size > MAX_FIELD_SIZE:
+                raise FieldLimitExceeded("Form field too large")
+            self._fields_total += size
+            if self._fields_total > self.max_fields_size:
+                raise FieldLimitExceeded("Form fields too large")
+            self._field_value += data[start:end]
+            return
+
+        if self._file.size + size > self.max_file_size:
+            raise PartTooLarge("File too large")
+        self._total += size
+        if self._total > self.max_total_size:
+            raise PartTooLarge("Upload too large", total=True)
+        self._file.data += data[start:end]
+
+    def _on_part_end(self) -> None:
+        if self._file is not None:
+            self._file.complete = True
+        elif self._field_name is not None:
+            self.fields[self._field_name] = _decode(bytes(self._field_value))
+
+    async def parse(
+        self,
+        stream: AsyncIterator[bytes],
+        head_size: int = 0,
+        on_head: Optional[Callable[[FilePart, bytes], None]] = None,
+    ) -> Tuple[List[FilePart], Dict[str, str]]:
+        """
+        Read and parse the whole body
+
+        Args:
+            stream: Request body chunks (request.stream())
+            head_size: Bytes of each file part passed to on_head
+            on_head: Called once per file part with its first head_size
+                bytes (or the whole part if shorter), as soon as they have
+                been received; an exception stops reading the body
+
+        Returns:
+            Tuple[List[FilePart], Dict[str, str]]: (file parts, form fields)
+
+        Raises:
+            MultipartError: If the body is malformed or exceeds a limit
+        """
+        parser = multipart.MultipartParser(self.boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+
+        async for chunk in stream:
+            try:
+                parser.write(chunk)
+            except MultipartError:
+                raise
+            except Exception as e:
+                raise MultipartError(f"Malformed multipart body: {e}")
+
+            if on_head is not None:
+                for part in self.files:
+                    if not part.head_checked and (part.complete or part.size >= head_size):
+                        part.head_checked = True
+                        on_head(part, bytes(part.data[:head_size]))
+
+        parser.finalize()
+        if any(not part.complete for part in self.files):
+            raise MultipartError("Incomplete multipart body")
+        return self.files, self.fields
@@ -0,0 +1,152 @@
+"""
+Prefetch Cache - speculative ciphertext prefetch after /info lookups
+
+The frontend calls /info and then, shortly after, the download endpoint,
+which used to start with a cold fetch from the object store. When
+PREFETCH_ENABLED, a successful /info for an available file warms the
+first PREFETCH_SEGMENTS segments of its ciphertext into a small in-memory
+LRU (PREFETCH_CACHE_MAX_MB, entries live PREFETCH_TTL_SECONDS). The
+download streams those segments at once and fetches only the rest.
+
+Only ciphertext is cached (plaintext never is, and the DEK stays wrapped
+in the database), and the download claim evicts the entry: a consumed
+token leaves nothing behind.
+"""
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.metrics import PREFETCH_CACHE_BYTES, PREFETCH_REQUESTS
+from app.services.encryption import TAG_SIZE
+from app.services.inline_storage import inline_storage
+from app.services.storage import storage_service
+
+
+class Prefetched:
+    """Leading ciphertext of an object"""
+
+    def __init__(self, data: bytes, complete: bool, expires_at: float):
+        self.data = data
+        self.complete = complete  # the whole object fit in the prefix
+        self.expires_at = expires_at
+
+
+class PrefetchCache:
+    """
+    TTL-bounded LRU of ciphertext prefixes, filled by background fetches
+
+    Args:
+        max_bytes: Total cached bytes; least recently used entries go first
+        ttl: Seconds an entry stays usable
+        segments: Leading segments fetched per object
+        workers: Background fetch threads
+    """
+
+    def __init__(self, max_bytes: int, ttl: float, segments: int, workers: int):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.segments = segments
+        self.workers = workers
+        self.size = 0
+        self._entries: "OrderedDict[str, Prefetched]" = OrderedDict()
+        # Fetches in flight, and those whose object was claimed meanwhile
+        self._inflight: Set[str] = set()
+        self._claimed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return settings.PREFETCH_ENABLED and settings.STORAGE_TYPE != "local"
+
+    def _prefix_size(self, metadata: Dict[str, str]) -> int:
+        return self.segments * (int(metadata["segment_size"]) + TAG_SIZE)
+
+    def schedule(self, storage_key: str, metadata: Dict[str, str]) -> None:
+        """
+        Start fetching an object's leading segments in the background
+
+        Inline objects (already in the database), legacy single-message
+        ciphertexts and objects already cached or in flight are skipped.
+        """
+        if (
+            not self.enabled
+            or inline_storage.is_inline(metadata)
+            or metadata.get("format") != "segmented"
+        ):
+            return
+
+        with self._lock:
+            if storage_key in self._entries or storage_key in self._inflight:
+                return
+            self._inflight.add(storage_key)
+            # Created on first use: no threads at import time
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="prefetch"
+                )
+        self._executor.submit(self._fetch, storage_key, self._prefix_size(metadata))
+
+    def _fetch(self, storage_key: str, length: int) -> None:
+        try:
+            data = storage_service.download_range(storage_key, 0, length)
+        except Exception as e:
+            # Speculative: a failure only means the download fetches it all
+            print(f"Prefetch failed for {storage_key}: {e}")
+            data = None
+
+        with self._lock:
+            self._inflight.discard(storage_key)
+            if storage_key in self._claimed:
+                # Claimed while fetching: the object is being deleted
+                self._claimed.discard(storage_key)
+                return
+            if data is None or len(data) > self.max_bytes:
+                return
+            self._entries[storage_key] = Prefetched(
+                data, len(data) < length, time.monotonic() + self.ttl
+            )
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.data)
+            PREFETCH_CACHE_BYTES.set(self.size)
+
+    def pop(self, storage_key: str) -> Optional[Prefetched]:
+        """
+        Take an object's cached prefix out of the cache (download claim)
+
+        Returns:
+            Optional[Prefetched]: The prefix, or None if not cached or expired
+        """
+        with self._lock:
+            if storage_key in self._inflight:
+                self._claimed.add(storage_key)
+            entry = self._entries.pop(storage_key, None)
+            if entry is not None:
+                self.size -= len(entry.data)
+                PREFETCH_CACHE_BYTES.set(self.size)
+
+        if entry is None or entry.expires_at < time.monotonic():
+            PREFETCH_REQUESTS.labels(result="miss").inc()
+            return None
+        PREFETCH_REQUESTS.labels(result="hit").inc()
+        return entry
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+# Singleton instance
+prefetch_cache = PrefetchCache(
+    max_bytes=settings.PREFETCH_CACHE_MAX_MB * 1024 * 1024,
+    ttl=settings.PREFETCH_TTL_SECONDS,
+    segments=settings.PREFETCH_SEGMENTS,
+    workers=settings.PREFETCH_WORKERS,
+)
@@ -1,10 +1,57 @@
 """
-Storage Service - MinIO/S3 integration
+Storage Service - MinIO/S3 integration, or local disk (STORAGE_TYPE=local)
 """
-import io
 import os
-from typing import Optional
+import time
+from contextlib import contextmanager
+from typing import BinaryIO, Iterator, Optional
+from app.core.buffer_pool import buffer_pool
 from app.core.config import settings
+from app.core.circuit_breaker import breakers
+from app.core.limiter import LimitExceeded, limiters
+from app.core.tracing import KIND_CLIENT, tracer
+
+
+class _BufferReader:
+    """Read-only file object over a buffer, without BytesIO's up-front copy"""
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self.view) if size is None or size < 0 else self.position + size
+        chunk = self.view[self.position:end].tobytes()
+        self.position += len(chunk)
+        return chunk
+
+
+class StorageSlot:
+    """
+    Storage call reserved ahead of time (limiter slot and breaker permit)
+
+    Either passed to the call, which then owns it, or released unused.
+    """
+
+    def __init__(self):
+        self.active = True
+
+    def take(self) -> float:
+        """
+        Hand the slot over to the call
+
+        Returns:
+            float: Start time, to pass to the limiter's release()
+        """
+        self.active = False
+        return time.perf_counter()
+
+    def release(self) -> None:
+        """Give the slot back if no call took it (safe to call twice)"""
+        if self.active:
+            self.active = False
+            limiters["storage"].cancel()
+            breakers["storage"].release()
 
 
 class StorageService:
@@ -12,6 +59,7 @@ class StorageService:
 
     def __init__(self):
         self._client: Optional[object] = None
+        self._probe_client: Optional[object] = None
         self._initialized = False
         # In-memory storage for testing
         self._test_storage: dict = {}
@@ -30,10 +78,59 @@ class StorageService:
             self._ensure_buckets()
         return self._client
 
+    @property
+    def probe_client(self):
+        """MinIO client for health checks: bounded timeouts, no retries"""
+        if self._probe_client is None:
+            import urllib3
+            from minio import Minio
+            timeout = settings.STARTUP_DEPENDENCY_TIMEOUT_SECONDS
+            self._probe_client = Minio(
+                settings.MINIO_ENDPOINT,
+                access_key=settings.MINIO_ACCESS_KEY,
+                secret_key=settings.MINIO_SECRET_KEY,
+                secure=settings.MINIO_SECURE,
+                http_client=urllib3.PoolManager(
+                    timeout=urllib3.Timeout(connect=timeout, read=timeout),
+                    retries=False,
+                ),
+            )
+        return self._probe_client
+
     def _is_test_mode(self) -> bool:
         """Check if running in test mode"""
         return os.environ.get("ENVIRONMENT") == "test"
 
+    def _is_local(self) -> bool:
+        """Check if objects are stored on local disk"""
+        return settings.STORAGE_TYPE == "local"
+
+    def _local_path(self, object_name: str) -> str:
+        """Path of an object on local disk (object keys are flat file names)"""
+        if not object_name or "/" in object_name or "\\" in object_name or object_name.startswith("."):
+            raise ValueError(f"Invalid object name: {object_name}")
+        return os.path.join(settings.LOCAL_STORAGE_PATH, object_name)
+
+    def connect(self) -> None:
+        """
+        Initialize the storage client and check the bucket is reachable
+
+        Raises:
+            Exception: If the storage backend is unreachable
+        """
+        if self._is_test_mode():
+            return
+
+        if self._is_local():
+            os.makedirs(settings.LOCAL_STORAGE_PATH, exist_ok=True)
+            if not os.access(settings.LOCAL_STORAGE_PATH, os.W_OK):
+                raise PermissionError(f"{settings.LOCAL_STORAGE_PATH} is not writable")
+            return
+
+        if not self.probe_client.bucket_exists(settings.MINIO_BUCKET):
+            raise RuntimeError(f"Bucket {settings.MINIO_BUCKET} does not exist")
+        self.client  # Storage answers: set up the shared client (and buckets) now
+
     def _ensure_buckets(self):
         """Ensure required buckets exist"""
         if self._is_test_mode():
@@ -47,6 +144,7 @@ class StorageService:
         except Exception:
             pass  # Buckets may already exist
 
+    @tracer.traced("storage.upload", KIND_CLIENT)
     def upload_file(
         self, object_name: str, data: bytes, content_type: str = "application/octet-stream"
     ) -> bool:
@@ -55,7 +153,7 @@ class StorageService:
 
         Args:
             object_name: S3 object key
-            data: File content as bytes
+            data: File content (bytes, or a buffer such as a pooled memoryview)
             content_type: MIME type
 
         Returns:
@@ -63,23 +161,44 @@ class StorageService:
         """
         # Test mode: use in-memory storage
         if self._is_test_mode():
-            self._test_storage[object_name] = data
+            self._test_storage[object_name] = bytes(data)
             return True
 
+        if self._is_local():
+            try:
+                path = self._local_path(object_name)
+                os.makedirs(settings.LOCAL_STORAGE_PATH, exist_ok=True)
+                # Write then rename, so readers never see a partial object
+                temp_path = f"{path}.tmp"
+                with open(temp_path, "wb") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, path)
+                return True
+            except Exception as e:
+                print(f"Storage upload error: {e}")
+                return False
+
         try:
-            data_stream = io.BytesIO(data)
-            self.client.put_object(
-                settings.MINIO_BUCKET,
-                object_name,
-                data_stream,
-                length=len(data),
-                content_type=content_type,
-            )
+            data_stream = _BufferReader(data)
+            with breakers["storage"].call(), limiters["storage"].limit_calls(len(data)):
+                self.client.put_object(
+                    settings.MINIO_BUCKET,
+                    object_name,
+                    data_stream,
+                    length=len(data),
+                    content_type=content_type,
+                )
             return True
+        except LimitExceeded:
+            # Includes CircuitOpen: storage fails closed
+            raise
         except Exception as e:
             print(f"Storage upload error: {e}")
             return False
 
+    @tracer.traced("storage.download", KIND_CLIENT)
     def download_file(self, object_name: str) -> bytes:
         """
         Download file from storage
@@ -99,13 +218,217 @@ class StorageService:
                 return self._test_storage[object_name]
             raise Exception(f"File not found: {object_name}")
 
-        response = self.client.get_object(settings.MINIO_BUCKET, object_name)
+        if self._is_local():
+            with open(self._local_path(object_name), "rb") as f:
+                return f.read()
+
+        with breakers["storage"].call(), limiters["storage"].limit_calls():
+            response = self.client.get_object(settings.MINIO_BUCKET, object_name)
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+
+    def download_range(self, object_name: str, offset: int, length: int) -> bytes:
+        """
+        Download part of a file (fewer bytes if the object ends first)
+
+        Args:
+            object_name: S3 object key
+            offset: First byte
+            length: Maximum number of bytes
+
+        Returns:
+            bytes: Object content from offset
+
+        Raises:
+            Exception: If file not found or download fails
+        """
+        # Test mode: use in-memory storage
+        if self._is_test_mode():
+            if object_name not in self._test_storage:
+                raise Exception(f"File not found: {object_name}")
+            return bytes(self._test_storage[object_name][offset:offset + length])
+
+        if self._is_local():
+            with open(self._local_path(object_name), "rb") as f:
+                f.seek(offset)
+                return f.read(length)
+
+        with breakers["storage"].call(), limiters["storage"].limit_calls(length):
+            response = self.client.get_object(
+                settings.MINIO_BUCKET, object_name, offset=offset, length=length
+            )
+            try:
+                return response.read()
+            finally:
+                response.close()
+                response.release_conn()
+
+    def reserve(self) -> Optional[StorageSlot]:
+        """
+        Reserve a storage call before committing to it
+
+        Returns:
+            Optional[StorageSlot]: The slot, or None when storage is not
+                limited (test mode, local disk)
+
+        Raises:
+            CircuitOpen: If storage is refusing calls
+            LimitExceeded: If storage calls are at the limit
+        """
+        if self._is_test_mode() or self._is_local():
+            return None
+        breakers["storage"].acquire()
+        try:
+            limiters["storage"].acquire()
+        except LimitExceeded:
+            breakers["storage"].release()
+            raise
+        return StorageSlot()
+
+    @contextmanager
+    def download_buffer(
+        self, object_name: str, slot: Optional[StorageSlot] = None
+    ) -> Iterator[memoryview]:
+        """
+        Download a file into a pooled buffer
+
+        The view is only valid inside the block; the buffer then returns to
+        the shared pool.
+
+        Args:
+            object_name: S3 object key
+            slot: Slot from reserve(); the call is then not rejected
+
+        Yields:
+            memoryview: File content
+
+        Raises:
+            Exception: If file not found or download fails
+        """
+        # Test mode: use in-memory storage
+        if self._is_test_mode():
+            if object_name not in self._test_storage:
+                raise Exception(f"File not found: {object_name}")
+            yield memoryview(self._test_storage[object_name])
+            return
+
+        limiter = None
+        if self._is_local():
+            source = open(self._local_path(object_name), "rb", buffering=0)
+            size = os.fstat(source.fileno()).st_size
+        else:
+            breaker = breakers["storage"]
+            limiter = limiters["storage"]
+            if slot is not None:
+                started = slot.take()
+            else:
+                breaker.acquire()
+                try:
+                    started = limiter.acquire()
+                except LimitExceeded:
+                    breaker.release()
+                    raise
+            try:
+                source = self.client.get_object(settings.MINIO_BUCKET, object_name)
+                size = int(source.headers["Content-Length"])
+            except Exception:
+                limiter.release(started, failed=True)
+                breaker.record_failure()
+                raise
+
+        try:
+            with buffer_pool.acquire(size) as buffer:
+                filled = 0
+                try:
+                    while filled < size:
+                        read = source.readinto(buffer[filled:])
+                        if not read:
+                            raise EOFError(f"Object truncated while reading: {object_name}")
+                        filled += read
+                finally:
+                    # Only the transfer counts against the limit, not the caller's block
+                    if limiter is not None:
+                        limiter.release(started, failed=filled < size, size=filled)
+                        if filled < size:
+                            breaker.record_failure()
+                        else:
+                            breaker.record_success()
+                yield buffer
+        finally:
+            source.close()
+            if hasattr(source, "release_conn"):
+                source.release_conn()
+
+    def download_stream(
+        self, object_name: str, chunk_size: int = 256 * 1024, offset: int = 0
+    ) -> Iterator[bytes]:
+        """
+        Stream file content from storage
+
+        Args:
+            object_name: S3 object key
+            chunk_size: Read size in bytes
+            offset: First byte to stream
+
+        Yields:
+            bytes: File content chunks
+
+        Raises:
+            LimitExceeded: If storage is at its adaptive concurrency limit
+                (CircuitOpen if its circuit is open)
+            Exception: If file not found or download fails
+        """
+        # Test mode: use in-memory storage
+        if self._is_test_mode():
+            if object_name not in self._test_storage:
+                raise Exception(f"File not found: {object_name}")
+            data = self._test_storage[object_name]
+            for start in range(offset, len(data), chunk_size):
+                yield data[start:start + chunk_size]
+            return
+
+        if self._is_local():
+            with open(self._local_path(object_name), "rb") as f:
+                f.seek(offset)
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+
+        # Only opening the stream is guarded: the body is read at the client's pace
+        with breakers["storage"].call(), limiters["storage"].limit_calls():
+            response = self.client.get_object(settings.MINIO_BUCKET, object_name, offset=offset)
         try:
-            return response.read()
+            yield from response.stream(chunk_size)
         finally:
             response.close()
             response.release_conn()
 
+    def open_local(self, object_name: str) -> Optional[BinaryIO]:
+        """
+        Open an object for direct reading when it is stored on local disk
+
+        The returned file is unbuffered (for readinto) and stays readable
+        after the object is deleted.
+
+        Args:
+            object_name: S3 object key
+
+        Returns:
+            Optional[BinaryIO]: Open file, or None for non-local backends
+
+        Raises:
+            FileNotFoundError: If the object does not exist
+        """
+        if self._is_test_mode() or not self._is_local():
+            return None
+        return open(self._local_path(object_name), "rb", buffering=0)
+
+    @tracer.traced("storage.delete", KIND_CLIENT)
     def delete_file(self, object_name: str) -> bool:
         """
         Delete file from storage
@@ -122,6 +445,17 @@ class StorageService:
                 del self._test_storage[object_name]
             return True
 
+        if self._is_local():
+            try:
+                os.remove(self._local_path(object_name))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Storage delete error: {e}")
+                return False
+            return True
+
+        # Not limited: deletes are cleanup and must not fail fast
         try:
             self.client.remove_object(settings.MINIO_BUCKET, object_name)
             return True
@@ -135,6 +469,9 @@ class StorageService:
         if self._is_test_mode():
             return object_name in self._test_storage
 
+        if self._is_local():
+            return os.path.exists(self._local_path(object_name))
+
         try:
             self.client.stat_object(settings.MINIO_BUCKET, object_name)
             return True
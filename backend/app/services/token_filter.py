@@ -0,0 +1,255 @@
+"""
+Token Filter Service - In-process counting Bloom filter of issued token hashes
+
+Lets download endpoints answer 404 for definitely-unknown tokens without a
+database round trip. Each worker rebuilds the filter from the files table
+at startup (and periodically, to purge the tokens of deleted rows) and
+keeps it in sync with other workers through a Redis pub/sub channel.
+
+Downloaded and expired tokens stay in the filter while their rows exist:
+they must reach the database to get 410 rather than 404.
+
+While it is not in sync every token is let through. In sync, a false
+positive just falls through to the database; a false negative (an event
+another worker never received) would answer 404 for a valid share. Events
+carry a per-worker sequence number so a lost one makes the receiver rebuild,
+and a worker whose publish failed asks every worker to rebuild as soon as
+Redis is reachable again.
+"""
+import itertools
+import math
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+
+class CountingBloomFilter:
+    """Counting Bloom filter over SHA-256 hex digests (8-bit saturating counters)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.counters = bytearray(self.size)
+
+    def _indexes(self, token_hash: str) -> List[int]:
+        # Token hashes are already uniform SHA-256 digests: derive k indexes
+        # by double hashing (Kirsch-Mitzenmacher) instead of rehashing
+        digest = bytes.fromhex(token_hash)
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:16], "big") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hash_count)]
+
+    def add(self, token_hash: str) -> None:
+        for index in self._indexes(token_hash):
+            if self.counters[index] < 255:
+                self.counters[index] += 1
+
+    def remove(self, token_hash: str) -> None:
+        indexes = self._indexes(token_hash)
+        if not all(self.counters[index] for index in indexes):
+            return  # Never added: removing would corrupt other entries
+        for index in indexes:
+            # Saturated counters are sticky (their true count is unknown)
+            if self.counters[index] < 255:
+                self.counters[index] -= 1
+
+    def __contains__(self, token_hash: str) -> bool:
+        return all(self.counters[index] for index in self._indexes(token_hash))
+
+
+class TokenFilter:
+    """Worker-local token filter synchronized through Redis pub/sub"""
+
+    CHANNEL = "secureshare:token-filter"
+
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex[:12]
+        self.ready = False
+        self._filter: Optional[CountingBloomFilter] = None
+        self._lock = threading.Lock()
+        # Events received while a rebuild is running
+        self._rebuild_events: Optional[List[Tuple[str, str]]] = None
+        self._client: Optional[object] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Sequence of the events this worker publishes, and the last one
+        # received from each other worker (a gap means an event was lost)
+        self._sequence = itertools.count()
+        self._received: Dict[str, int] = {}
+        # A publish failed: other workers must rebuild
+        self._resync_pending = False
+
+    @property
+    def client(self):
+        """Lazy initialization of Redis client"""
+        if self._client is None and not self._is_test_mode():
+            import redis
+            self._client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._client
+
+    def _is_test_mode(self) -> bool:
+        """Check if running in test mode"""
+        return os.environ.get("ENVIRONMENT") == "test"
+
+    def might_contain(self, token_hash: str) -> bool:
+        """False only if the token hash definitely has no files row"""
+        if not settings.TOKEN_FILTER_ENABLED or not self.ready:
+            return True
+        with self._lock:
+            return token_hash in self._filter
+
+    def rebuild(self, db: Session) -> int:
+        """
+        Rebuild the filter from all files rows (downloaded and expired too)
+
+        Returns:
+            int: Number of token hashes loaded
+        """
+        from app.models.file import File as FileModel
+
+        with self._lock:
+            self._rebuild_events = []
+
+        new_filter = CountingBloomFilter(
+            settings.TOKEN_FILTER_CAPACITY, settings.TOKEN_FILTER_ERROR_RATE
+        )
+        count = 0
+        rows = db.query(FileModel.token_hash).yield_per(10000)
+        for (token_hash,) in rows:
+            new_filter.add(token_hash)
+            count += 1
+
+        with self._lock:
+            # Replay adds seen during the snapshot. Removes are dropped: the
+            # snapshot may already exclude them, and a stale entry is only a
+            # false positive until the next rebuild.
+            for op, token_hash in self._rebuild_events:
+                if op == "add":
+                    new_filter.add(token_hash)
+            self._rebuild_events = None
+            self._filter = new_filter
+            self.ready = True
+        return count
+
+    def _apply(self, op: str, token_hash: str) -> None:
+        with self._lock:
+            if self._rebuild_events is not None:
+                self._rebuild_events.append((op, token_hash))
+            if self._filter is None:
+                return
+            if op == "add":
+                self._filter.add(token_hash)
+            elif op == "remove":
+                self._filter.remove(token_hash)
+
+    def _send(self, op: str, token_hash: str = "") -> None:
+        message = f"{op}:{self.worker_id}:{next(self._sequence)}:{token_hash}"
+        self.client.publish(self.CHANNEL, message)
+
+    def _publish(self, op: str, token_hash: str) -> None:
+        self._apply(op, token_hash)
+        if not settings.TOKEN_FILTER_ENABLED or self._is_test_mode():
+            return
+        try:
+            self._send(op, token_hash)
+        except Exception as e:
+            print(f"Token filter publish failed: {e}")
+            # Other workers miss this event: they rebuild once Redis is back
+            self._resync_pending = True
+
+    def _send_resync(self) -> None:
+        """Ask every other worker to rebuild, if one of our events was lost"""
+        if self._resync_pending:
+            self._send("resync")
+            self._resync_pending = False
+
+    def _receive(self, data: str) -> bool:
+        """
+        Apply an event published by a worker
+
+        Returns:
+            bool: False if an event was lost and the filter must be rebuilt
+        """
+        op, worker_id, sequence, token_hash = data.split(":", 3)
+        if worker_id == self.worker_id:
+            return True
+        last = self._received.get(worker_id)
+        self._received[worker_id] = int(sequence)
+        if op == "resync" or (last is not None and int(sequence) != last + 1):
+            return False
+        self._apply(op, token_hash)
+        return True
+
+    def add(self, token_hash: str) -> None:
+        """Register a new share (locally and on all workers)"""
+        self._publish("add", token_hash)
+
+    def remove(self, token_hash: str) -> None:
+        """Unregister a share whose files row was deleted"""
+        self._publish("remove", token_hash)
+
+    def _listen(self, session_factory: Callable[[], Session]) -> None:
+        """Subscribe to filter events and rebuild after every (re)connection"""
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+
+                # Subscribe before the snapshot so no event is missed
+                self._received.clear()
+                db = session_factory()
+                try:
+                    self.rebuild(db)
+                finally:
+                    db.close()
+                rebuilt_at = time.monotonic()
+
+                while not self._stop.is_set():
+                    self._send_resync()
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        if not self._receive(message["data"]):
+                            # Let every token through until the rebuild is done
+                            self.ready = False
+                            break
+                    if time.monotonic() - rebuilt_at > settings.TOKEN_FILTER_REBUILD_SECONDS:
+                        break  # Resubscribe and rebuild to purge expired entries
+            except Exception as e:
+                print(f"Token filter sync failed: {e}")
+                self.ready = False
+                self._stop.wait(5)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+    def start(self, session_factory: Callable[[], Session]) -> None:
+        """Start background synchronization (no-op in test mode)"""
+        if not settings.TOKEN_FILTER_ENABLED or self._is_test_mode() or self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(session_factory,), name="token-filter", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop background synchronization"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.ready = False
+
+
+# Singleton instance
+token_filter = TokenFilter()
@@ -0,0 +1,66 @@
+"""
+ZIP Stream - Builds a ZIP archive on the fly
+
+Members are written with data descriptors (sizes and CRC after the data),
+so the archive can be produced from streams of unknown content without
+seeking, temporary files or buffering whole members.
+"""
+import zipfile
+from datetime import datetime
+from typing import Iterable, Iterator, List, Tuple
+
+ZipMember = Tuple[str, int, datetime, Iterable[bytes]]  # (name, size, modified, chunks)
+
+COMPRESSION_METHODS = {
+    "store": zipfile.ZIP_STORED,
+    "deflate": zipfile.ZIP_DEFLATED,
+}
+
+
+class _Sink:
+    """Write-only file object collecting archive bytes until drained"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self.chunks.append(data if isinstance(data, bytes) else bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_zip(members: Iterable[ZipMember], compression: str = "store") -> Iterator[bytes]:
+    """
+    Stream a ZIP archive
+
+    Args:
+        members: (name, size, modified, chunks) per member; size is the
+            expected uncompressed size (used to switch to ZIP64)
+        compression: "store" or "deflate"
+
+    Yields:
+        bytes: Archive chunks
+    """
+    method = COMPRESSION_METHODS[compression]
+    sink = _Sink()
+
+    with zipfile.ZipFile(sink, mode="w", compression=method, allowZip64=True) as archive:
+        for name, size, modified, chunks in members:
+            info = zipfile.ZipInfo(name, date_time=modified.timetuple()[:6])
+            info.compress_type = method
+            info.file_size = size
+            with archive.open(info, mode="w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    if sink.chunks:
+                        yield sink.drain()
+            yield sink.drain()
+
+    yield sink.drain()
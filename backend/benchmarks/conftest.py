@@ -0,0 +1,135 @@
+"""
+Micro-benchmark fixtures (pytest-benchmark style)
+
+Usage:
+    pytest benchmarks/ --no-cov --benchmark-save=micro.json
+    pytest benchmarks/ --no-cov --benchmark-compare=micro.json --benchmark-threshold=15
+
+With --benchmark-compare, a benchmark fails when its median per-call time
+regresses by more than --benchmark-threshold percent against the saved run.
+"""
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Optional
+
+import pytest
+
+# Set test environment before imports (in-memory storage, no Redis/ClamAV)
+os.environ["ENVIRONMENT"] = "test"
+os.environ["ANTIVIRUS_ENABLED"] = "false"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["DEBUG"] = "false"
+
+_results: Dict[str, Dict[str, Any]] = {}
+_baseline: Dict[str, Dict[str, Any]] = {}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("micro-benchmarks")
+    group.addoption("--benchmark-save", default=None, help="Write results to this JSON file")
+    group.addoption("--benchmark-compare", default=None, help="Baseline JSON file")
+    group.addoption("--benchmark-threshold", type=float, default=10.0,
+                    help="Allowed median regression in percent")
+    group.addoption("--benchmark-rounds", type=int, default=15)
+    group.addoption("--benchmark-min-time", type=float, default=0.02,
+                    help="Minimum seconds per round")
+
+
+def pytest_configure(config):
+    path = config.getoption("--benchmark-compare", default=None)
+    if path:
+        with open(path) as f:
+            _baseline.update(json.load(f)["benchmarks"])
+
+
+def pytest_sessionfinish(session, exitstatus):
+    path = session.config.getoption("--benchmark-save", default=None)
+    if path and _results:
+        with open(path, "w") as f:
+            json.dump({"benchmarks": _results}, f, indent=2, sort_keys=True)
+
+    if _results:
+        print(f"\n{'benchmark':<50} {'median us':>12} {'min us':>10} {'alloc KB':>10} {'blocks':>8}")
+        for name, result in sorted(_results.items()):
+            print(f"{name:<50} {result['median'] * 1e6:>12.2f} {result['min'] * 1e6:>10.2f} "
+                  f"{result['peak_alloc_bytes'] / 1024:>10.1f} {result['alloc_blocks']:>8}")
+
+
+class Benchmark:
+    """Times a callable and records per-call cost and allocations"""
+
+    def __init__(self, name: str, config):
+        self.name = name
+        self.rounds = config.getoption("--benchmark-rounds")
+        self.min_time = config.getoption("--benchmark-min-time")
+        self.threshold = config.getoption("--benchmark-threshold")
+
+    def _calibrate(self, func: Callable[[], Any]) -> int:
+        """Find an iteration count so one round lasts at least min_time"""
+        iterations = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            if time.perf_counter() - start >= self.min_time or iterations >= 1_000_000:
+                return iterations
+            iterations *= 2
+
+    @staticmethod
+    def _allocations(func: Callable[[], Any]) -> Dict[str, int]:
+        """Peak bytes and new memory blocks allocated by one call"""
+        tracemalloc.start()
+        try:
+            before = tracemalloc.take_snapshot()
+            tracemalloc.reset_peak()
+            baseline_current, _ = tracemalloc.get_traced_memory()
+            result = func()
+            _, peak = tracemalloc.get_traced_memory()
+            after = tracemalloc.take_snapshot()
+            del result
+        finally:
+            tracemalloc.stop()
+        blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+        return {"peak_alloc_bytes": peak - baseline_current, "alloc_blocks": blocks}
+
+    def __call__(self, func: Callable, *args, **kwargs) -> Any:
+        call = lambda: func(*args, **kwargs)  # noqa: E731
+        result = call()  # Warm up
+        iterations = self._calibrate(call)
+
+        timings = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                call()
+            timings.append((time.perf_counter() - start) / iterations)
+
+        record = {
+            "median": statistics.median(timings),
+            "min": min(timings),
+            "stddev": statistics.pstdev(timings),
+            "rounds": self.rounds,
+            "iterations": iterations,
+        }
+        record.update(self._allocations(call))
+        _results[self.name] = record
+
+        baseline: Optional[Dict[str, Any]] = _baseline.get(self.name)
+        if baseline:
+            regression = (record["median"] - baseline["median"]) / baseline["median"] * 100
+            if regression > self.threshold:
+                pytest.fail(
+                    f"{self.name} regressed {regression:.1f}% "
+                    f"({baseline['median'] * 1e6:.2f}us -> {record['median'] * 1e6:.2f}us, "
+                    f"threshold {self.threshold}%)"
+                )
+        return result
+
+
+@pytest.fixture
+def benchmark(request) -> Benchmark:
+    """Benchmark runner named after the test (including parameters)"""
+    return Benchmark(request.node.name, request.config)
@@ -0,0 +1,86 @@
+"""
+Fake clamd server for benchmarks
+
+Speaks enough of the clamd protocol (PING, INSTREAM) for
+app.services.antivirus to scan against it. Reports the EICAR test
+signature as infected and everything else as clean.
+
+Usage:
+    python -m benchmarks.fake_clamd --port 3310
+"""
+import argparse
+import socketserver
+import struct
+import threading
+from typing import Tuple
+
+EICAR_MARKER = b"EICAR-STANDARD-ANTIVIRUS-TEST-FILE"
+
+
+class ClamdHandler(socketserver.StreamRequestHandler):
+    """Handle one clamd command per connection (like clamd.ClamdNetworkSocket)"""
+
+    def handle(self) -> None:
+        command = self.rfile.readline().strip().rstrip(b"\0")
+        if command[:1] in (b"n", b"z"):
+            command = command[1:]
+
+        if command == b"PING":
+            self.wfile.write(b"PONG\n")
+        elif command == b"VERSION":
+            self.wfile.write(b"ClamAV 1.0.0/fake\n")
+        elif command == b"INSTREAM":
+            infected = False
+            tail = b""
+            while True:
+                header = self.rfile.read(4)
+                if len(header) < 4:
+                    return
+                (length,) = struct.unpack("!L", header)
+                if length == 0:
+                    break
+                chunk = self.rfile.read(length)
+                # Keep a tail so the marker is found across chunk boundaries
+                infected = infected or EICAR_MARKER in tail + chunk
+                tail = chunk[-len(EICAR_MARKER):]
+            if infected:
+                self.wfile.write(b"stream: Eicar-Test-Signature FOUND\n")
+            else:
+                self.wfile.write(b"stream: OK\n")
+        else:
+            self.wfile.write(b"UNKNOWN COMMAND\n")
+
+
+class FakeClamd(socketserver.ThreadingTCPServer):
+    """Threaded fake clamd"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_fake_clamd(host: str = "127.0.0.1", port: int = 0) -> Tuple[FakeClamd, int]:
+    """
+    Start a fake clamd in a background thread
+
+    Returns:
+        Tuple[FakeClamd, int]: (server, bound port)
+    """
+    server = FakeClamd((host, port), ClamdHandler)
+    thread = threading.Thread(target=server.serve_forever, name="fake-clamd", daemon=True)
+    thread.start()
+    return server, server.server_address[1]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake clamd for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=3310)
+    args = parser.parse_args()
+
+    server = FakeClamd((args.host, args.port), ClamdHandler)
+    print(f"Fake clamd listening on {args.host}:{server.server_address[1]}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Load test for the upload/download pipeline
+
+By default the app runs in-process (ASGI) in each worker process against
+local stand-ins: in-memory storage (test mode), a fake clamd and a
+per-worker SQLite database. Every worker drives concurrent
+upload -> download cycles for each size of the matrix. Workers start each
+size together, so req/s and MB/s are aggregated across workers.
+
+Reports req/s, MB/s, p50/p95/p99 latency, per-stage timings (from the
+Server-Timing header) and peak RSS per worker, and writes them to a JSON
+file for comparison between commits.
+
+Usage:
+    python -m benchmarks.load_test --sizes 1KB,1MB,10MB --workers 2 \\
+        --concurrency 8 --output bench.json
+    python -m benchmarks.load_test --url http://localhost:8000 --sizes 1MB
+    python -m benchmarks.load_test --compare bench-before.json bench.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+DEFAULT_SIZES = "1KB,64KB,1MB,10MB,100MB"
+UNITS = {"KB": 1024, "MB": 1024 * 1024, "GB": 1024 * 1024 * 1024, "B": 1}
+
+
+def parse_size(label: str) -> int:
+    """Parse a size label such as 64KB or 10MB"""
+    label = label.strip().upper()
+    for unit in ("KB", "MB", "GB", "B"):
+        if label.endswith(unit):
+            return int(float(label[: -len(unit)]) * UNITS[unit])
+    return int(label)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Parse a Server-Timing header into {stage: milliseconds}"""
+    stages: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and params.startswith("dur="):
+            stages[name] = float(params[4:])
+    return stages
+
+
+def make_payload(size: int, kind: str, seed: int) -> bytes:
+    """Deterministic payload: random (incompressible) or text (compressible)"""
+    if kind == "text":
+        line = b"2026-10-19T12:00:00Z INFO request handled status=200 duration_ms=12\n"
+        return (line * (size // len(line) + 1))[:size]
+    return random.Random(seed).randbytes(size)
+
+
+def _configure_environment(db_path: str, clamd_port: Optional[int]) -> None:
+    """Point the app at local stand-ins (must run before importing app)"""
+    os.environ.update({
+        "ENVIRONMENT": "test",
+        "DEBUG": "false",
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "RATE_LIMIT_ENABLED": "false",
+        "SERVER_TIMING_ENABLED": "true",
+        "ANTIVIRUS_ENABLED": "true" if clamd_port else "false",
+        "CLAMAV_HOST": "127.0.0.1",
+        "CLAMAV_PORT": str(clamd_port or 3310),
+        # Random payloads are sniffed as application/octet-stream
+        "ALLOWED_MIME_TYPES": "application/octet-stream,text/plain",
+    })
+
+
+def _local_client():
+    """Build an in-process ASGI client bound to a private SQLite database"""
+    import httpx
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.core.config import settings
+    from app.core.database import Base, get_db
+    from app.main import app
+
+    engine = create_engine(
+        settings.DATABASE_URL, connect_args={"check_same_thread": False, "timeout": 30}
+    )
+    Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app, client=("127.0.0.1", 50000)),
+        base_url="http://bench",
+        timeout=None,
+    )
+
+
+async def _cycle(client, payload: bytes, mime_type: str, samples: Dict[str, List]) -> None:
+    """One upload followed by the download of the same file"""
+    files = {"file": ("bench.bin", payload, mime_type)}
+    start = time.perf_counter()
+    response = await client.post("/api/v1/upload", files=files)
+    elapsed = time.perf_counter() - start
+    if response.status_code != 201:
+        samples["upload"].append((elapsed, None, False))
+        return
+    samples["upload"].append((elapsed, parse_server_timing(response.headers.get("server-timing")), True))
+
+    token = response.json()["download_token"]
+    start = time.perf_counter()
+    response = await client.get(f"/api/v1/download/{token}")
+    body = response.content
+    elapsed = time.perf_counter() - start
+    ok = response.status_code == 200 and len(body) == len(payload)
+    samples["download"].append((elapsed, parse_server_timing(response.headers.get("server-timing")), ok))
+
+
+async def _run_size(client, payload: bytes, mime_type: str, requests: int, concurrency: int):
+    samples: Dict[str, List] = {"upload": [], "download": []}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded() -> None:
+        async with semaphore:
+            await _cycle(client, payload, mime_type, samples)
+
+    await asyncio.gather(*(bounded() for _ in range(requests)))
+    return samples
+
+
+def _worker(index: int, config: Dict[str, Any], barrier, results) -> None:
+    """Worker process: run the whole size matrix"""
+    if config["url"]:
+        import httpx
+        client = httpx.AsyncClient(base_url=config["url"], timeout=None)
+    else:
+        db_path = os.path.join(config["tmp_dir"], f"worker-{index}.db")
+        _configure_environment(db_path, config["clamd_port"])
+        client = _local_client()
+
+    mime_type = "text/plain" if config["payload"] == "text" else "application/octet-stream"
+    per_size = []
+
+    async def run() -> None:
+        async with client:
+            for size in config["sizes"]:
+                payload = make_payload(size, config["payload"], seed=size)
+                requests = max(1, min(config["requests"], config["max_bytes_per_size"] // size))
+                barrier.wait()
+                started = time.time()
+                samples = await _run_size(client, payload, mime_type, requests, config["concurrency"])
+                per_size.append({
+                    "size": size,
+                    "started": started,
+                    "finished": time.time(),
+                    "samples": samples,
+                })
+
+    asyncio.run(run())
+    # ru_maxrss is in KB on Linux
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    results.put({"worker": index, "pid": os.getpid(), "peak_rss_mb": peak_rss_mb, "sizes": per_size})
+
+
+def _aggregate(worker_results: List[Dict[str, Any]], sizes: List[int]) -> List[Dict[str, Any]]:
+    """Merge worker samples per (size, operation)"""
+    rows = []
+    for size in sizes:
+        runs = [run for worker in worker_results for run in worker["sizes"] if run["size"] == size]
+        if not runs:
+            continue
+        wall = max(run["finished"] for run in runs) - min(run["started"] for run in runs)
+        for op in ("upload", "download"):
+            samples = [sample for run in runs for sample in run["samples"][op]]
+            ok = [sample for sample in samples if sample[2]]
+            latencies = [sample[0] * 1000 for sample in ok]
+            stages: Dict[str, List[float]] = {}
+            for _, timings, _ in ok:
+                for stage, ms in (timings or {}).items():
+                    stages.setdefault(stage, []).append(ms)
+            rows.append({
+                "size": size,
+                "op": op,
+                "requests": len(samples),
+                "errors": len(samples) - len(ok),
+                "req_per_s": len(ok) / wall if wall else 0.0,
+                "mb_per_s": len(ok) * size / (1024 * 1024) / wall if wall else 0.0,
+                "latency_ms": {
+                    "p50": percentile(latencies, 50),
+                    "p95": percentile(latencies, 95),
+                    "p99": percentile(latencies, 99),
+                    "max": max(latencies, default=0.0),
+                },
+                "stages_ms": {
+                    stage: {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+                    for stage, values in sorted(stages.items())
+                },
+            })
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return None
+
+
+def run_load_test(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Run the load test and return the report"""
+    clamd_server = None
+    if not config["url"] and config["fake_clamd"]:
+        from benchmarks.fake_clamd import start_fake_clamd
+        clamd_server, config["clamd_port"] = start_fake_clamd()
+
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(config["workers"])
+    results = context.Queue()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config["tmp_dir"] = tmp_dir
+        processes = [
+            context.Process(target=_worker, args=(index, config, barrier, results))
+            for index in range(config["workers"])
+        ]
+        for process in processes:
+            process.start()
+        worker_results = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    if clamd_server:
+        clamd_server.shutdown()
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in config.items() if k != "tmp_dir"},
+        },
+        "results": _aggregate(worker_results, config["sizes"]),
+        "workers": [
+            {"worker": w["worker"], "pid": w["pid"], "peak_rss_mb": round(w["peak_rss_mb"], 1)}
+            for w in sorted(worker_results, key=lambda w: w["worker"])
+        ],
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'size':>10} {'op':>8} {'req':>5} {'err':>4} {'req/s':>8} {'MB/s':>8} "
+          f"{'p50ms':>8} {'p95ms':>8} {'p99ms':>8}  stages p50 (ms)")
+    for row in report["results"]:
+        stages = " ".join(f"{k}={v['p50']:.1f}" for k, v in row["stages_ms"].items())
+        latency = row["latency_ms"]
+        print(f"{row['size']:>10} {row['op']:>8} {row['requests']:>5} {row['errors']:>4} "
+              f"{row['req_per_s']:>8.1f} {row['mb_per_s']:>8.1f} {latency['p50']:>8.1f} "
+              f"{latency['p95']:>8.1f} {latency['p99']:>8.1f}  {stages}")
+    for worker in report["workers"]:
+        print(f"worker {worker['worker']} (pid {worker['pid']}): peak RSS {worker['peak_rss_mb']} MB")
+
+
+def compare_reports(before: Dict[str, Any], after: Dict[str, Any]) -> None:
+    """Print per (size, op) deltas between two reports"""
+    previous = {(row["size"], row["op"]): row for row in before["results"]}
+    print(f"{before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"{'size':>10} {'op':>8} {'req/s':>16} {'p95 ms':>18}")
+    for row in after["results"]:
+        old = previous.get((row["size"], row["op"]))
+        if not old:
+            continue
+
+        def delta(new_value: float, old_value: float) -> str:
+            change = (new_value - old_value) / old_value * 100 if old_value else 0.0
+            return f"{new_value:.1f} ({change:+.0f}%)"
+
+        print(f"{row['size']:>10} {row['op']:>8} "
+              f"{delta(row['req_per_s'], old['req_per_s']):>16} "
+              f"{delta(row['latency_ms']['p95'], old['latency_ms']['p95']):>18}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Upload/download load test")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Comma-separated size matrix")
+    parser.add_argument("--requests", type=int, default=50, help="Cycles per size per worker")
+    parser.add_argument("--max-bytes-per-size", default="1GB",
+                        help="Cap cycles per worker so large sizes stay bounded")
+    parser.add_argument("--concurrency", type=int, default=8, help="In-flight cycles per worker")
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes")
+    parser.add_argument("--payload", choices=["random", "text"], default="random")
+    parser.add_argument("--url", default=None, help="Target a running server instead")
+    parser.add_argument("--no-fake-clamd", action="store_true", help="Skip antivirus scanning")
+    parser.add_argument("--output", default="bench.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"),
+                        help="Compare two reports instead of running")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as before, open(args.compare[1]) as after:
+            compare_reports(json.load(before), json.load(after))
+        return
+
+    config = {
+        "sizes": [parse_size(size) for size in args.sizes.split(",")],
+        "requests": args.requests,
+        "max_bytes_per_size": parse_size(args.max_bytes_per_size),
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "payload": args.payload,
+        "url": args.url,
+        "fake_clamd": not args.no_fake_clamd,
+        "clamd_port": None,
+    }
+    report = run_load_test(config)
+    print_report(report)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
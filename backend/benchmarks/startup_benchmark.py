@@ -0,0 +1,106 @@
+"""
+Startup-time benchmark
+
+Each run starts a fresh interpreter and measures:
+- import: time to import app.main (module-level service construction)
+- live: time from import until the app answers /health (lifespan startup)
+- ready: time from import until /ready returns 200 (dependencies initialized)
+
+By default the app runs in test mode against a temporary SQLite database,
+with ClamAV pointed at an unroutable address so a slow dependency shows up
+in "ready" but must not delay "live".
+
+Usage:
+    python -m benchmarks.startup_benchmark --runs 10 --output startup.json
+    python -m benchmarks.startup_benchmark --real-env
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List
+
+from benchmarks.load_test import percentile
+
+CHILD = r"""
+import json, time
+start = time.perf_counter()
+import app.main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app.main.app) as client:
+    assert client.get("/health").status_code == 200
+    live = time.perf_counter()
+    ready = None
+    deadline = live + READY_TIMEOUT
+    while time.perf_counter() < deadline:
+        if client.get("/ready").status_code == 200:
+            ready = time.perf_counter()
+            break
+        time.sleep(0.005)
+print(json.dumps({
+    "import_ms": (imported - start) * 1000,
+    "live_ms": (live - imported) * 1000,
+    "ready_ms": (ready - imported) * 1000 if ready else None,
+}))
+"""
+
+
+def run_once(env: Dict[str, str], ready_timeout: float) -> Dict[str, Any]:
+    """Start one interpreter and return its timings"""
+    code = CHILD.replace("READY_TIMEOUT", repr(ready_timeout))
+    output = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary = {}
+    for key in ("import_ms", "live_ms", "ready_ms"):
+        values = [run[key] for run in runs if run[key] is not None]
+        summary[key] = {
+            "p50": round(percentile(values, 50), 1),
+            "max": round(max(values), 1) if values else 0.0,
+            "missing": len(runs) - len(values),
+        }
+    return summary
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Startup-time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--ready-timeout", type=float, default=15.0)
+    parser.add_argument("--real-env", action="store_true",
+                        help="Use the current environment instead of local stand-ins")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.real_env:
+            env.update({
+                "ENVIRONMENT": "test",
+                "DATABASE_URL": f"sqlite:///{os.path.join(tmp, 'startup.db')}",
+                "CLAMAV_HOST": "10.255.255.1",
+                "TRACING_ENABLED": "false",
+            })
+        runs = [run_once(env, args.ready_timeout) for _ in range(args.runs)]
+
+    report = {"runs": runs, "summary": summarize(runs)}
+    for key, stats in report["summary"].items():
+        print(f"{key:>10}: p50 {stats['p50']:>8.1f}  max {stats['max']:>8.1f}"
+              + (f"  (not reached in {stats['missing']} runs)" if stats["missing"] else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Micro-benchmarks for hot paths: encryption, tokens and middleware
+
+Inputs are fixed (seeded payloads, constant tokens) so runs are comparable
+between commits.
+"""
+import asyncio
+import os
+import random
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from app.core.buffer_pool import buffer_pool
+from app.core.config import settings
+from app.middleware.rate_limit import RateLimitMiddleware
+from app.middleware.security_headers import SecurityHeadersMiddleware
+from app.services.cipher_suites import SUITES
+from app.services.encryption import EncryptionService
+from app.services.token_service import TokenService
+
+SIZES = [1024, 64 * 1024, 1024 * 1024, 16 * 1024 * 1024]
+TOKEN = "Jd3Jm1sVb2D0xv8yJ0n2f6wQp9r4Tz7uKc5hLa1eNbM"
+
+
+def _payload(size: int) -> bytes:
+    return random.Random(size).randbytes(size)
+
+
+@pytest.fixture(scope="module")
+def encryption() -> EncryptionService:
+    return EncryptionService(keys={"1": bytes(range(32))}, active_version="1")
+
+
+class TestEncryptionBenchmarks:
+    """EncryptionService per-call cost by payload size"""
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_encrypt_file(self, benchmark, encryption, size):
+        data = _payload(size)
+        benchmark(encryption.encrypt_file, data)
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_encrypt_into_pooled(self, benchmark, encryption, size):
+        """Upload path: encrypt into a pooled buffer instead of new bytes"""
+        data = _payload(size)
+
+        def encrypt():
+            with buffer_pool.acquire(encryption.ciphertext_size(size)) as out:
+                encryption.encrypt_into(data, out)
+
+        benchmark(encrypt)
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_decrypt_file(self, benchmark, encryption, size):
+        ciphertext, metadata = encryption.encrypt_file(_payload(size))
+        assert benchmark(encryption.decrypt_file, ciphertext, metadata) == _payload(size)
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_decrypt_stream(self, benchmark, encryption, size):
+        """Streaming decryption of chunks as delivered by object storage"""
+        ciphertext, metadata = encryption.encrypt_file(_payload(size))
+        chunks = [ciphertext[i:i + 32 * 1024] for i in range(0, len(ciphertext), 32 * 1024)]
+
+        def consume():
+            for _ in encryption.decrypt_stream(chunks, metadata):
+                pass
+
+        benchmark(consume)
+
+    @pytest.mark.parametrize("size", SIZES)
+    def test_decrypt_local_file(self, benchmark, encryption, size, tmp_path):
+        """Local-disk download path: readinto a reused buffer, decrypt per segment"""
+        ciphertext, metadata = encryption.encrypt_file(_payload(size))
+        path = tmp_path / "object.enc"
+        path.write_bytes(ciphertext)
+
+        def consume():
+            with open(path, "rb", buffering=0) as f:
+                for _ in encryption.decrypt_fileobj(f, metadata):
+                    pass
+
+        benchmark(consume)
+
+    @pytest.mark.parametrize("suite", [name for name, suite in SUITES.items() if suite.available])
+    def test_encrypt_by_suite(self, benchmark, suite):
+        """Per-suite cost on this host (what the startup self-benchmark compares)"""
+        service = EncryptionService(keys={"1": bytes(range(32))}, active_version="1", suite=suite)
+        benchmark(service.encrypt_file, _payload(1024 * 1024))
+
+
+LARGE_SIZE = 100 * 1024 * 1024
+PARALLELISM = sorted({1, 2, 4, os.cpu_count() or 1})
+
+
+@pytest.fixture(scope="module")
+def large_payload() -> bytes:
+    return _payload(LARGE_SIZE)
+
+
+class TestParallelEncryptionBenchmarks:
+    """Single-file throughput on a 100 MB object by parallelism degree"""
+
+    @pytest.mark.parametrize("parallelism", PARALLELISM)
+    def test_encrypt_large(self, benchmark, large_payload, parallelism):
+        service = EncryptionService(
+            keys={"1": bytes(range(32))}, active_version="1", parallelism=parallelism
+        )
+        out = bytearray(service.ciphertext_size(LARGE_SIZE))
+        benchmark(service.encrypt_into, large_payload, memoryview(out))
+        service.shutdown()
+
+    @pytest.mark.parametrize("parallelism", PARALLELISM)
+    def test_decrypt_large(self, benchmark, large_payload, parallelism):
+        service = EncryptionService(
+            keys={"1": bytes(range(32))}, active_version="1", parallelism=parallelism
+        )
+        ciphertext, metadata = service.encrypt_file(large_payload)
+        out = bytearray(LARGE_SIZE)
+        benchmark(service.decrypt_into, ciphertext, metadata, memoryview(out))
+        assert out == large_payload
+        service.shutdown()
+
+
+class TestTokenBenchmarks:
+    """TokenService per-call cost"""
+
+    def test_generate_token(self, benchmark):
+        benchmark(TokenService.generate_token)
+
+    def test_hash_token(self, benchmark):
+        benchmark(TokenService.hash_token, TOKEN)
+
+
+class FakeRedis:
+    """In-memory stand-in for the sorted-set commands used by the rate limiter"""
+
+    def __init__(self):
+        self.sets = {}
+
+    def zremrangebyscore(self, key, min_score, max_score):
+        members = self.sets.get(key, {})
+        for member in [m for m, score in members.items() if min_score <= score <= max_score]:
+            del members[member]
+
+    def zcard(self, key):
+        return len(self.sets.get(key, {}))
+
+    def zadd(self, key, mapping):
+        self.sets.setdefault(key, {}).update(mapping)
+
+    def expire(self, key, seconds):
+        return True
+
+
+def _asgi_app():
+    async def ping(request):
+        return PlainTextResponse("pong")
+
+    return Starlette(routes=[Route("/api/v1/download/info/x", ping)])
+
+
+def _asgi_caller(app):
+    """Synchronously drive one GET request through an ASGI app"""
+    loop = asyncio.new_event_loop()
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/api/v1/download/info/x",
+        "raw_path": b"/api/v1/download/info/x",
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def send(message):
+        pass
+
+    def call():
+        body_sent = False
+
+        async def receive():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # Client stays connected until the response is complete
+            await asyncio.Future()
+
+        loop.run_until_complete(app(dict(scope), receive, send))
+
+    return call, loop
+
+
+class TestMiddlewareBenchmarks:
+    """Per-request overhead of middleware (compare with test_bare_app)"""
+
+    def test_bare_app(self, benchmark):
+        call, loop = _asgi_caller(_asgi_app())
+        try:
+            benchmark(call)
+        finally:
+            loop.close()
+
+    def test_security_headers_middleware(self, benchmark):
+        call, loop = _asgi_caller(SecurityHeadersMiddleware(_asgi_app()))
+        try:
+            benchmark(call)
+        finally:
+            loop.close()
+
+    def test_rate_limit_middleware(self, benchmark, monkeypatch):
+        monkeypatch.setattr(settings, "RATE_LIMIT_ENABLED", True)
+        # Generous limits: measure the check itself, not 429 responses
+        monkeypatch.setattr(settings, "RATE_LIMIT_GLOBAL_PER_MINUTE", 10**9)
+        monkeypatch.setattr(settings, "RATE_LIMIT_DOWNLOAD_PER_HOUR", 10**9)
+        middleware = RateLimitMiddleware(_asgi_app())
+        middleware.redis_client = FakeRedis()
+        call, loop = _asgi_caller(middleware)
+        try:
+            benchmark(call)
+        finally:
+            loop.close()
@@ -5,6 +5,12 @@ import pytest
 import io
 from fastapi.testclient import TestClient
 
+from app.core.config import settings
+from app.models.audit_log import AuditLog
+from app.models.blob import Blob
+from app.models.file import File
+from app.services.storage import storage_service
+
 
 class TestHealthEndpoint:
     """Tests for health check endpoint"""
@@ -23,6 +29,55 @@ class TestHealthEndpoint:
         assert "status" in data
         assert data["status"] == "healthy"
 
+    def test_ready_reports_dependencies(self, client: TestClient):
+        """Test readiness endpoint once dependencies are initialized"""
+        from app.core.container import container
+
+        client.portal.call(container.initialize)
+        response = client.get("/ready")
+
+        assert response.status_code == 200
+        dependencies = response.json()["dependencies"]
+        assert set(dependencies) == {"database", "redis", "storage", "antivirus", "kms"}
+        assert all(d["latency_ms"] is not None for d in dependencies.values())
+
+    def test_ready_503_when_required_dependency_down(self, client: TestClient, monkeypatch):
+        """Test readiness fails (liveness still passes) if a required dependency is down"""
+        from app.core.container import container
+
+        def unreachable():
+            raise ConnectionError("connection refused")
+
+        # Cancel the startup initialization so it cannot race the re-run
+        if container._task is not None:
+            client.portal.call(container.stop)
+        monkeypatch.setattr(container.dependencies["database"], "init", unreachable)
+        monkeypatch.setattr(container.dependencies["database"], "ready", True)
+        client.portal.call(container.initialize)
+
+        assert client.get("/ready").status_code == 503
+        assert client.get("/health").status_code == 200
+
+    def test_uploads_shed_while_required_dependency_down(
+        self, client: TestClient, monkeypatch, sample_file_content: bytes
+    ):
+        """Test uploads get 503 + Retry-After (downloads still served) while a dependency is down"""
+        from app.core.container import container
+
+        if container._task is not None:
+            client.portal.call(container.stop)
+        database = container.dependencies["database"]
+        monkeypatch.setattr(database, "ready", False)
+        monkeypatch.setattr(database, "error", "connection refused")
+
+        files = {"file": ("a.txt", io.BytesIO(sample_file_content), "text/plain")}
+        response = client.post("/api/v1/upload", files=files)
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "10"
+        assert response.json()["unavailable"] == ["database"]
+        assert client.get("/api/v1/download/info/missing").status_code != 503
+
 
 class TestUploadEndpoint:
     """Tests for file upload endpoint"""
@@ -78,6 +133,64 @@ class TestUploadEndpoint:
         assert response.status_code == 400
         assert "Empty file" in response.json()["detail"]
 
+    def test_upload_disallowed_type_rejected(self, client: TestClient, db):
+        """Test that the detected type, not the declared one, is checked"""
+        executable = b"MZ\x90\x00" + bytes(100)
+        files = {"file": ("report.pdf", io.BytesIO(executable), "application/pdf")}
+
+        response = client.post("/api/v1/upload", files=files)
+
+        assert response.status_code == 415
+        assert "application/x-msdownload" in response.json()["detail"]
+        blocked = db.query(AuditLog).filter(AuditLog.event_type == "mime_blocked").one()
+        assert blocked.event_metadata["declared_mime_type"] == "application/pdf"
+
+    def test_upload_stores_detected_type(
+        self, client: TestClient, sample_file_content: bytes
+    ):
+        """Test that an allowed file declared with the wrong type is stored as detected"""
+        files = {"file": ("notes.pdf", io.BytesIO(sample_file_content), "application/pdf")}
+
+        response = client.post("/api/v1/upload", files=files)
+
+        assert response.status_code == 201
+        assert response.json()["mime_type"] == "text/plain"
+
+    def test_upload_too_large_rejected_while_streaming(self, client: TestClient, monkeypatch):
+        """Test that the size limit is enforced on the streamed body"""
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "MAX_FILE_SIZE_MB", 1)
+        files = {"file": ("big.txt", io.BytesIO(b"a" * (1024 * 1024 + 1)), "text/plain")}
+
+        response = client.post("/api/v1/upload", files=files)
+
+        assert response.status_code == 413
+
+    def test_upload_with_too_many_form_fields_rejected(self, client: TestClient):
+        """Test that a flood of small form fields is refused with 413"""
+        fields = {f"field{i}": "x" for i in range(100)}
+        files = {"file": ("a.txt", io.BytesIO(b"hello"), "text/plain")}
+
+        response = client.post("/api/v1/upload", data=fields, files=files)
+
+        assert response.status_code == 413
+
+    def test_upload_rejected_when_memory_budget_exhausted(
+        self, client: TestClient, monkeypatch, sample_file_content: bytes
+    ):
+        """Test that uploads get 503 + Retry-After while the memory budget is used up"""
+        from app.core.admission import admission_controller
+
+        monkeypatch.setattr(admission_controller, "reserved", admission_controller.budget_bytes)
+        monkeypatch.setattr(admission_controller, "max_queue", 0)
+        files = {"file": ("a.txt", io.BytesIO(sample_file_content), "text/plain")}
+
+        response = client.post("/api/v1/upload", files=files)
+
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "5"
+
     def test_upload_without_file_fails(self, client: TestClient):
         """Test that request without file fails"""
         response = client.post("/api/v1/upload")
@@ -99,6 +212,25 @@ class TestUploadEndpoint:
 
         assert token1 != token2
 
+    def test_failed_commit_deletes_stored_object(
+        self, client: TestClient, monkeypatch, sample_filename: str
+    ):
+        """Test that an upload whose row can't be saved doesn't leave its object behind"""
+        from sqlalchemy.exc import IntegrityError
+        from app.api.v1 import upload
+
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        monkeypatch.setattr(upload.token_service, "generate_token", lambda: ("token", "0" * 64))
+        files = {"file": (sample_filename, io.BytesIO(b"first upload"), "text/plain")}
+        assert client.post("/api/v1/upload", files=files).status_code == 201
+        stored = set(storage_service._test_storage)
+
+        # Same token hash: the insert fails after the object was stored
+        files = {"file": (sample_filename, io.BytesIO(b"second upload"), "text/plain")}
+        with pytest.raises(IntegrityError):
+            client.post("/api/v1/upload", files=files)
+        assert set(storage_service._test_storage) == stored
+
 
 class TestDownloadEndpoint:
     """Tests for file download endpoint"""
@@ -118,6 +250,47 @@ class TestDownloadEndpoint:
         assert download_response.status_code == 200
         assert download_response.content == sample_file_content
 
+    def test_download_503_keeps_file_downloadable(
+        self, client: TestClient, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that a download refused for memory doesn't consume the one-time token"""
+        from app.core.admission import admission_controller
+
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        token = client.post("/api/v1/upload", files=files).json()["download_token"]
+
+        with monkeypatch.context() as patch:
+            patch.setattr(admission_controller, "reserved", admission_controller.budget_bytes)
+            patch.setattr(admission_controller, "max_queue", 0)
+            assert client.get(f"/api/v1/download/{token}").status_code == 503
+
+        response = client.get(f"/api/v1/download/{token}")
+        assert response.content == sample_file_content
+        assert admission_controller.reserved == 0
+
+    def test_download_refused_by_storage_keeps_file_downloadable(
+        self, client: TestClient, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that a storage 503 comes before the claim, and a failure after it is final"""
+        from app.core.limiter import LimitExceeded
+
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        token = client.post("/api/v1/upload", files=files).json()["download_token"]
+
+        def saturated(*args, **kwargs):
+            raise LimitExceeded("storage")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(storage_service, "reserve", saturated)
+            assert client.get(f"/api/v1/download/{token}").status_code == 503
+
+        # Once the token is consumed, a failing fetch is not presented as retryable
+        with monkeypatch.context() as patch:
+            patch.setattr(storage_service, "download_buffer", saturated)
+            assert client.get(f"/api/v1/download/{token}").status_code == 500
+        assert client.get(f"/api/v1/download/{token}").status_code == 410
+
     def test_download_sets_content_disposition(
         self, client: TestClient, sample_file_content: bytes, sample_filename: str
     ):
@@ -149,6 +322,67 @@ class TestDownloadEndpoint:
         assert response2.status_code == 410
         assert "already been downloaded" in response2.json()["detail"]
 
+    def test_consumed_and_expired_tokens_get_410_with_filter_ready(
+        self, client: TestClient, db, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that the token filter keeps claimed and expired tokens (410, not 404)"""
+        from datetime import datetime, timedelta
+        from app.services.token_filter import token_filter
+
+        monkeypatch.setattr(token_filter, "_filter", None)
+        monkeypatch.setattr(token_filter, "ready", False)
+        token_filter.rebuild(db)
+        tokens = []
+        for _ in range(2):
+            files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+            upload = client.post("/api/v1/upload", files=files).json()
+            tokens.append((upload["download_token"], upload["file_id"]))
+
+        consumed, (expired, expired_id) = tokens[0][0], tokens[1]
+        assert client.get(f"/api/v1/download/{consumed}").status_code == 200
+        record = db.query(File).filter(File.id == expired_id).first()
+        record.expires_at = datetime.utcnow() - timedelta(minutes=1)
+        db.commit()
+
+        for _ in range(2):  # claimed in-process, then after a rebuild
+            assert client.get(f"/api/v1/download/{consumed}").status_code == 410
+            assert client.get(f"/api/v1/download/{expired}").status_code == 410
+            assert client.get(f"/api/v1/download/info/{expired}").status_code == 410
+            assert client.get("/api/v1/download/invalid-token-12345").status_code == 404
+            token_filter.rebuild(db)
+
+    def test_download_from_local_disk(
+        self, client: TestClient, monkeypatch, tmp_path, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test one-time download streamed from the local-disk backend"""
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        monkeypatch.setattr(settings, "STORAGE_TYPE", "local")
+        monkeypatch.setattr(settings, "LOCAL_STORAGE_PATH", str(tmp_path))
+        monkeypatch.setattr(storage_service, "_is_test_mode", lambda: False)
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        token = client.post("/api/v1/upload", files=files).json()["download_token"]
+        assert len(list(tmp_path.iterdir())) == 1
+
+        response = client.get(f"/api/v1/download/{token}")
+
+        assert response.content == sample_file_content
+        assert list(tmp_path.iterdir()) == []
+
+    def test_download_compressed_file(self, client: TestClient, db, monkeypatch):
+        """Test that compressible files are stored compressed and restored on download"""
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        content = b"line of a very repetitive log file\n" * 2000
+        files = {"file": ("app.log", io.BytesIO(content), "text/plain")}
+        upload_response = client.post("/api/v1/upload", files=files)
+        token = upload_response.json()["download_token"]
+
+        record = db.query(File).filter(File.id == upload_response.json()["file_id"]).first()
+        assert record.encryption_metadata["compression"] == "zstd"
+        assert len(storage_service.download_file(record.storage_key)) < len(content)
+
+        download_response = client.get(f"/api/v1/download/{token}")
+        assert download_response.content == content
+
     def test_download_invalid_token(self, client: TestClient):
         """Test download with invalid token returns 404"""
         response = client.get("/api/v1/download/invalid-token-12345")
@@ -157,6 +391,258 @@ class TestDownloadEndpoint:
         assert "not found" in response.json()["detail"].lower()
 
 
+class TestDedupStorage:
+    """Tests for deduplicated storage mode"""
+
+    def test_identical_uploads_share_one_blob(
+        self, client: TestClient, db, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that repeat content is stored once and deleted with the last reference"""
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", True)
+        tokens = []
+        for _ in range(2):
+            files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+            tokens.append(client.post("/api/v1/upload", files=files).json()["download_token"])
+
+        blob = db.query(Blob).one()
+        assert blob.ref_count == 2
+
+        assert client.get(f"/api/v1/download/{tokens[0]}").content == sample_file_content
+        assert storage_service.file_exists(blob.storage_key)
+
+        assert client.get(f"/api/v1/download/{tokens[1]}").content == sample_file_content
+        assert not storage_service.file_exists(blob.storage_key)
+        assert db.query(Blob).count() == 0
+
+    def test_batch_dedup_runs_off_event_loop(self, client: TestClient, db, monkeypatch):
+        """Test that batch blob acquisition runs in worker threads and shares repeats"""
+        import asyncio
+        from app.services.dedup import dedup_service
+
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", True)
+        acquire = dedup_service.acquire
+        on_loop = []
+
+        def tracked(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return acquire(*args, **kwargs)
+
+        monkeypatch.setattr(dedup_service, "acquire", tracked)
+        contents = [b"repeated content " * 50, b"repeated content " * 50, b"other content " * 50]
+        files = [
+            ("files", (f"file-{i}.txt", io.BytesIO(content), "text/plain"))
+            for i, content in enumerate(contents)
+        ]
+        response = client.post("/api/v1/upload/batch", files=files)
+
+        assert response.status_code == 201
+        assert on_loop == [False, False, False]
+        assert sorted(blob.ref_count for blob in db.query(Blob)) == [1, 2]
+        for item, content in zip(response.json()["files"], contents):
+            assert client.get(f"/api/v1/download/{item['download_token']}").content == content
+
+    def test_shared_inline_object_deleted_with_last_reference(
+        self, client: TestClient, db, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that a small shared blob lives inline until its last download"""
+        from app.models.inline_object import InlineObject
+
+        monkeypatch.setattr(settings, "DEDUP_ENABLED", True)
+        tokens = []
+        for _ in range(2):
+            files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+            tokens.append(client.post("/api/v1/upload", files=files).json()["download_token"])
+
+        assert db.query(Blob).one().ref_count == 2
+        assert db.query(InlineObject).count() == 1
+
+        assert client.get(f"/api/v1/download/{tokens[0]}").content == sample_file_content
+        db.expire_all()
+        assert db.query(InlineObject).count() == 1
+
+        assert client.get(f"/api/v1/download/{tokens[1]}").content == sample_file_content
+        db.expire_all()
+        assert db.query(InlineObject).count() == 0
+        assert db.query(Blob).count() == 0
+
+
+class TestInlineStorage:
+    """Tests for small ciphertexts stored in the database"""
+
+    def test_small_file_never_touches_object_store(
+        self, client: TestClient, db, monkeypatch, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that a small file is stored inline and deleted by the download claim"""
+        from app.models.inline_object import InlineObject
+
+        def unavailable(*args, **kwargs):
+            raise AssertionError("object store used for an inline file")
+
+        monkeypatch.setattr(storage_service, "upload_file", unavailable)
+        monkeypatch.setattr(storage_service, "download_buffer", unavailable)
+        monkeypatch.setattr(storage_service, "delete_file", unavailable)
+
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        upload = client.post("/api/v1/upload", files=files).json()
+        record = db.query(File).filter(File.id == upload["file_id"]).one()
+        assert record.encryption_metadata["storage"] == "inline"
+        assert db.get(InlineObject, record.storage_key) is not None
+
+        response = client.get(f"/api/v1/download/{upload['download_token']}")
+
+        assert response.status_code == 200
+        assert response.content == sample_file_content
+        db.expire_all()
+        assert db.get(InlineObject, record.storage_key) is None
+        assert client.get(f"/api/v1/download/{upload['download_token']}").status_code == 410
+
+    def test_large_file_goes_to_object_store(self, client: TestClient, db, monkeypatch):
+        """Test that ciphertexts above the threshold are not stored inline"""
+        import base64
+        import os
+        from app.models.inline_object import InlineObject
+
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 1)
+        content = base64.b64encode(os.urandom(3072))  # text, still > 1 KB compressed
+        files = {"file": ("data.txt", io.BytesIO(content), "text/plain")}
+        upload = client.post("/api/v1/upload", files=files).json()
+
+        record = db.query(File).filter(File.id == upload["file_id"]).one()
+        assert "storage" not in record.encryption_metadata
+        assert db.query(InlineObject).count() == 0
+        assert storage_service.file_exists(record.storage_key)
+        assert client.get(f"/api/v1/download/{upload['download_token']}").content == content
+
+
+class TestBatchUpload:
+    """Tests for batch upload endpoint"""
+
+    @staticmethod
+    def _files(count: int):
+        return [
+            ("files", (f"file-{i}.txt", io.BytesIO(f"content {i}".encode() * 50), "text/plain"))
+            for i in range(count)
+        ]
+
+    def test_batch_upload_returns_per_file_tokens(self, client: TestClient, db):
+        """Test that every file of a batch gets its own working token"""
+        response = client.post("/api/v1/upload/batch", files=self._files(3))
+
+        assert response.status_code == 201
+        data = response.json()
+        assert data["bundle"] is None
+        assert len(data["files"]) == 3
+        for i, item in enumerate(data["files"]):
+            download = client.get(f"/api/v1/download/{item['download_token']}")
+            assert download.content == f"content {i}".encode() * 50
+        assert db.query(AuditLog).filter(AuditLog.event_type == "upload").count() == 3
+
+    def test_batch_upload_audits_each_file_type(self, client: TestClient, db):
+        """Test that every audit row records its own file's detected type"""
+        files = [
+            ("files", ("doc.pdf", io.BytesIO(b"%PDF-1.4\n" + b"0" * 200), "application/pdf")),
+            ("files", ("notes.txt", io.BytesIO(b"plain text " * 50), "text/plain")),
+        ]
+        response = client.post("/api/v1/upload/batch", files=files)
+
+        assert response.status_code == 201
+        audited = {
+            row.event_metadata["filename"]: row.event_metadata["mime_type"]
+            for row in db.query(AuditLog).filter(AuditLog.event_type == "upload")
+        }
+        assert audited == {"doc.pdf": "application/pdf", "notes.txt": "text/plain"}
+
+    def test_batch_upload_bundle_token(self, client: TestClient, db):
+        """Test that bundle mode returns one token linking all files"""
+        from app.models.bundle import Bundle
+
+        response = client.post("/api/v1/upload/batch?bundle=true", files=self._files(2))
+
+        assert response.status_code == 201
+        data = response.json()
+        assert data["files"] == []
+        assert len(data["bundle"]["files"]) == 2
+        bundle = db.query(Bundle).one()
+        assert bundle.file_count == 2
+        assert db.query(File).filter(File.bundle_id == bundle.id).count() == 2
+
+    def test_bundle_download_streams_zip_once(self, client: TestClient, db):
+        """Test that a bundle downloads as one ZIP, then is gone"""
+        import zipfile
+
+        files = self._files(2) + [("files", ("file-0.txt", io.BytesIO(b"same name"), "text/plain"))]
+        token = client.post("/api/v1/upload/batch?bundle=true", files=files).json()["bundle"]["download_token"]
+
+        response = client.get(f"/api/v1/download/bundle/{token}?compression=deflate")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/zip"
+        archive = zipfile.ZipFile(io.BytesIO(response.content))
+        assert sorted(archive.namelist()) == ["file-0 (1).txt", "file-0.txt", "file-1.txt"]
+        assert archive.read("file-1.txt") == b"content 1" * 50
+        assert {archive.read("file-0.txt"), archive.read("file-0 (1).txt")} == {
+            b"content 0" * 50, b"same name"
+        }
+        for record in db.query(File).all():
+            assert record.downloaded_at is not None
+            assert not storage_service.file_exists(record.storage_key)
+
+        assert client.get(f"/api/v1/download/bundle/{token}").status_code == 410
+
+    def test_bundle_objects_deleted_when_client_leaves_before_body(
+        self, client: TestClient, db, monkeypatch
+    ):
+        """Test that claimed objects are deleted even if the archive never streams"""
+        import asyncio
+        from starlette.requests import Request
+        from app.api.v1.download import download_bundle
+
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        token = client.post(
+            "/api/v1/upload/batch?bundle=true", files=self._files(2)
+        ).json()["bundle"]["download_token"]
+        keys = [record.storage_key for record in db.query(File).all()]
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "client": ("127.0.0.1", 1)}
+
+        async def disconnect():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        async def claim_and_leave():
+            response = await download_bundle(token, Request(scope), "store", db)
+            assert all(storage_service.file_exists(key) for key in keys)
+            await response(scope, disconnect, send)
+
+        asyncio.run(claim_and_leave())
+
+        assert not any(storage_service.file_exists(key) for key in keys)
+
+    def test_batch_upload_too_many_files(self, client: TestClient, db, monkeypatch):
+        """Test that oversized batches are rejected before any storage"""
+        monkeypatch.setattr(settings, "BATCH_UPLOAD_MAX_FILES", 2)
+
+        response = client.post("/api/v1/upload/batch", files=self._files(3))
+
+        assert response.status_code == 413
+        assert db.query(File).count() == 0
+
+    def test_batch_upload_empty_file_rejects_batch(self, client: TestClient, db):
+        """Test that one invalid file rejects the whole batch"""
+        files = self._files(2) + [("files", ("empty.txt", io.BytesIO(b""), "text/plain"))]
+
+        response = client.post("/api/v1/upload/batch", files=files)
+
+        assert response.status_code == 400
+        assert db.query(File).count() == 0
+
+
 class TestInfoEndpoint:
     """Tests for file info endpoint"""
 
@@ -205,6 +691,126 @@ class TestInfoEndpoint:
 
         assert response.status_code == 404
 
+    def test_info_repeated_lookups_are_cached(
+        self, client: TestClient, db, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that repeated info lookups don't hit the database"""
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        upload_response = client.post("/api/v1/upload", files=files)
+        token = upload_response.json()["download_token"]
+
+        responses = [client.get(f"/api/v1/download/info/{token}") for _ in range(3)]
+
+        assert all(r.status_code == 200 for r in responses)
+        assert responses[0].json() == responses[2].json()
+        assert db.query(AuditLog).filter(AuditLog.event_type == "info_view").count() == 1
+
+    def test_info_cache_invalidated_on_download(
+        self, client: TestClient, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that a claimed file is no longer reported as available"""
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        upload_response = client.post("/api/v1/upload", files=files)
+        token = upload_response.json()["download_token"]
+
+        client.get(f"/api/v1/download/info/{token}")
+        client.get(f"/api/v1/download/{token}")
+        info_response = client.get(f"/api/v1/download/info/{token}")
+
+        assert info_response.status_code == 410
+
+    def test_lookup_racing_claim_not_cached_as_available(
+        self, client: TestClient, db, sample_file_content: bytes, sample_filename: str
+    ):
+        """Test that info read just before the claim can't be cached after it"""
+        from app.schemas.file import FileInfoResponse
+        from app.services.cache import info_cache
+
+        files = {"file": (sample_filename, io.BytesIO(sample_file_content), "text/plain")}
+        upload = client.post("/api/v1/upload", files=files).json()
+        record = db.query(File).filter(File.id == upload["file_id"]).one()
+        stale = FileInfoResponse(
+            filename=record.filename,
+            file_size=record.file_size,
+            mime_type=record.mime_type,
+            expires_at=record.expires_at,
+            uploaded_at=record.uploaded_at,
+            is_available=True,
+            antivirus_status=record.antivirus_status,
+        )
+
+        client.get(f"/api/v1/download/{upload['download_token']}")
+        # A lookup that read the row before the claim finishes afterwards
+        info_cache.set(record.token_hash, stale)
+
+        assert client.get(f"/api/v1/download/info/{upload['download_token']}").status_code == 410
+
+    @staticmethod
+    def _prefetched_upload(client: TestClient, db, monkeypatch):
+        """Upload a multi-segment file and wait for /info to prefetch its first segment"""
+        import base64
+        import os
+        import time
+        from app.services.prefetch import prefetch_cache
+
+        monkeypatch.setattr(settings, "PREFETCH_ENABLED", True)
+        monkeypatch.setattr(settings, "INLINE_STORAGE_MAX_KB", 0)
+        monkeypatch.setattr(prefetch_cache, "segments", 1)
+        # Several segments even after compression: the rest is fetched after the prefix
+        content = base64.b64encode(os.urandom(600 * 1024))
+        files = {"file": ("data.txt", io.BytesIO(content), "text/plain")}
+        upload = client.post("/api/v1/upload", files=files).json()
+        record = db.query(File).filter(File.id == upload["file_id"]).one()
+
+        client.get(f"/api/v1/download/info/{upload['download_token']}")
+        deadline = time.monotonic() + 5
+        while record.storage_key not in prefetch_cache._entries and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert not prefetch_cache._entries[record.storage_key].complete
+        return upload["download_token"], record.storage_key, content
+
+    def test_info_prefetches_ciphertext_for_download(self, client: TestClient, db, monkeypatch):
+        """Test that /info warms the leading segments and the download claim uses and evicts them"""
+        from app.services.prefetch import prefetch_cache
+
+        token, storage_key, content = self._prefetched_upload(client, db, monkeypatch)
+
+        def cold_fetch(*args, **kwargs):
+            raise AssertionError("full object fetched despite prefetch")
+
+        monkeypatch.setattr(storage_service, "download_buffer", cold_fetch)
+        response = client.get(f"/api/v1/download/{token}")
+
+        assert response.content == content
+        assert storage_key not in prefetch_cache._entries
+        assert not storage_service.file_exists(storage_key)
+
+    def test_prefetched_object_deleted_when_client_leaves_before_body(
+        self, client: TestClient, db, monkeypatch
+    ):
+        """Test that a claimed, prefetched object is deleted even if the body never streams"""
+        import asyncio
+        from starlette.requests import Request
+        from app.api.v1.download import download_file
+
+        token, storage_key, _ = self._prefetched_upload(client, db, monkeypatch)
+        scope = {"type": "http", "method": "GET", "path": "/", "headers": [], "client": ("127.0.0.1", 1)}
+
+        async def disconnect():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            pass
+
+        async def claim_and_leave():
+            response = await download_file(token, Request(scope), db)
+            assert storage_service.file_exists(storage_key)
+            await response(scope, disconnect, send)
+
+        asyncio.run(claim_and_leave())
+
+        assert not storage_service.file_exists(storage_key)
+
 
 class TestSecurityHeaders:
     """Tests for security headers"""
@@ -229,3 +835,122 @@ class TestSecurityHeaders:
         response = client.get("/health")
 
         assert response.headers["x-content-type-options"] == "nosniff"
+
+
+class TestProfilingMiddleware:
+    """Tests for on-demand request profiling"""
+
+    @pytest.fixture
+    def profiled_client(self, monkeypatch, tmp_path):
+        import time
+        from fastapi import FastAPI, Request
+        from app.core.timing import get_stage_timer
+        from app.middleware.profiling import ProfilingMiddleware
+
+        monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", "admin-secret")
+        monkeypatch.setattr(settings, "PROFILING_SAMPLE_RATE", 0.0)
+        monkeypatch.setattr(settings, "PROFILING_DIR", str(tmp_path))
+        monkeypatch.setattr(settings, "PROFILING_MAX_FILES", 2)
+
+        app = FastAPI()
+        app.add_middleware(ProfilingMiddleware)
+
+        @app.get("/work")
+        def work(request: Request):
+            with get_stage_timer(request).stage("encrypt"):
+                sum(range(100000))
+            return {"ok": True}
+
+        @app.get("/files/{token}")
+        def busy(token: str):
+            deadline = time.perf_counter() + 0.05
+            while time.perf_counter() < deadline:
+                pass
+            return {"ok": True}
+
+        return TestClient(app), tmp_path
+
+    def test_profile_written_on_admin_header(self, profiled_client):
+        """Test that the admin header writes a speedscope profile with stages"""
+        import json
+
+        client, directory = profiled_client
+        response = client.get("/work", headers={"X-Profile-Token": "admin-secret"})
+
+        profile_id = response.headers["x-profile-id"]
+        stages_file = next(directory.glob(f"{profile_id}-*.stages.json"))
+        stages = json.loads(stages_file.read_text())
+        assert stages["trigger"] == "header"
+        assert "encrypt" in stages["stages_ms"]
+        profile = json.loads(next(directory.glob(f"{profile_id}-*.speedscope.json")).read_text())
+        assert "speedscope" in profile["$schema"]
+
+    def test_profile_names_route_and_samples_pool_threads(self, profiled_client):
+        """Test that profiles omit path tokens and include work run in the threadpool"""
+        import json
+
+        client, directory = profiled_client
+        response = client.get("/files/secret-token", headers={"X-Profile-Token": "admin-secret"})
+
+        assert all("secret-token" not in path.name for path in directory.iterdir())
+        profile_id = response.headers["x-profile-id"]
+        stages = json.loads(next(directory.glob(f"{profile_id}-*.stages.json")).read_text())
+        assert stages["request"] == "GET /files/{token}"
+        profile = json.loads(next(directory.glob(f"{profile_id}-*.speedscope.json")).read_text())
+        assert "secret-token" not in json.dumps(profile)
+        assert "busy" in {frame["name"] for frame in profile["shared"]["frames"]}
+
+    def test_no_profile_without_valid_header(self, profiled_client):
+        """Test that requests are not profiled without a valid token"""
+        client, directory = profiled_client
+        response = client.get("/work", headers={"X-Profile-Token": "wrong"})
+
+        assert "x-profile-id" not in response.headers
+        assert list(directory.iterdir()) == []
+
+    def test_profile_ring_is_bounded(self, profiled_client):
+        """Test that only the most recent profiles are kept"""
+        client, directory = profiled_client
+        for _ in range(4):
+            client.get("/work", headers={"X-Profile-Token": "admin-secret"})
+
+        assert len(list(directory.glob("*.speedscope.json"))) == 2
+        assert len(list(directory.glob("*.stages.json"))) == 2
+
+    def test_pyinstrument_profiles_one_request_at_a_time(self, monkeypatch):
+        """Test that concurrent or failing pyinstrument profiles fall back to the sampler"""
+        import types
+        from app.middleware import profiling
+        from app.middleware.profiling import ProfilingMiddleware, StackSampler
+
+        class Profiler:
+            fail = False
+
+            def __init__(self, interval, async_mode):
+                pass
+
+            def start(self):
+                if Profiler.fail:
+                    raise RuntimeError("There is already a profiler running")
+
+            def stop(self):
+                pass
+
+        monkeypatch.setattr(profiling, "pyinstrument", types.SimpleNamespace(Profiler=Profiler))
+
+        first = ProfilingMiddleware._start()
+        second = ProfilingMiddleware._start()
+        assert isinstance(first, Profiler)
+        assert isinstance(second, StackSampler)
+        ProfilingMiddleware._stop(second)
+        ProfilingMiddleware._stop(first)
+
+        Profiler.fail = True
+        failed = ProfilingMiddleware._start()
+        assert isinstance(failed, StackSampler)
+        ProfilingMiddleware._stop(failed)
+
+        Profiler.fail = False
+        again = ProfilingMiddleware._start()
+        assert isinstance(again, Profiler)
+        ProfilingMiddleware._stop(again)
@@ -1,9 +1,44 @@
 """
 Unit Tests for Backend Services
 """
+import os
+import uuid
+from datetime import datetime, timedelta
+
 import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app.models.file import File
 from app.services.token_service import TokenService
 from app.services.encryption import EncryptionService
+from app.services.key_rotation import KeyRotationService
+from app.services.storage import StorageService
+from app.services.compression import compression_service
+from app.services.token_filter import CountingBloomFilter, TokenFilter
+from tests.conftest import TestingSessionLocal
+
+
+def _add_file(db, storage, ciphertext, metadata):
+    """Store an encrypted object and its files row"""
+    file_id = uuid.uuid4()
+    storage_key = f"{file_id}.enc"
+    storage.upload_file(storage_key, ciphertext)
+    db.add(
+        File(
+            id=file_id,
+            token_hash=TokenService.generate_token()[1],
+            filename="test.txt",
+            mime_type="text/plain",
+            file_size=10,
+            storage_key=storage_key,
+            encryption_metadata=metadata,
+            expires_at=datetime.utcnow() + timedelta(hours=1),
+            ip_hash="0" * 64,
+            antivirus_status="clean",
+        )
+    )
+    db.commit()
+    return file_id
 
 
 class TestTokenService:
@@ -146,6 +181,1024 @@ class TestEncryptionService:
 
         assert decrypted == data
 
+    def test_per_file_key_is_wrapped(self):
+        """Test that each file gets its own wrapped data key"""
+        service = EncryptionService()
+
+        _, metadata1 = service.encrypt_file(b"data")
+        _, metadata2 = service.encrypt_file(b"data")
+
+        assert "wrapped_key" in metadata1
+        assert metadata1["wrapped_key"] != metadata2["wrapped_key"]
+
+    def test_rewrap_key_keeps_payload_decryptable(self):
+        """Test that re-wrapping with a new KEK doesn't require re-encryption"""
+        keys = {"1": AESGCM.generate_key(bit_length=256), "2": AESGCM.generate_key(bit_length=256)}
+        service = EncryptionService(keys=keys, active_version="1")
+        ciphertext, metadata = service.encrypt_file(b"rotate me")
+
+        new_metadata = service.rewrap_key(metadata, "2")
+
+        assert new_metadata["key_version"] == "2"
+        assert new_metadata["iv"] == metadata["iv"]
+        assert service.decrypt_file(ciphertext, new_metadata) == b"rotate me"
+
+    def test_rewrap_legacy_format_fails(self):
+        """Test that legacy files (no wrapped DEK) need full re-encryption"""
+        service = EncryptionService()
+        iv = os.urandom(12)
+        ciphertext = service.aesgcm.encrypt(iv, b"legacy", None)
+        metadata = {"algorithm": "AES-256-GCM", "iv": iv.hex(), "key_version": "1"}
+
+        assert service.decrypt_file(ciphertext, metadata) == b"legacy"
+        assert service.needs_reencryption(metadata) is True
+        with pytest.raises(ValueError):
+            service.rewrap_key(metadata)
+
+    @pytest.mark.parametrize("suite", ["AES-256-GCM", "ChaCha20-Poly1305", "AES-256-GCM-SIV"])
+    def test_cipher_suites_roundtrip(self, suite):
+        """Test that every suite records its name and stays decryptable by any service"""
+        from app.services.cipher_suites import SUITES
+
+        if not SUITES[suite].available:
+            pytest.skip(f"{suite} not supported by this OpenSSL")
+        keys = {"1": AESGCM.generate_key(bit_length=256)}
+        service = EncryptionService(keys=keys, active_version="1", segment_size=16, suite=suite)
+        data = os.urandom(100)
+
+        ciphertext, metadata = service.encrypt_file(data)
+
+        assert metadata["algorithm"] == suite
+        other = EncryptionService(keys=keys, active_version="1", suite="AES-256-GCM")
+        assert other.decrypt_file(ciphertext, metadata) == data
+        chunks = [ciphertext[i:i + 7] for i in range(0, len(ciphertext), 7)]
+        assert b"".join(other.decrypt_stream(chunks, metadata)) == data
+
+    def test_select_suite_picks_fastest_allowed(self, monkeypatch):
+        """Test that the startup benchmark picks the fastest allowed suite"""
+        from app.core.config import settings
+        from app.services.cipher_suites import CipherSuite
+
+        speeds = {"AES-256-GCM": 1e9, "ChaCha20-Poly1305": 2e9, "AES-256-GCM-SIV": 5e9}
+        monkeypatch.setattr(CipherSuite, "benchmark", lambda suite, size: speeds[suite.name])
+        monkeypatch.setattr(settings, "ENCRYPTION_ALLOWED_SUITES", "AES-256-GCM,ChaCha20-Poly1305")
+        monkeypatch.setattr(settings, "ENCRYPTION_SUITE", "auto")
+        service = EncryptionService()
+        assert service.suite == "AES-256-GCM"  # first allowed until benchmarked
+
+        results = service.select_suite()
+
+        assert set(results) == {"AES-256-GCM", "ChaCha20-Poly1305"}
+        assert service.suite == "ChaCha20-Poly1305"
+        _, metadata = service.encrypt_file(b"data")
+        assert metadata["algorithm"] == "ChaCha20-Poly1305"
+
+        monkeypatch.setattr(settings, "ENCRYPTION_SUITE", "AES-256-GCM")
+        service = EncryptionService()
+        assert service.select_suite() == {}
+        assert service.suite == "AES-256-GCM"
+
+
+class TestKeyRotationService:
+    """Tests for KeyRotationService"""
+
+    def test_rotation_rewraps_and_reencrypts(self, db, tmp_path):
+        """Test that rotation moves wrapped and legacy files to the new version"""
+        keys = {"1": AESGCM.generate_key(bit_length=256), "2": AESGCM.generate_key(bit_length=256)}
+        old_service = EncryptionService(keys=keys, active_version="1")
+        new_service = EncryptionService(keys=keys, active_version="2")
+        storage = StorageService()
+
+        ciphertext, metadata = old_service.encrypt_file(b"wrapped file")
+        wrapped_id = _add_file(db, storage, ciphertext, metadata)
+
+        iv = os.urandom(12)
+        legacy_ciphertext = old_service.aesgcm.encrypt(iv, b"legacy file", None)
+        legacy_id = _add_file(
+            db, storage, legacy_ciphertext,
+            {"algorithm": "AES-256-GCM", "iv": iv.hex(), "key_version": "1"},
+        )
+
+        rotation = KeyRotationService(
+            session_factory=TestingSessionLocal,
+            encryption=new_service,
+            storage=storage,
+            batch_size=1,
+            checkpoint_path=str(tmp_path / "rotation.json"),
+            on_progress=lambda progress: None,
+        )
+        progress = rotation.run()
+
+        assert progress.rewrapped == 1
+        assert progress.reencrypted == 1
+        assert progress.failed == 0
+
+        db.expire_all()
+        for file_id, content in [(wrapped_id, b"wrapped file"), (legacy_id, b"legacy file")]:
+            record = db.query(File).filter(File.id == file_id).first()
+            assert record.encryption_metadata["key_version"] == "2"
+            stored = storage.download_file(record.storage_key)
+            assert new_service.decrypt_file(stored, record.encryption_metadata) == content
+
+    def test_rows_locked_by_downloads_are_retried(self, db, tmp_path, monkeypatch):
+        """Test that skipped (locked) files keep the run incomplete until rotated"""
+        from app.core.config import settings
+
+        keys = {"1": AESGCM.generate_key(bit_length=256), "2": AESGCM.generate_key(bit_length=256)}
+        old_service = EncryptionService(keys=keys, active_version="1")
+        new_service = EncryptionService(keys=keys, active_version="2")
+        storage = StorageService()
+
+        ciphertext, metadata = old_service.encrypt_file(b"wrapped file")
+        wrapped_id = _add_file(db, storage, ciphertext, metadata)
+        iv = os.urandom(12)
+        legacy_id = _add_file(
+            db, storage, old_service.aesgcm.encrypt(iv, b"legacy file", None),
+            {"algorithm": "AES-256-GCM", "iv": iv.hex(), "key_version": "1"},
+        )
+
+        monkeypatch.setattr(settings, "KEY_ROTATION_RETRY_PASSES", 2)
+        monkeypatch.setattr(settings, "KEY_ROTATION_RETRY_DELAY_SECONDS", 0)
+        rotation = KeyRotationService(
+            session_factory=TestingSessionLocal,
+            encryption=new_service,
+            storage=storage,
+            batch_size=1,
+            checkpoint_path=str(tmp_path / "rotation.json"),
+            on_progress=lambda progress: None,
+        )
+        held = {str(wrapped_id), str(legacy_id)}
+        lock = rotation._lock_rows
+        monkeypatch.setattr(
+            rotation, "_lock_rows",
+            lambda query: [row for row in lock(query) if str(row.id) not in held],
+        )
+
+        progress = rotation.run()
+        assert not progress.completed
+        assert sorted(progress.pending_ids) == sorted(held)
+        assert progress.rewrapped == progress.reencrypted == 0
+
+        held.clear()  # the downloads were abandoned
+        progress = rotation.run()
+        assert progress.completed
+        assert progress.pending_ids == []
+        assert (progress.rewrapped, progress.reencrypted) == (1, 1)
+        db.expire_all()
+        for file_id in (wrapped_id, legacy_id):
+            record = db.query(File).filter(File.id == file_id).first()
+            assert record.encryption_metadata["key_version"] == "2"
+
+
+    def test_failed_blob_rewrap_does_not_abort(self, db, tmp_path, monkeypatch):
+        """Test that a blob that can't be re-wrapped is counted as failed, not retried"""
+        from app.core.config import settings
+        from app.models.blob import Blob
+
+        keys = {"1": AESGCM.generate_key(bit_length=256), "2": AESGCM.generate_key(bit_length=256)}
+        old_service = EncryptionService(keys=keys, active_version="1")
+        new_service = EncryptionService(keys=keys, active_version="2")
+        blob_ids = []
+        for content in (b"broken blob", b"good blob"):
+            _, metadata = old_service.encrypt_file(content)
+            blob = Blob(
+                content_hash=os.urandom(32).hex(), storage_key=f"{uuid.uuid4()}.enc",
+                encryption_metadata=metadata, size=len(content), ref_count=1,
+            )
+            db.add(blob)
+            db.commit()
+            blob_ids.append(blob.id)
+        broken = db.get(Blob, blob_ids[0]).encryption_metadata
+
+        rewrap = new_service.rewrap_key
+        attempts = []
+
+        def flaky_rewrap(metadata, target_version):
+            if metadata == broken:
+                attempts.append(metadata)
+                raise ValueError("corrupt wrapped key")
+            return rewrap(metadata, target_version)
+
+        monkeypatch.setattr(new_service, "rewrap_key", flaky_rewrap)
+        monkeypatch.setattr(settings, "KEY_ROTATION_RETRY_PASSES", 2)
+        monkeypatch.setattr(settings, "KEY_ROTATION_RETRY_DELAY_SECONDS", 0)
+        rotation = KeyRotationService(
+            session_factory=TestingSessionLocal,
+            encryption=new_service,
+            storage=StorageService(),
+            batch_size=10,
+            checkpoint_path=str(tmp_path / "rotation.json"),
+            on_progress=lambda progress: None,
+        )
+
+        progress = rotation.run()
+        assert (progress.rewrapped, progress.failed) == (1, 1)
+        assert len(attempts) == 1
+        db.expire_all()
+        assert db.get(Blob, blob_ids[1]).encryption_metadata["key_version"] == "2"
+
+class TestTokenFilter:
+    """Tests for the counting Bloom filter token front"""
+
+    def test_bloom_filter_add_remove(self):
+        """Test membership after add and remove"""
+        bloom = CountingBloomFilter(capacity=1000, error_rate=0.001)
+        _, token_hash = TokenService.generate_token()
+
+        assert token_hash not in bloom
+        bloom.add(token_hash)
+        assert token_hash in bloom
+        bloom.remove(token_hash)
+        assert token_hash not in bloom
+
+    def test_bloom_filter_no_false_negatives(self):
+        """Test that every added hash is reported present"""
+        bloom = CountingBloomFilter(capacity=1000, error_rate=0.01)
+        hashes = [TokenService.generate_token()[1] for _ in range(1000)]
+        for token_hash in hashes:
+            bloom.add(token_hash)
+
+        assert all(token_hash in bloom for token_hash in hashes)
+
+    def test_filter_passes_everything_until_ready(self):
+        """Test that an unsynchronized filter never rejects tokens"""
+        token_filter = TokenFilter()
+
+        assert token_filter.might_contain(TokenService.hash_token("unknown")) is True
+
+    def test_rebuild_loads_live_files(self, db):
+        """Test rebuild from the files table"""
+        storage = StorageService()
+        file_id = _add_file(
+            db, storage, b"x", EncryptionService().encrypt_file(b"x")[1]
+        )
+        live_hash = db.query(File).filter(File.id == file_id).first().token_hash
+        token_filter = TokenFilter()
+
+        assert token_filter.rebuild(db) == 1
+        assert token_filter.might_contain(live_hash) is True
+        assert token_filter.might_contain(TokenService.hash_token("unknown")) is False
+
+
+    def test_failed_publish_makes_other_workers_rebuild(self, db, monkeypatch):
+        """Test that a share other workers never heard of is not answered 404 by them"""
+        published = []
+
+        class Client:
+            down = True
+
+            def publish(self, channel, message):
+                if self.down:
+                    raise ConnectionError("redis down")
+                published.append(message)
+
+        sender = TokenFilter()
+        monkeypatch.setattr(sender, "_is_test_mode", lambda: False)
+        sender._client = Client()
+        receiver = TokenFilter()
+        receiver.rebuild(db)
+
+        _, token_hash = TokenService.generate_token()
+        sender.add(token_hash)  # never reaches the receiver
+        assert sender._resync_pending is True
+
+        # Once Redis is back the sender asks for a rebuild, and the receiver
+        # stops trusting its filter
+        sender._client.down = False
+        sender._send_resync()
+        assert sender._resync_pending is False
+        assert receiver._receive(published[-1]) is False
+
+    def test_lost_event_detected(self, db):
+        """Test that a gap in a worker's event sequence asks for a rebuild"""
+        receiver = TokenFilter()
+        receiver.rebuild(db)
+        first, second, third = (TokenService.generate_token()[1] for _ in range(3))
+
+        assert receiver._receive(f"add:other:0:{first}") is True
+        assert receiver.might_contain(first) is True
+        assert receiver._receive(f"add:other:1:{second}") is True
+        assert receiver._receive(f"add:other:3:{third}") is False
+
+class TestDedupService:
+    """Tests for deduplicated blob acquisition"""
+
+    def test_lost_insert_race_keeps_caller_transaction(self, db):
+        """Test that a duplicate blob insert only rolls back its savepoint"""
+        from sqlalchemy import insert
+        from app.models.blob import Blob
+        from app.services.dedup import dedup_service
+
+        def store(data, storage_key):
+            return {"algorithm": "AES-256-GCM"}, len(data)
+
+        first = dedup_service.acquire(db, b"first", "", store)
+        first.ref_count += 1  # pending change of an earlier batch file
+        raced = []
+
+        def racing_store(data, storage_key):
+            if not raced:
+                # A concurrent upload inserts the same content meanwhile
+                raced.append(storage_key)
+                db.execute(insert(Blob).values(
+                    id=uuid.uuid4(), content_hash=dedup_service.content_hash(data),
+                    storage_key="other.enc", encryption_metadata={}, size=1, ref_count=1,
+                ))
+            return store(data, storage_key)
+
+        second = dedup_service.acquire(db, b"second", "", racing_store)
+        db.commit()
+
+        assert raced
+        assert db.query(Blob).filter(Blob.id == first.id).one().ref_count == 2
+        assert db.query(Blob).filter(Blob.id == second.id).one().ref_count == 1
+
+
+class TestCompressionService:
+    """Tests for the compression stage"""
+
+    def test_compressible_text_is_compressed(self):
+        """Test that compressible text is zstd-compressed and round-trips"""
+        data = b"2026-10-19 INFO request handled in 12ms\n" * 1000
+
+        payload, compression = compression_service.compress(data, "text/plain")
+
+        assert compression == "zstd"
+        assert len(payload) < len(data)
+        assert b"".join(compression_service.decompress_stream([payload], compression)) == data
+
+    def test_precompressed_mime_type_is_skipped(self):
+        """Test that already-compressed formats are stored as-is"""
+        data = b"\x89PNG" + b"\x00" * 4096
+
+        payload, compression = compression_service.compress(data, "image/png")
+
+        assert compression == "none"
+        assert payload == data
+
+    def test_high_entropy_data_is_skipped(self):
+        """Test that the entropy probe skips incompressible data"""
+        data = os.urandom(64 * 1024)
+
+        _, compression = compression_service.compress(data, "application/octet-stream")
+
+        assert compression == "none"
+
+
+class TestMimeSniffer:
+    """Tests for magic-byte MIME detection"""
+
+    @pytest.mark.parametrize("head, expected", [
+        (b"%PDF-1.7\n", "application/pdf"),
+        (b"\x89PNG\r\n\x1a\n" + bytes(8), "image/png"),
+        (b"\x7fELF\x02\x01", "application/x-executable"),
+        (b"#!/bin/sh\nrm -rf /", "text/x-shellscript"),
+        (b"  <!DOCTYPE html><html>", "text/html"),
+        (b"\xef\xbb\xbfcaf\xc3\xa9\n", "text/plain"),
+        (b"\x00\x01\x02\x03", "application/octet-stream"),
+        (bytes(257) + b"ustar\x00", "application/x-tar"),
+    ])
+    def test_detect(self, head, expected):
+        """Test detection from the first bytes"""
+        from app.services.mime_sniffer import mime_sniffer
+
+        assert mime_sniffer.detect(head) == expected
+
+    def test_text_cut_inside_multibyte_character(self):
+        """Test that a head ending mid-character is still text"""
+        from app.services.mime_sniffer import SNIFF_SIZE, mime_sniffer
+
+        data = ("é" * SNIFF_SIZE).encode()
+        assert mime_sniffer.detect(data[:SNIFF_SIZE - 1]) == "text/plain"
+
+    def test_declared_type_only_refines_containers(self):
+        """Test that a declared type is kept only within the detected container family"""
+        from app.services.mime_sniffer import mime_sniffer
+
+        docx = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        assert mime_sniffer.detect(b"PK\x03\x04", docx) == docx
+        assert mime_sniffer.detect(b"PK\x03\x04", "text/plain") == "application/zip"
+        assert mime_sniffer.detect(b"MZ\x90", "application/pdf") == "application/x-msdownload"
+
+    def test_allowlist(self, monkeypatch):
+        """Test the allowlist check"""
+        from app.core.config import settings
+        from app.services.mime_sniffer import mime_sniffer
+
+        monkeypatch.setattr(settings, "ALLOWED_MIME_TYPES", "application/pdf, Text/Plain")
+        assert mime_sniffer.is_allowed("text/plain")
+        assert not mime_sniffer.is_allowed("application/x-msdownload")
+
+
+class TestMultipartStream:
+    """Tests for the streaming multipart parser"""
+
+    BOUNDARY = "xYzBoundary"
+
+    def _body(self, parts) -> bytes:
+        body = b""
+        for name, filename, content in parts:
+            disposition = f'form-data; name="{name}"'
+            if filename is not None:
+                disposition += f'; filename="{filename}"'
+            body += (
+                f"--{self.BOUNDARY}\r\nContent-Disposition: {disposition}\r\n"
+                "Content-Type: text/plain\r\n\r\n"
+            ).encode() + content + b"\r\n"
+        return body + f"--{self.BOUNDARY}--\r\n".encode()
+
+    def _parse(self, body: bytes, chunk_size: int = 7, on_head=None, **limits):
+        import asyncio
+        from app.services.multipart_stream import MultipartStream
+
+        async def stream():
+            for i in range(0, len(body), chunk_size):
+                yield body[i:i + chunk_size]
+
+        parser = MultipartStream(
+            f"multipart/form-data; boundary={self.BOUNDARY}",
+            max_file_size=limits.get("max_file_size", 1024),
+            max_total_size=limits.get("max_total_size", 4096),
+            max_files=limits.get("max_files", 4),
+            max_fields=limits.get("max_fields", 4),
+            max_fields_size=limits.get("max_fields_size", 4096),
+        )
+        return asyncio.run(parser.parse(stream(), 16, on_head))
+
+    def test_parses_files_and_fields_across_chunks(self):
+        """Test that parts split over arbitrary chunk boundaries are reassembled"""
+        body = self._body([
+            ("files", "a.txt", b"first file " * 20),
+            ("note", None, b"hello"),
+            ("files", "b.txt", b"second"),
+        ])
+        heads = []
+
+        files, fields = self._parse(body, on_head=lambda part, head: heads.append(head))
+
+        assert [(f.filename, bytes(f.data)) for f in files] == [
+            ("a.txt", b"first file " * 20), ("b.txt", b"second"),
+        ]
+        assert fields == {"note": "hello"}
+        assert heads == [b"first file first", b"second"]
+
+    def test_head_rejection_stops_reading(self):
+        """Test that an exception from on_head stops reading the body"""
+        body = self._body([("file", "a.bin", bytes(512))])
+
+        def reject(part, head):
+            raise PermissionError("blocked")
+
+        with pytest.raises(PermissionError):
+            self._parse(body, chunk_size=64, on_head=reject)
+
+    def test_limits(self):
+        """Test per-file, total and file-count limits"""
+        from app.services.multipart_stream import PartTooLarge, TooManyFiles
+
+        with pytest.raises(PartTooLarge) as error:
+            self._parse(self._body([("file", "a", bytes(2000))]))
+        assert not error.value.total
+        with pytest.raises(PartTooLarge) as error:
+            self._parse(self._body([("f", str(i), bytes(1000)) for i in range(4)]),
+                        max_total_size=3000)
+        assert error.value.total
+        with pytest.raises(TooManyFiles):
+            self._parse(self._body([("f", str(i), b"x") for i in range(3)]), max_files=2)
+
+    def test_field_limits(self):
+        """Test that non-file form fields are bounded in count and combined size"""
+        from app.services.multipart_stream import FieldLimitExceeded
+
+        with pytest.raises(FieldLimitExceeded):
+            self._parse(self._body([(f"n{i}", None, b"x") for i in range(5)]))
+        with pytest.raises(FieldLimitExceeded):
+            self._parse(self._body([(f"n{i}", None, bytes(1500)) for i in range(3)]))
+        files, fields = self._parse(self._body([(f"n{i}", None, bytes(1000)) for i in range(4)]))
+        assert len(fields) == 4
+
+    def test_rejects_non_multipart(self):
+        """Test that a non-multipart content type is refused"""
+        from app.services.multipart_stream import MultipartError, MultipartStream
+
+        with pytest.raises(MultipartError):
+            MultipartStream("application/json", 1, 1)
+
+
+class TestAdmissionController:
+    """Tests for the per-worker memory budget"""
+
+    def test_waiters_granted_in_order_on_release(self):
+        """Test that queued requests run as budget frees up, in FIFO order"""
+        import asyncio
+        from app.core.admission import AdmissionController
+
+        controller = AdmissionController(budget_bytes=100, max_queue=10, max_wait=1.0)
+        order = []
+
+        async def run():
+            first = await controller.acquire(80)
+
+            async def waiter(name, size):
+                reservation = await controller.acquire(size)
+                order.append(name)
+                return reservation
+
+            tasks = [asyncio.create_task(waiter("a", 50)), asyncio.create_task(waiter("b", 10))]
+            await asyncio.sleep(0.01)
+            assert order == []  # "b" fits but must not overtake "a"
+            # Released from another thread, as streamed download bodies do
+            await asyncio.get_running_loop().run_in_executor(None, first.release)
+            for reservation in await asyncio.gather(*tasks):
+                reservation.release()
+
+        asyncio.run(run())
+        assert order == ["a", "b"]
+        assert controller.reserved == 0
+
+    def test_rejections(self):
+        """Test queue-full and timeout rejections, and release idempotence"""
+        import asyncio
+        from app.core.admission import AdmissionController, AdmissionRejected
+
+        controller = AdmissionController(budget_bytes=100, max_queue=1, max_wait=0.05)
+
+        async def run():
+            # Larger than the budget: clamped so it can run alone
+            held = await controller.acquire(10**9)
+            assert held.nbytes == 100
+
+            timed_out = asyncio.create_task(controller.acquire(10))
+            await asyncio.sleep(0)
+            with pytest.raises(AdmissionRejected) as error:
+                await controller.acquire(10)
+            assert error.value.reason == "queue_full"
+            with pytest.raises(AdmissionRejected) as error:
+                await timed_out
+            assert error.value.reason == "timeout"
+
+            held.release()
+            held.release()
+
+        asyncio.run(run())
+        assert controller.reserved == 0
+
+
+class TestSizeClassScheduler:
+    """Tests for size-class work pools"""
+
+    def test_classify(self):
+        """Test size classes, with unknown sizes treated as large"""
+        from app.core.scheduler import LARGE, SMALL, SizeClassScheduler
+
+        scheduler = SizeClassScheduler(small_max_bytes=1024, small_workers=1, large_workers=1)
+        assert scheduler.classify(1024) == SMALL
+        assert scheduler.classify(1025) == LARGE
+        assert scheduler.classify(None) == LARGE
+
+    def test_small_work_not_queued_behind_large(self):
+        """Test that a saturated large pool doesn't delay small-file work"""
+        import asyncio
+        import threading
+        import time
+        from app.core.scheduler import LARGE, SMALL, SizeClassScheduler
+
+        scheduler = SizeClassScheduler(small_max_bytes=1024, small_workers=1, large_workers=1)
+        release = threading.Event()
+
+        async def run():
+            large = [asyncio.create_task(scheduler.pool(LARGE).run(release.wait)) for _ in range(3)]
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            assert await scheduler.pool(SMALL).run(lambda x: x * 2, 21) == 42
+            elapsed = time.perf_counter() - start
+            release.set()
+            await asyncio.gather(*large)
+            return elapsed
+
+        try:
+            assert asyncio.run(run()) < 0.5
+        finally:
+            release.set()
+            scheduler.shutdown()
+
+
+class TestAdaptiveLimiter:
+    """Tests for AIMD concurrency limits"""
+
+    def _limiter(self, initial=10):
+        from app.core.limiter import AdaptiveLimiter
+
+        return AdaptiveLimiter("test", initial=initial, min_limit=2, max_limit=100)
+
+    def test_fails_fast_at_limit(self):
+        """Test that calls beyond the limit are rejected without waiting"""
+        from app.core.limiter import LimitExceeded
+
+        limiter = self._limiter(initial=2)
+        limiter.acquire()
+        limiter.acquire()
+        with pytest.raises(LimitExceeded):
+            limiter.acquire()
+        with pytest.raises(LimitExceeded):
+            limiter.check()
+        assert limiter.in_flight == 2
+
+    def test_additive_increase_and_multiplicative_decrease(self):
+        """Test that healthy calls grow the limit and failures cut it"""
+        limiter = self._limiter(initial=10)
+        for _ in range(20):
+            limiter.release(limiter.acquire())
+        assert 11 < limiter.limit < 13  # about +1 per limit's worth of calls
+
+        grown = limiter.limit
+        with pytest.raises(ConnectionError):
+            with limiter.limit_calls():
+                raise ConnectionError("refused")
+        assert limiter.limit == pytest.approx(grown * 0.7)
+
+        # Slow calls back off too (at most once per call duration)
+        limiter._last_decrease = 0.0
+        limiter.release(limiter.acquire() - 0.5)
+        assert limiter.limit == pytest.approx(grown * 0.7 * 0.7)
+        assert limiter.in_flight == 0
+
+    def test_large_transfers_are_not_congestion(self):
+        """Test that latency is compared per size unit"""
+        from app.core.limiter import SIZE_UNIT
+
+        limiter = self._limiter(initial=10)
+        limiter.release(limiter.acquire())
+        limiter.release(limiter.acquire() - 0.2, size=100 * SIZE_UNIT)
+        assert limiter.limit > 10
+
+    def test_database_statements_counted_not_rejected(self):
+        """Test the SQLAlchemy instrumentation measures statements without rejecting them"""
+        from sqlalchemy import create_engine, text
+
+        engine = create_engine("sqlite://")
+        limiter = self._limiter(initial=2)
+        limiter.instrument_sqlalchemy(engine)
+
+        with engine.connect() as conn:
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+            assert limiter.in_flight == 0
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing"))
+            assert limiter.in_flight == 0
+
+            # At the limit, a statement already under way (e.g. a download's
+            # commit after its claim) still runs
+            limiter.acquire()
+            limiter.acquire()
+            assert conn.execute(text("SELECT 1")).scalar() == 1
+            assert limiter.in_flight == 2
+
+    def test_database_sessions_limited(self, monkeypatch):
+        """Test that requests are refused a session while the database is at its limit"""
+        from app.core import database
+        from app.core.limiter import LimitExceeded
+
+        limiter = self._limiter(initial=2)
+        monkeypatch.setitem(database.limiters, "database", limiter)
+        limiter.acquire()
+        limiter.acquire()
+
+        sessions = database.get_db()
+        with pytest.raises(LimitExceeded):
+            next(sessions)
+
+    def test_storage_slot_reserved_ahead(self, monkeypatch):
+        """Test that a reserved storage slot is used by the download, or given back"""
+        import io
+        from app.core import limiter as limiter_module
+        from app.core.config import settings
+        from app.core.limiter import LimitExceeded
+
+        class Response(io.BytesIO):
+            headers = {"Content-Length": "4"}
+
+            def release_conn(self):
+                pass
+
+        class Client:
+            def get_object(self, bucket, name, offset=0):
+                return Response(b"data")
+
+        limiter = self._limiter(initial=2)
+        monkeypatch.setitem(limiter_module.limiters, "storage", limiter)
+        monkeypatch.setattr(settings, "STORAGE_TYPE", "minio")
+        storage = StorageService()
+        monkeypatch.setattr(storage, "_is_test_mode", lambda: False)
+        storage._client = Client()
+
+        first = storage.reserve()
+        second = storage.reserve()
+        with pytest.raises(LimitExceeded):
+            storage.reserve()
+
+        # A reserved call is not rejected at the limit, and frees its slot once done
+        with storage.download_buffer("a.enc", slot=first) as data:
+            assert bytes(data) == b"data"
+        first.release()
+        assert limiter.in_flight == 1
+
+        second.release()
+        second.release()
+        assert limiter.in_flight == 0
+
+    def test_storage_stream_open_limited(self, monkeypatch):
+        """Test that opening a MinIO stream takes a storage slot and fails fast at the limit"""
+        from app.core import limiter as limiter_module
+        from app.core.config import settings
+        from app.core.limiter import LimitExceeded
+
+        class Response:
+            def stream(self, chunk_size):
+                yield b"data"
+
+            def close(self):
+                pass
+
+            def release_conn(self):
+                pass
+
+        class Client:
+            calls = 0
+
+            def get_object(self, bucket, name, offset=0):
+                Client.calls += 1
+                return Response()
+
+        limiter = self._limiter(initial=2)
+        monkeypatch.setitem(limiter_module.limiters, "storage", limiter)
+        monkeypatch.setattr(settings, "STORAGE_TYPE", "minio")
+        storage = StorageService()
+        monkeypatch.setattr(storage, "_is_test_mode", lambda: False)
+        storage._client = Client()
+
+        assert b"".join(storage.download_stream("a.enc")) == b"data"
+        assert limiter.in_flight == 0
+
+        limiter.acquire()
+        limiter.acquire()
+        with pytest.raises(LimitExceeded):
+            next(storage.download_stream("a.enc"))
+        assert Client.calls == 1
+
+
+class TestCircuitBreaker:
+    """Tests for closed / open / half-open circuit breakers"""
+
+    def _breaker(self, reset_timeout=30.0):
+        from app.core.circuit_breaker import CircuitBreaker
+
+        return CircuitBreaker("test", failure_threshold=3, reset_timeout=reset_timeout, jitter=0.2)
+
+    def _fail(self, breaker):
+        with pytest.raises(ConnectionError):
+            with breaker.call():
+                raise ConnectionError("refused")
+
+    def test_opens_after_consecutive_failures(self):
+        """Test that the circuit opens at the threshold and refuses calls at once"""
+        import time
+        from app.core.circuit_breaker import OPEN, CircuitOpen
+
+        breaker = self._breaker()
+        self._fail(breaker)
+        self._fail(breaker)
+        with breaker.call():
+            pass  # a success resets the count
+        for _ in range(3):
+            self._fail(breaker)
+        assert breaker.state == OPEN
+        assert 24 <= breaker.opened_until - time.monotonic() <= 36  # jittered
+
+        called = []
+        with pytest.raises(CircuitOpen) as exc_info:
+            with breaker.call():
+                called.append(True)
+        assert not called
+        assert exc_info.value.retry_after >= 24
+        with pytest.raises(CircuitOpen):
+            breaker.check()
+
+    def test_half_open_single_probe(self):
+        """Test that one probe is let through after the timeout and decides the state"""
+        import time
+        from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitOpen
+
+        breaker = self._breaker()
+        for _ in range(3):
+            self._fail(breaker)
+        breaker.opened_until = time.monotonic()
+
+        breaker.check()  # a probe is due: no fail-fast
+        breaker.acquire()
+        assert breaker.state == HALF_OPEN
+        with pytest.raises(CircuitOpen):
+            breaker.acquire()  # only one probe at a time
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+        breaker.opened_until = time.monotonic()
+        with breaker.call():
+            pass
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+
+    def test_excluded_exceptions_are_neutral(self):
+        """Test that concurrency-limit rejections neither open the circuit nor hold the probe"""
+        from app.core.circuit_breaker import CLOSED
+        from app.core.limiter import LimitExceeded
+
+        breaker = self._breaker()
+        for _ in range(5):
+            with pytest.raises(LimitExceeded):
+                with breaker.call():
+                    raise LimitExceeded("test")
+        assert breaker.state == CLOSED
+        assert breaker.failures == 0
+
+    def test_antivirus_fail_policy(self, monkeypatch):
+        """Test that a dead clamd is skipped when failing open and rejected when failing closed"""
+        import time
+        from app.core.circuit_breaker import CircuitBreaker, CircuitOpen, DependencyUnavailable
+        from app.core.config import settings
+        from app.services import antivirus
+        from app.services.antivirus import antivirus_service
+
+        calls = []
+
+        def refused(data):
+            calls.append(data)
+            raise ConnectionRefusedError("clamd down")
+
+        breaker = CircuitBreaker("antivirus", failure_threshold=2, reset_timeout=30.0)
+        monkeypatch.setitem(antivirus.breakers, "antivirus", breaker)
+        monkeypatch.setattr(antivirus_service, "available", True)
+        monkeypatch.setattr(antivirus_service, "_instream", refused)
+
+        monkeypatch.setattr(settings, "CLAMAV_FAIL_POLICY", "open")
+        for _ in range(3):
+            is_clean, message = antivirus_service.scan_file(b"content")
+            assert is_clean
+        assert len(calls) == 2  # the third scan never reached clamd
+        assert "circuit open" in message
+
+        monkeypatch.setattr(settings, "CLAMAV_FAIL_POLICY", "closed")
+        with pytest.raises(CircuitOpen):
+            antivirus_service.scan_file(b"content")
+        breaker.opened_until = time.monotonic()
+        with pytest.raises(DependencyUnavailable):
+            antivirus_service.scan_file(b"content")
+        assert len(calls) == 3
+
+    def test_storage_stream_open_fails_fast_when_open(self, monkeypatch):
+        """Test that MinIO stream opens count as failures and are refused once the circuit opens"""
+        from app.core.circuit_breaker import CircuitBreaker, CircuitOpen
+        from app.core.config import settings
+        from app.services import storage as storage_module
+
+        calls = []
+
+        class Client:
+            def get_object(self, bucket, name, offset=0):
+                calls.append(name)
+                raise ConnectionRefusedError("minio down")
+
+        breaker = CircuitBreaker("storage", failure_threshold=2, reset_timeout=30.0)
+        monkeypatch.setitem(storage_module.breakers, "storage", breaker)
+        monkeypatch.setattr(settings, "STORAGE_TYPE", "minio")
+        storage = StorageService()
+        monkeypatch.setattr(storage, "_is_test_mode", lambda: False)
+        storage._client = Client()
+
+        for _ in range(2):
+            with pytest.raises(ConnectionRefusedError):
+                next(storage.download_stream("a.enc"))
+        with pytest.raises(CircuitOpen):
+            next(storage.download_stream("a.enc"))
+        assert len(calls) == 2
+
+    def test_antivirus_unreachable_fails_closed(self, monkeypatch):
+        """Test that an unreachable clamd rejects scans when failing closed"""
+        from app.core.circuit_breaker import DependencyUnavailable
+        from app.core.config import settings
+        from app.services.antivirus import antivirus_service
+
+        def refused():
+            raise ConnectionRefusedError("clamd down")
+
+        monkeypatch.setattr(settings, "ANTIVIRUS_ENABLED", True)
+        monkeypatch.setattr(settings, "CLAMAV_FAIL_POLICY", "closed")
+        monkeypatch.setattr(antivirus_service, "available", None)
+        monkeypatch.setattr(antivirus_service, "connect", refused)
+
+        with pytest.raises(DependencyUnavailable):
+            antivirus_service.scan_file(b"content")  # connect fails
+
+        antivirus_service.available = False  # a readiness probe failed
+        with pytest.raises(DependencyUnavailable):
+            antivirus_service.scan_file(b"content")
+
+        monkeypatch.setattr(settings, "CLAMAV_FAIL_POLICY", "open")
+        is_clean, message = antivirus_service.scan_file(b"content")
+        assert is_clean and "scan skipped" in message
+
+
+class TestServiceContainer:
+    """Tests for concurrent, bounded dependency initialization"""
+
+    def test_initialization_is_concurrent_and_bounded(self, monkeypatch):
+        """Test that a hung dependency neither blocks others nor exceeds the timeout"""
+        import asyncio
+        import time
+        from app.core.config import settings
+        from app.core.container import ServiceContainer
+
+        monkeypatch.setattr(settings, "READINESS_REQUIRED_DEPENDENCIES", "fast")
+        container = ServiceContainer()
+        container.register("fast", lambda: None)
+        container.register("slow", lambda: time.sleep(0.5))
+
+        def broken():
+            raise ConnectionError("refused")
+
+        container.register("broken", broken)
+
+        start = time.perf_counter()
+        asyncio.run(container.initialize(timeout=0.1))
+
+        assert time.perf_counter() - start < 0.45
+        status = container.status()["dependencies"]
+        assert status["fast"]["ready"] is True
+        assert "Timed out" in status["slow"]["error"]
+        assert status["broken"]["error"] == "refused"
+        assert container.ready  # only "fast" is required
+
+    def test_probe_updates_cached_health(self, monkeypatch):
+        """Test that re-probing records latency and tracks failures and recovery"""
+        import asyncio
+        from app.core.config import settings
+        from app.core.container import ServiceContainer
+
+        monkeypatch.setattr(settings, "READINESS_REQUIRED_DEPENDENCIES", "database")
+        container = ServiceContainer()
+        up = {"value": True}
+
+        def check():
+            if not up["value"]:
+                raise ConnectionError("refused")
+
+        container.register("database", check)
+        assert container.unavailable() == []  # not checked yet: not shed
+
+        asyncio.run(container.initialize())
+        init_ms = container.status()["dependencies"]["database"]["init_ms"]
+
+        up["value"] = False
+        asyncio.run(container.initialize())
+        status = container.status()["dependencies"]["database"]
+        assert container.unavailable() == ["database"]
+        assert not container.ready
+        assert status["latency_ms"] is not None and status["checked_at"] is not None
+        assert status["init_ms"] == init_ms  # startup time is kept
+
+        up["value"] = True
+        asyncio.run(container.initialize())
+        assert container.unavailable() == []
+        assert container.ready
+
+
+    def test_hung_check_not_restarted(self, monkeypatch):
+        """Test that checks run in the probe threads, one at a time per dependency"""
+        import asyncio
+        import threading
+        from app.core.container import ServiceContainer
+
+        container = ServiceContainer()
+        release = threading.Event()
+        threads = []
+
+        def hung():
+            threads.append(threading.current_thread().name)
+            release.wait(5)
+
+        container.register("storage", hung)
+
+        asyncio.run(container.initialize(timeout=0.05))
+        asyncio.run(container.initialize(timeout=0.05))
+        status = container.status()["dependencies"]["storage"]
+        assert status["error"] == "Previous check still running"
+        assert len(threads) == 1 and threads[0].startswith("probe")
+
+        release.set()
+        container.dependencies["storage"].probe.result(timeout=5)
+        asyncio.run(container.initialize(timeout=1.0))
+        assert container.dependencies["storage"].ready
+        assert len(threads) == 2
 
 class TestAntivirusService:
     """Tests for AntivirusService (mocked)"""
@@ -170,3 +1223,335 @@ class TestAntivirusService:
 
         # With ANTIVIRUS_ENABLED=false, should return clean
         assert is_clean is True
+
+
+class TestTracer:
+    """Tests for span recording, sampling and export"""
+
+    class ListExporter:
+        def __init__(self):
+            self.spans = []
+
+        def export(self, spans):
+            self.spans.extend(spans)
+
+        def shutdown(self):
+            pass
+
+    @pytest.fixture
+    def traced(self, monkeypatch):
+        from app.core.tracing import BatchSpanProcessor, tracer
+
+        exporter = self.ListExporter()
+        monkeypatch.setattr(tracer, "processor", BatchSpanProcessor(exporter))
+        monkeypatch.setattr(tracer, "sample_rate", 1.0)
+        return tracer, exporter
+
+    def test_service_calls_are_child_spans(self, traced):
+        """Test that instrumented service calls nest under the request span"""
+        tracer, exporter = traced
+        service = EncryptionService(keys={"1": AESGCM.generate_key(bit_length=256)}, active_version="1")
+
+        with tracer.start_trace("POST /api/v1/upload") as root:
+            service.encrypt_file(b"data")
+        tracer.processor.flush()
+
+        spans = {span.name: span for span in exporter.spans}
+        assert spans["encryption.encrypt"].parent_id == root.span_id
+        assert spans["encryption.encrypt"].trace_id == root.trace_id
+
+    def test_incoming_traceparent_is_continued(self, traced, monkeypatch):
+        """Test that a trusted caller's trace id and sampling decision are honoured"""
+        tracer, exporter = traced
+        monkeypatch.setattr(tracer, "trust_incoming_sampling", True)
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        with tracer.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-01") as span:
+            pass
+        with tracer.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-00") as unsampled:
+            pass
+
+        assert (span.trace_id, span.parent_id) == (trace_id, parent_id)
+        assert unsampled.sampled is False
+
+    def test_untrusted_sampled_flag_is_ignored(self, traced, monkeypatch):
+        """Test that clients can't force tracing with a sampled traceparent"""
+        tracer, exporter = traced
+        trace_id, parent_id = "4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7"
+
+        monkeypatch.setattr(tracer, "sample_rate", 0.0)
+        with tracer.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-01") as forced:
+            pass
+        monkeypatch.setattr(tracer, "sample_rate", 1.0)
+        with tracer.start_trace("GET /", traceparent=f"00-{trace_id}-{parent_id}-00") as span:
+            pass
+
+        assert forced.sampled is False
+        assert (span.trace_id, span.parent_id) == (trace_id, parent_id)
+
+    def test_request_span_omits_path_parameters(self, traced):
+        """Test that request spans name the route template, not the token-bearing path"""
+        from fastapi import FastAPI
+        from fastapi.testclient import TestClient
+        from app.middleware.tracing import TracingMiddleware
+
+        tracer, exporter = traced
+        app = FastAPI()
+        app.add_middleware(TracingMiddleware)
+
+        @app.get("/download/{token}")
+        def download(token: str):
+            return {}
+
+        TestClient(app).get("/download/secret-token")
+        tracer.processor.flush()
+
+        [span] = exporter.spans
+        assert span.name == "GET /download/{token}"
+        assert "secret-token" not in repr(span.attributes)
+
+    def test_unsampled_traces_record_nothing(self, traced, monkeypatch):
+        """Test that a zero sample rate produces no spans"""
+        tracer, exporter = traced
+        monkeypatch.setattr(tracer, "sample_rate", 0.0)
+
+        with tracer.start_trace("GET /"):
+            with tracer.span("child") as child:
+                assert child.sampled is False
+        tracer.processor.flush()
+
+        assert exporter.spans == []
+
+    def test_jsonl_exporter(self, tmp_path):
+        """Test that spans are written one JSON object per line"""
+        import json
+        from app.core.tracing import JsonLinesExporter, Span
+
+        path = tmp_path / "traces.jsonl"
+        span = Span("a" * 32, None, "root")
+        JsonLinesExporter(str(path)).export([span, span])
+
+        lines = path.read_text().splitlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0])["name"] == "root"
+
+
+class TestSegmentedEncryption:
+    """Tests for the segmented (streamable) encryption format"""
+
+    @pytest.fixture
+    def service(self):
+        return EncryptionService(
+            keys={"1": AESGCM.generate_key(bit_length=256)}, active_version="1", segment_size=16
+        )
+
+    @pytest.mark.parametrize("size", [0, 15, 16, 17, 48, 100])
+    def test_stream_roundtrip(self, service, size):
+        """Test streaming decryption across segment boundaries and chunk sizes"""
+        data = os.urandom(size)
+        ciphertext, metadata = service.encrypt_file(data)
+
+        chunks = [ciphertext[i:i + 7] for i in range(0, len(ciphertext), 7)]
+        assert b"".join(service.decrypt_stream(chunks, metadata)) == data
+        assert service.decrypt_file(ciphertext, metadata) == data
+
+    def test_truncation_detected(self, service):
+        """Test that dropping the final segment fails authentication"""
+        from cryptography.exceptions import InvalidTag
+
+        ciphertext, metadata = service.encrypt_file(b"a" * 48)
+
+        with pytest.raises(InvalidTag):
+            service.decrypt_file(ciphertext[:32], metadata)
+
+    def test_reordering_detected(self, service):
+        """Test that swapped segments fail authentication"""
+        from cryptography.exceptions import InvalidTag
+
+        ciphertext, metadata = service.encrypt_file(b"a" * 16 + b"b" * 16 + b"c" * 16)
+        swapped = ciphertext[32:64] + ciphertext[:32] + ciphertext[64:]
+
+        with pytest.raises(InvalidTag):
+            service.decrypt_file(swapped, metadata)
+
+    @pytest.mark.parametrize("size", [0, 100, 16 * 30 + 5])
+    def test_parallel_matches_serial_format(self, size):
+        """Test that segments sealed in parallel decrypt serially and vice versa"""
+        keys = {"1": AESGCM.generate_key(bit_length=256)}
+        parallel = EncryptionService(keys=keys, active_version="1", segment_size=16, parallelism=4)
+        serial = EncryptionService(keys=keys, active_version="1", segment_size=16, parallelism=1)
+        data = os.urandom(size)
+
+        ciphertext, metadata = parallel.encrypt_file(data)
+        assert serial.decrypt_file(ciphertext, metadata) == data
+        chunks = [ciphertext[i:i + 7] for i in range(0, len(ciphertext), 7)]
+        assert b"".join(serial.decrypt_stream(chunks, metadata)) == data
+
+        ciphertext, metadata = serial.encrypt_file(data)
+        assert parallel.decrypt_file(ciphertext, metadata) == data
+        parallel.shutdown()
+
+    def test_parallel_tampering_detected(self):
+        """Test that a modified segment in any parallel run fails decryption"""
+        from cryptography.exceptions import InvalidTag
+
+        service = EncryptionService(
+            keys={"1": AESGCM.generate_key(bit_length=256)},
+            active_version="1",
+            segment_size=16,
+            parallelism=4,
+        )
+        ciphertext, metadata = service.encrypt_file(os.urandom(16 * 32))
+        tampered = bytearray(ciphertext)
+        tampered[-40] ^= 1  # in the last run, handled by a pool thread
+
+        with pytest.raises(InvalidTag):
+            service.decrypt_file(bytes(tampered), metadata)
+        service.shutdown()
+
+
+class TestLocalStorage:
+    """Tests for the local-disk storage backend and direct file decryption"""
+
+    @pytest.fixture
+    def storage(self, monkeypatch, tmp_path):
+        from app.core.config import settings
+
+        monkeypatch.setattr(settings, "STORAGE_TYPE", "local")
+        monkeypatch.setattr(settings, "LOCAL_STORAGE_PATH", str(tmp_path))
+        storage = StorageService()
+        monkeypatch.setattr(storage, "_is_test_mode", lambda: False)
+        return storage
+
+    def test_local_roundtrip(self, storage):
+        """Test upload, download, stream and delete on local disk"""
+        assert storage.upload_file("a.enc", b"x" * 1000)
+
+        assert storage.download_file("a.enc") == b"x" * 1000
+        assert b"".join(storage.download_stream("a.enc", chunk_size=64)) == b"x" * 1000
+        assert storage.delete_file("a.enc")
+        assert not storage.file_exists("a.enc")
+
+    def test_rejects_path_traversal(self, storage):
+        """Test that object names cannot escape the storage directory"""
+        with pytest.raises(ValueError):
+            storage.download_file("../etc/passwd")
+
+    @pytest.mark.parametrize("size", [0, 16, 50])
+    def test_decrypt_fileobj(self, storage, size):
+        """Test readinto-based decryption of a file opened on local disk"""
+        service = EncryptionService(
+            keys={"1": AESGCM.generate_key(bit_length=256)}, active_version="1", segment_size=16
+        )
+        data = os.urandom(size)
+        ciphertext, metadata = service.encrypt_file(data)
+        storage.upload_file("b.enc", ciphertext)
+
+        with storage.open_local("b.enc") as f:
+            storage.delete_file("b.enc")  # Still readable once opened
+            assert b"".join(service.decrypt_fileobj(f, metadata)) == data
+
+
+class TestBufferPool:
+    """Tests for the shared buffer pool and buffer-based crypto APIs"""
+
+    def test_buffers_are_reused(self):
+        """Test that a released buffer is handed out again"""
+        from app.core.buffer_pool import BufferPool
+
+        pool = BufferPool(max_bytes=1024 * 1024, min_size=1024)
+        with pool.acquire(1000) as first:
+            assert len(first) == 1000
+            first_buffer = first.obj
+        with pool.acquire(900) as second:
+            assert second.obj is first_buffer
+
+    def test_pool_size_is_bounded(self):
+        """Test that idle buffers beyond max_bytes are dropped"""
+        from app.core.buffer_pool import BufferPool
+
+        pool = BufferPool(max_bytes=1024, min_size=1024)
+        with pool.acquire(1024), pool.acquire(1024):
+            pass
+
+        assert pool.pooled_bytes == 1024
+
+    def test_encrypt_into_decrypt_into_roundtrip(self):
+        """Test encryption and decryption into caller-provided buffers"""
+        service = EncryptionService(
+            keys={"1": AESGCM.generate_key(bit_length=256)}, active_version="1", segment_size=16
+        )
+        data = os.urandom(40)
+        ciphertext = bytearray(service.ciphertext_size(len(data)))
+        metadata = service.encrypt_into(data, memoryview(ciphertext))
+
+        plaintext = bytearray(64)
+        written = service.decrypt_into(ciphertext, metadata, memoryview(plaintext))
+
+        assert plaintext[:written] == data
+        assert service.decrypt_file(bytes(ciphertext), metadata) == data
+        with pytest.raises(ValueError):
+            service.encrypt_into(data, memoryview(bytearray(10)))
+
+
+class TestZipStream:
+    """Tests for on-the-fly ZIP archives"""
+
+    @pytest.mark.parametrize("compression", ["store", "deflate"])
+    def test_stream_zip_roundtrip(self, compression):
+        """Test that streamed archives are readable ZIP files"""
+        import io
+        import zipfile
+        from app.services.zip_stream import stream_zip
+
+        members = [
+            ("a.txt", 5, datetime(2026, 1, 1), [b"he", b"llo"]),
+            ("b.bin", 3, datetime(2026, 1, 1), iter([b"\x00\x01\x02"])),
+        ]
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(stream_zip(members, compression))))
+
+        assert archive.read("a.txt") == b"hello"
+        assert archive.read("b.bin") == b"\x00\x01\x02"
+
+
+class TestPrefetchCache:
+    """Tests for the speculative ciphertext prefetch cache"""
+
+    @pytest.fixture
+    def cache(self, monkeypatch):
+        from app.services import prefetch
+        from app.services.prefetch import PrefetchCache
+
+        objects = {"a.enc": b"a" * 100, "b.enc": b"b" * 100, "c.enc": b"c" * 10}
+        monkeypatch.setattr(
+            prefetch.storage_service,
+            "download_range",
+            lambda key, offset, length: objects[key][offset:offset + length],
+        )
+        return PrefetchCache(max_bytes=200, ttl=30.0, segments=1, workers=1)
+
+    def test_lru_and_ttl(self, cache):
+        """Test that the cache stays within its byte budget and drops expired entries"""
+        cache._fetch("a.enc", 100)
+        cache._fetch("b.enc", 100)
+        cache._fetch("c.enc", 100)
+
+        assert cache.size <= 200
+        assert cache.pop("a.enc") is None  # least recently used, evicted
+        entry = cache.pop("c.enc")
+        assert entry.data == b"c" * 10 and entry.complete
+
+        cache.ttl = -1.0
+        cache._fetch("a.enc", 50)
+        assert cache.pop("a.enc") is None
+        assert cache.pop("b.enc").complete is False
+
+    def test_claim_during_fetch_discards_result(self, cache):
+        """Test that a fetch finishing after the download claim caches nothing"""
+        cache._inflight.add("a.enc")
+        assert cache.pop("a.enc") is None
+
+        cache._fetch("a.enc", 100)
+
+        assert "a.enc" not in cache._entries
+        assert not cache._claimed and not cache._inflight